@@ -0,0 +1,242 @@
+import os
+import sys
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+
+log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=getattr(logging, log_level))
+
+# Header of the NFLsavant pbp-<year>.csv files the API ingests
+COLUMNS = [
+    'GameId', 'GameDate', 'Quarter', 'Minute', 'Second', 'OffenseTeam', 'DefenseTeam', 'Down',
+    'ToGo', 'YardLine', 'Unnamed: 10', 'SeriesFirstDown', 'Unnamed: 12', 'NextScore',
+    'Description', 'TeamWin', 'Unnamed: 16', 'Unnamed: 17', 'SeasonYear', 'Yards', 'Formation',
+    'PlayType', 'IsRush', 'IsPass', 'IsIncomplete', 'IsTouchdown', 'PassType', 'IsSack',
+    'IsChallenge', 'IsChallengeReversed', 'Challenger', 'IsMeasurement', 'IsInterception',
+    'IsFumble', 'IsPenalty', 'IsTwoPointConversion', 'IsTwoPointConversionSuccessful',
+    'RushDirection', 'YardLineFixed', 'YardLineDirection', 'IsPenaltyAccepted', 'PenaltyTeam',
+    'IsNoPlay', 'PenaltyType', 'PenaltyYards'
+]
+
+PLAYS_PER_SEASON = 46000  # roughly one regular season plus playoffs
+GAMES_PER_SEASON = 285
+LAST_SEASON = 2024
+SEED = 2024
+
+TEAMS = ['ARI', 'ATL', 'BAL', 'BUF', 'CAR', 'CHI', 'CIN', 'CLE', 'DAL', 'DEN', 'DET', 'GB',
+         'HOU', 'IND', 'JAX', 'KC', 'LA', 'LAC', 'LV', 'MIA', 'MIN', 'NE', 'NO', 'NYG', 'NYJ',
+         'PHI', 'PIT', 'SEA', 'SF', 'TB', 'TEN', 'WAS']
+
+# (value, weight) pairs, close to the mix in a real season
+PLAY_TYPES = [("PASS", 38), ("RUSH", 29), ("KICK OFF", 6), ("PUNT", 5), ("EXTRA POINT", 3),
+              ("FIELD GOAL", 2), ("NO PLAY", 6), ("SACK", 2), ("TIMEOUT", 5), ("QB KNEEL", 1),
+              ("", 3)]
+FORMATIONS = {
+    "PASS": [("SHOTGUN", 70), ("UNDER CENTER", 15), ("NO HUDDLE SHOTGUN", 13), ("NO HUDDLE", 2)],
+    "RUSH": [("SHOTGUN", 40), ("UNDER CENTER", 50), ("NO HUDDLE SHOTGUN", 7), ("NO HUDDLE", 3)],
+    "PUNT": [("PUNT", 1)],
+    "FIELD GOAL": [("FIELD GOAL", 1)],
+    "EXTRA POINT": [("FIELD GOAL", 1)],
+}
+OTHER_FORMATIONS = [("UNDER CENTER", 50), ("SHOTGUN", 40), ("", 10)]
+PASS_TYPES = [("SHORT RIGHT", 25), ("SHORT LEFT", 24), ("SHORT MIDDLE", 20), ("DEEP RIGHT", 10),
+              ("DEEP LEFT", 10), ("DEEP MIDDLE", 5), ("", 6)]
+RUSH_DIRECTIONS = [("LEFT END", 12), ("LEFT TACKLE", 11), ("LEFT GUARD", 13), ("CENTER", 14),
+                   ("RIGHT GUARD", 13), ("RIGHT TACKLE", 11), ("RIGHT END", 12), ("", 14)]
+PENALTY_TYPES = ["OFFENSIVE HOLDING", "FALSE START", "DEFENSIVE PASS INTERFERENCE",
+                 "DEFENSIVE HOLDING", "UNNECESSARY ROUGHNESS", "ROUGHING THE PASSER"]
+INJURY_RATE = 0.012  # share of plays whose description mentions an injury
+
+
+def _choice(rng, options, size):
+    """
+    Draw `size` values from weighted (value, weight) options.
+
+    Args:
+        rng (Generator): The random generator.
+        options (list): (value, weight) pairs.
+        size (int): How many values to draw.
+
+    Returns:
+        ndarray: The drawn values.
+    """
+    values = np.array([value for value, _ in options], dtype=object)
+    weights = np.array([weight for _, weight in options], dtype=float)
+    return rng.choice(values, size=size, p=weights / weights.sum())
+
+
+def _game_dates(season):
+    """
+    Return the game days of a season: Thursdays, Sundays and Mondays from the
+    first Thursday of September through the first week of February.
+
+    Args:
+        season (int): The season year.
+
+    Returns:
+        list: The season's game days, in order.
+    """
+    day = date(season, 9, 1)
+    while day.weekday() != 3:
+        day += timedelta(days=1)
+    days = []
+    while day <= date(season + 1, 2, 10):
+        if day.weekday() in (0, 3, 6):
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def season_frame(season, plays=PLAYS_PER_SEASON, seed=SEED):
+    """
+    Generate one season of synthetic plays. The same season, size and seed
+    always produce the same rows.
+
+    Args:
+        season (int): The season year.
+        plays (int, optional): Plays in the season.
+        seed (int, optional): Base random seed.
+
+    Returns:
+        DataFrame: One row per play, with the columns of a real pbp CSV.
+    """
+    rng = np.random.default_rng([seed, season])
+    days = _game_dates(season)
+
+    # Spread games over the season (most on Sundays), plays evenly over games
+    game_days = np.sort(rng.integers(0, len(days), GAMES_PER_SEASON))
+    game = np.sort(rng.integers(0, GAMES_PER_SEASON, plays))
+    game_date = np.array([days[d] for d in game_days], dtype=object)[game]
+    game_id = np.array([int(days[d].strftime("%Y%m%d")) * 100 + i % 16 for i, d in enumerate(game_days)])[game]
+    home = rng.integers(0, len(TEAMS), GAMES_PER_SEASON)
+    away = (home + rng.integers(1, len(TEAMS), GAMES_PER_SEASON)) % len(TEAMS)
+    teams = np.array(TEAMS, dtype=object)
+    offense_is_home = rng.random(plays) < 0.5
+    offense = np.where(offense_is_home, teams[home[game]], teams[away[game]])
+    defense = np.where(offense_is_home, teams[away[game]], teams[home[game]])
+
+    play_type = _choice(rng, PLAY_TYPES, plays)
+    is_pass = play_type == "PASS"
+    is_rush = play_type == "RUSH"
+
+    formation = _choice(rng, OTHER_FORMATIONS, plays)
+    for kind, options in FORMATIONS.items():
+        mask = play_type == kind
+        formation[mask] = _choice(rng, options, mask.sum())
+
+    pass_type = np.full(plays, "", dtype=object)
+    pass_type[is_pass] = _choice(rng, PASS_TYPES, is_pass.sum())
+    rush_direction = np.full(plays, "", dtype=object)
+    rush_direction[is_rush] = _choice(rng, RUSH_DIRECTIONS, is_rush.sum())
+
+    quarter = rng.integers(1, 5, plays)
+    minute = rng.integers(0, 15, plays)
+    second = rng.integers(0, 60, plays)
+    yards = np.where(is_pass | is_rush, rng.normal(5, 8, plays).round().astype(int), 0)
+    yard_line = rng.integers(1, 100, plays)
+    is_touchdown = ((is_pass | is_rush) & (rng.random(plays) < 0.035)).astype(int)
+    is_penalty = (rng.random(plays) < 0.07).astype(int)
+    injured = rng.random(plays) < INJURY_RATE
+
+    description = np.array([
+        f"({m}:{s:02d}) {o} {t.lower() or 'play'} {d}{p} for {y} yards."
+        for m, s, o, t, d, p, y in zip(minute, second, offense, play_type, rush_direction, pass_type, yards)
+    ], dtype=object)
+    description[injured] = description[injured] + " PLAYER INJURED ON THE PLAY."
+
+    empty = np.full(plays, "", dtype=object)
+    zeros = np.zeros(plays, dtype=int)
+    return pd.DataFrame({
+        'GameId': game_id,
+        'GameDate': [d.isoformat() for d in game_date],
+        'Quarter': quarter,
+        'Minute': minute,
+        'Second': second,
+        'OffenseTeam': offense,
+        'DefenseTeam': defense,
+        'Down': rng.integers(0, 5, plays),
+        'ToGo': rng.integers(1, 21, plays),
+        'YardLine': yard_line,
+        'Unnamed: 10': empty,
+        'SeriesFirstDown': (rng.random(plays) < 0.3).astype(int),
+        'Unnamed: 12': empty,
+        'NextScore': zeros,
+        'Description': description,
+        'TeamWin': zeros,
+        'Unnamed: 16': empty,
+        'Unnamed: 17': empty,
+        'SeasonYear': season,
+        'Yards': yards,
+        'Formation': formation,
+        'PlayType': play_type,
+        'IsRush': is_rush.astype(int),
+        'IsPass': is_pass.astype(int),
+        'IsIncomplete': (is_pass & (rng.random(plays) < 0.35)).astype(int),
+        'IsTouchdown': is_touchdown,
+        'PassType': pass_type,
+        'IsSack': (play_type == "SACK").astype(int),
+        'IsChallenge': zeros,
+        'IsChallengeReversed': zeros,
+        'Challenger': empty,
+        'IsMeasurement': zeros,
+        'IsInterception': (is_pass & (rng.random(plays) < 0.02)).astype(int),
+        'IsFumble': ((is_pass | is_rush) & (rng.random(plays) < 0.01)).astype(int),
+        'IsPenalty': is_penalty,
+        'IsTwoPointConversion': zeros,
+        'IsTwoPointConversionSuccessful': zeros,
+        'RushDirection': rush_direction,
+        'YardLineFixed': np.where(yard_line > 50, 100 - yard_line, yard_line),
+        'YardLineDirection': np.where(yard_line > 50, "OPP", "OWN"),
+        'IsPenaltyAccepted': is_penalty,
+        'PenaltyTeam': np.where(is_penalty == 1, defense, ""),
+        'IsNoPlay': (play_type == "NO PLAY").astype(int),
+        'PenaltyType': np.where(is_penalty == 1, _choice(rng, [(t, 1) for t in PENALTY_TYPES], plays), ""),
+        'PenaltyYards': np.where(is_penalty == 1, rng.choice([5, 10, 15], plays), 0),
+    }, columns=COLUMNS)
+
+
+def generate_csv(path, scale=1, plays_per_season=PLAYS_PER_SEASON, seed=SEED):
+    """
+    Write a synthetic pbp CSV holding `scale` seasons, ending with LAST_SEASON.
+    Seasons are generated and written one at a time, so memory stays at one
+    season whatever the scale.
+
+    Args:
+        path (str): Where to write the CSV.
+        scale (int, optional): Number of seasons (1, 10 and 100 are the benchmark sizes).
+        plays_per_season (int, optional): Plays per season.
+        seed (int, optional): Base random seed.
+
+    Returns:
+        int: The number of plays written.
+    """
+    rows = 0
+    with open(path, "w", newline="") as f:
+        for i, season in enumerate(range(LAST_SEASON - scale + 1, LAST_SEASON + 1)):
+            frame = season_frame(season, plays_per_season, seed)
+            frame.to_csv(f, index=False, header=(i == 0))
+            rows += len(frame)
+            logging.debug(f"Wrote season {season} ({len(frame)} plays) to {path}.")
+    logging.info(f"Wrote {rows} plays ({scale} season(s)) to {path}.")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic NFL play-by-play CSV.")
+    parser.add_argument("--scale", type=int, default=1, help="number of seasons (1, 10, 100)")
+    parser.add_argument("--plays-per-season", type=int, default=PLAYS_PER_SEASON)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--out", help="output path (default bench/data/pbp-<scale>x.csv)")
+    args = parser.parse_args(argv)
+
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", f"pbp-{args.scale}x.csv")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    generate_csv(out, args.scale, args.plays_per_season, args.seed)
+    print(out)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
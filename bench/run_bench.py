@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import platform
+import resource
+import subprocess
+import logging
+from datetime import date, datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+
+# Benchmarks run against a local Redis unless told otherwise
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from generate_pbp import generate_csv, PLAYS_PER_SEASON, SEED  # noqa: E402
+import storage  # noqa: E402
+import jobs  # noqa: E402
+import worker  # noqa: E402
+import api  # noqa: E402
+from ingest import ingest_csv  # noqa: E402
+
+# Benchmarks must not be slowed down by the modules' own logging
+logging.getLogger().setLevel(getattr(logging, os.environ["LOG_LEVEL"].upper()))
+
+JOB_SPANS = {"week": 7, "month": 30, "season": 160}
+
+
+def _percentiles(samples):
+    """
+    Summarize latency samples.
+
+    Args:
+        samples (list): Durations in seconds.
+
+    Returns:
+        dict: count, mean, p50, p95, p99 and max in milliseconds.
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _random_ranges(rng, first, last, span_days, count):
+    """
+    Pick `count` date ranges of `span_days` days inside [first, last].
+
+    Args:
+        rng (Random): The random generator.
+        first (date): First day of the dataset.
+        last (date): Last day of the dataset.
+        span_days (int): Days per range.
+        count (int): How many ranges.
+
+    Returns:
+        list: (start, end) YYYY-MM-DD pairs.
+    """
+    latest_start = max((last - first).days - span_days + 1, 0)
+    ranges = []
+    for _ in range(count):
+        start = first + timedelta(days=rng.randint(0, latest_start))
+        end = min(start + timedelta(days=span_days - 1), last)
+        ranges.append((start.isoformat(), end.isoformat()))
+    return ranges
+
+
+def _run_job(start, end):
+    """
+    Run one job through the worker in this process, including any shards it
+    fans out into, and return how long it took.
+
+    Args:
+        start (str): Start date (YYYY-MM-DD).
+        end (str): End date (YYYY-MM-DD).
+
+    Returns:
+        tuple: (job ID, seconds from submission to completion).
+    """
+    jid = f"bench-{uuid.uuid4()}"
+    started = time.perf_counter()
+    jobs._save_job(jid, jobs._instantiate_job(jid, "submitted", start, end))
+    worker.run_worker_job_logic(jid)
+    while True:
+        task = jobs.sq.get()
+        if task is None:
+            break
+        worker.run_shard(task)
+    elapsed = time.perf_counter() - started
+    status = jobs.get_job_by_id(jid)["status"]
+    if status != "complete":
+        raise RuntimeError(f"Benchmark job {jid} ended as {status}")
+    return jid, elapsed
+
+
+def bench_ingest(csv_path, chunk_size):
+    """
+    Time a full ingest of the CSV.
+
+    Args:
+        csv_path (str): The CSV to load.
+        chunk_size (int): Rows per ingest chunk.
+
+    Returns:
+        dict: The ingest stats (rows, seconds, rows_per_sec, peak_rss_mb, ...).
+    """
+    stats = ingest_csv(csv_path, chunk_size=chunk_size)
+    stats["file_mb"] = round(os.path.getsize(csv_path) / 1e6, 1)
+    return stats
+
+
+def bench_jobs(rng, first, last, per_span):
+    """
+    Time analysis jobs of several sizes, both from the ingest rollups and by
+    scanning the plays.
+
+    Args:
+        rng (Random): The random generator.
+        first (date): First day of the dataset.
+        last (date): Last day of the dataset.
+        per_span (int): Jobs per span and mode.
+
+    Returns:
+        tuple: (results by mode and span, one completed job ID).
+    """
+    results = {}
+    job_id = None
+    use_rollups = worker.rollups_ready
+    try:
+        for mode in ("rollups", "scan"):
+            worker.rollups_ready = use_rollups if mode == "rollups" else (lambda: False)
+            results[mode] = {}
+            for name, span in JOB_SPANS.items():
+                latencies = []
+                for start, end in _random_ranges(rng, first, last, span, per_span):
+                    job_id, elapsed = _run_job(start, end)
+                    latencies.append(elapsed)
+                results[mode][name] = _percentiles(latencies)
+    finally:
+        worker.rollups_ready = use_rollups
+    return results, job_id
+
+
+def bench_endpoints(rng, first, last, job_id, requests_per_endpoint):
+    """
+    Time the API routes through the Flask test client (no network hop).
+
+    Args:
+        rng (Random): The random generator.
+        first (date): First day of the dataset.
+        last (date): Last day of the dataset.
+        job_id (str): A completed job, for /results.
+        requests_per_endpoint (int): Requests per route.
+
+    Returns:
+        dict: Latency percentiles and throughput per route.
+    """
+    client = api.app.test_client()
+    rows = storage.count_plays()
+    endpoints = {
+        "GET /data?limit=1000": lambda: client.get("/data?limit=1000"),
+        "GET /data/meta": lambda: client.get("/data/meta"),
+        "GET /plays/<id>": lambda: client.get(f"/plays/{rng.randint(1, rows)}"),
+        "GET /plays/pass?limit=1000": lambda: client.get("/plays/pass?limit=1000"),
+        "GET /plays/rush?limit=1000": lambda: client.get("/plays/rush?limit=1000"),
+        "GET /jobs?limit=100": lambda: client.get("/jobs?limit=100"),
+        "GET /jobs/<id>": lambda: client.get(f"/jobs/{job_id}"),
+        "GET /results/<id>": lambda: client.get(f"/results/{job_id}"),
+        "POST /jobs": lambda: client.post("/jobs", json=dict(zip(
+            ("start_date", "end_date"), _random_ranges(rng, first, last, JOB_SPANS["month"], 1)[0]))),
+    }
+
+    results = {}
+    for name, call in endpoints.items():
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(requests_per_endpoint):
+            t0 = time.perf_counter()
+            res = call()
+            res.get_data()
+            latencies.append(time.perf_counter() - t0)
+            if res.status_code >= 400:
+                raise RuntimeError(f"{name} returned {res.status_code}")
+        elapsed = time.perf_counter() - started
+        results[name] = {**_percentiles(latencies),
+                         "requests_per_sec": round(requests_per_endpoint / elapsed, 1)}
+
+    # Jobs submitted above are not run by the benchmark
+    for lane in (jobs.q, jobs.hq):
+        lane.clear()
+    return results
+
+
+def bench_redis(samples=200):
+    """
+    Measure Redis round-trip latency and memory use.
+
+    Args:
+        samples (int, optional): PINGs to time.
+
+    Returns:
+        dict: PING latency percentiles and used_memory_bytes.
+    """
+    latencies = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        storage.rd.ping()
+        latencies.append(time.perf_counter() - t0)
+    try:
+        used_memory = storage.rd.info("memory").get("used_memory")
+    except Exception:
+        used_memory = None
+    return {"ping": _percentiles(latencies), "used_memory_bytes": used_memory}
+
+
+def compare(current, baseline):
+    """
+    Compare the headline numbers of two benchmark runs.
+
+    Args:
+        current (dict): This run's results.
+        baseline (dict): A previous run's results.
+
+    Returns:
+        dict: Metric -> {baseline, current, ratio}, ratio > 1 meaning slower
+            (or bigger) than the baseline.
+    """
+    def headline(run):
+        metrics = {
+            "ingest.seconds": run["ingest"]["seconds"],
+            "ingest.peak_rss_mb": run["ingest"]["peak_rss_mb"],
+        }
+        for mode, spans in run["jobs"].items():
+            for span, stats in spans.items():
+                metrics[f"jobs.{mode}.{span}.p95_ms"] = stats.get("p95_ms")
+        for route, stats in run["endpoints"].items():
+            metrics[f"endpoints.{route}.p95_ms"] = stats.get("p95_ms")
+        return metrics
+
+    now, then = headline(current), headline(baseline)
+    return {
+        metric: {"baseline": then[metric], "current": value,
+                 "ratio": round(value / then[metric], 3) if then[metric] else None}
+        for metric, value in now.items() if then.get(metric) is not None and value is not None
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of ingest, jobs and API routes.")
+    parser.add_argument("--scale", type=int, default=1, help="seasons of synthetic data (1, 10, 100)")
+    parser.add_argument("--csv", help="benchmark this CSV instead of generated data")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--jobs", type=int, default=10, help="jobs per span and mode")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--baseline", help="a previous results file to compare against")
+    parser.add_argument("--out", help="results file (default bench/results/bench-<scale>x-<time>.json)")
+    args = parser.parse_args(argv)
+
+    csv_path = args.csv
+    if not csv_path:
+        csv_path = os.path.join(BENCH_DIR, "data", f"pbp-{args.scale}x.csv")
+        if not os.path.exists(csv_path):
+            os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+            generate_csv(csv_path, args.scale, PLAYS_PER_SEASON, args.seed)
+
+    rng = random.Random(args.seed)
+    ingest = bench_ingest(csv_path, args.chunk_size)
+    meta = storage.get_dataset_meta()
+    first, last = date.fromisoformat(meta["min_date"]), date.fromisoformat(meta["max_date"])
+    job_results, job_id = bench_jobs(rng, first, last, args.jobs)
+
+    results = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "redis_host": os.environ["REDIS_HOST"],
+            "csv": os.path.abspath(csv_path),
+            "scale": None if args.csv else args.scale,
+            "rows": ingest["rows"],
+            "seed": args.seed,
+        },
+        "ingest": ingest,
+        "jobs": job_results,
+        "endpoints": bench_endpoints(rng, first, last, job_id, args.requests),
+        "redis": bench_redis(),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["comparison"] = compare(results, json.load(f))
+
+    out = args.out or os.path.join(BENCH_DIR, "results",
+                                   f"bench-{args.scale}x-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
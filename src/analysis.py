@@ -0,0 +1,611 @@
+import os
+import re
+import json
+import logging
+import operator
+import numpy as np
+import pandas as pd
+from datetime import date
+from functools import lru_cache, reduce
+
+log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=getattr(logging, log_level))
+
+FRAME_COLUMNS = ['GameDate', 'Description', 'InjuryFlags', 'Formation', 'PlayType', 'RushDirection', 'PassType']
+CATEGORY_COLUMNS = ['Formation', 'PlayType', 'RushDirection', 'PassType']  # dictionary-encoded at ingest
+COMBO_COLUMNS = ['Formation', 'PlayType', 'Direction']
+# A play counts as an injury when its Description contains any of these (case-insensitive)
+INJURY_KEYWORDS = tuple(
+    k.strip().lower() for k in os.environ.get("INJURY_KEYWORDS", "injured,shaken up,carted off").split(",")
+    if k.strip()
+)
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Generic group-by analyses: dimensions are play columns ("Direction" is the
+# pass type of pass plays and the rush direction of the others)
+GROUP_DIMENSIONS = (
+    'Formation', 'PlayType', 'Direction', 'OffenseTeam', 'DefenseTeam', 'Quarter', 'Down', 'ToGo',
+    'YardLine', 'YardLineFixed', 'YardLineDirection', 'SeasonYear', 'GameDate', 'PenaltyType', 'PenaltyTeam'
+)
+# Additive per-group sums the metrics are derived from: name -> play column
+GROUP_SUMS = {
+    'injuries': 'Injured',
+    'touchdowns': 'IsTouchdown',
+    'interceptions': 'IsInterception',
+    'fumbles': 'IsFumble',
+    'sacks': 'IsSack',
+    'incompletions': 'IsIncomplete',
+    'penalties': 'IsPenalty',
+    'first_downs': 'SeriesFirstDown',
+    'yards': 'Yards',
+    'penalty_yards': 'PenaltyYards',
+}
+# Metric -> (numerator sum, denominator sum or None, scale). "plays" is the group size.
+GROUP_METRICS = {
+    'plays': ('plays', None, 1),
+    'injuries': ('injuries', None, 1),
+    'injury_rate': ('injuries', 'plays', 100),
+    'touchdowns': ('touchdowns', None, 1),
+    'touchdown_rate': ('touchdowns', 'plays', 100),
+    'interceptions': ('interceptions', None, 1),
+    'interception_rate': ('interceptions', 'plays', 100),
+    'fumbles': ('fumbles', None, 1),
+    'fumble_rate': ('fumbles', 'plays', 100),
+    'sacks': ('sacks', None, 1),
+    'sack_rate': ('sacks', 'plays', 100),
+    'incompletions': ('incompletions', None, 1),
+    'penalties': ('penalties', None, 1),
+    'penalty_rate': ('penalties', 'plays', 100),
+    'first_down_rate': ('first_downs', 'plays', 100),
+    'yards': ('yards', None, 1),
+    'mean_yards': ('yards', 'plays', 1),
+    'penalty_yards': ('penalty_yards', None, 1),
+}
+DEFAULT_GROUP_METRICS = ['plays', 'injuries', 'injury_rate']
+MAX_GROUPINGS = int(os.environ.get("MAX_GROUPINGS", 10))
+
+
+def parse_game_dates(dates):
+    """
+    Parse a column of GameDate values into datetimes. ISO dates are parsed in
+    one vectorized call; anything else falls back to per-value parsing.
+
+    Args:
+        dates (Series): Raw GameDate values.
+
+    Returns:
+        Series: datetime64 values, NaT where a date could not be parsed.
+    """
+    parsed = pd.to_datetime(dates, format="%Y-%m-%d", errors="coerce")
+    unparsed = parsed.isna() & dates.notna()
+    if unparsed.any():
+        parsed[unparsed] = pd.to_datetime(dates[unparsed], format="mixed", errors="coerce")
+    return parsed
+
+
+@lru_cache(maxsize=16)
+def _keyword_matcher(keywords):
+    """
+    Compile keywords into one multi-pattern matcher. The pattern is a
+    zero-width lookahead over an alternation, longest keyword first, so a
+    single scan reports the longest keyword starting at every position and
+    matches may overlap. A shorter keyword starting at the same position is
+    inside the reported one, so each keyword maps to its own bit plus the
+    bits of every keyword it contains (the output links of an Aho-Corasick
+    automaton).
+
+    Args:
+        keywords (tuple): Lower-case keywords; bit i is keywords[i].
+
+    Returns:
+        tuple: (compiled pattern, dict of keyword -> InjuryFlags bits).
+    """
+    ordered = sorted(set(keywords), key=len, reverse=True)
+    pattern = re.compile("(?=(" + "|".join(re.escape(k) for k in ordered) + "))")
+    bits = {k: sum(1 << i for i, other in enumerate(keywords) if other in k) for k in ordered}
+    return pattern, bits
+
+
+def injury_flags(descriptions, keywords):
+    """
+    Tag descriptions with the injury keywords they contain, scanning each
+    description once whatever the number of keywords. Keywords inside
+    another one (e.g. "injured" and "injured reserve") still get their bit.
+
+    Args:
+        descriptions (Series): Play descriptions.
+        keywords (list): Lower-case keywords; bit i of a flag is keywords[i].
+
+    Returns:
+        Series: int64 bitmask per description.
+    """
+    if not keywords:
+        return pd.Series(0, index=descriptions.index, dtype='int64')
+    pattern, bits = _keyword_matcher(tuple(keywords))
+    found = descriptions.fillna("").astype(str).str.lower().str.findall(pattern)
+    return found.map(lambda matches: reduce(operator.or_, (bits[k] for k in set(matches)), 0)).astype('int64')
+
+
+def keyword_mask(registered, keywords):
+    """
+    Return the InjuryFlags bits of some keywords.
+
+    Args:
+        registered (list): Every registered keyword, indexed by bit.
+        keywords (iterable): The keywords that count as an injury.
+
+    Returns:
+        int: The mask.
+    """
+    return sum(1 << registered.index(k) for k in set(keywords))
+
+
+def _injured(df, injury_mask):
+    """
+    Decide which plays are injuries: from the precomputed InjuryFlags where a
+    mask is given and the play carries flags, otherwise by matching INJURY_KEYWORDS.
+
+    Args:
+        df (DataFrame): Plays with Description and InjuryFlags columns.
+        injury_mask (int): The bits that count as an injury, or None.
+
+    Returns:
+        Series: bool per play.
+    """
+    flags = df['InjuryFlags']
+    if injury_mask is None:
+        return injury_flags(df['Description'], INJURY_KEYWORDS) != 0
+    if pd.api.types.is_integer_dtype(flags):
+        return (flags.to_numpy() & injury_mask) != 0
+    injured = pd.Series(False, index=df.index)
+    tagged = flags.notna()
+    injured[tagged] = (flags[tagged].astype('int64') & injury_mask) != 0
+    injured[~tagged] = injury_flags(df['Description'][~tagged], INJURY_KEYWORDS) != 0
+    return injured
+
+
+def _game_dates(values):
+    """
+    Turn a column of stored GameDate values into datetimes. Day ordinals
+    (the normalized form) are converted arithmetically; only strings left
+    from older loads are parsed.
+
+    Args:
+        values (Series): GameDate day ordinals (0 for unknown) or date strings.
+
+    Returns:
+        Series: datetime64 values, NaT where the date is unknown.
+    """
+    if pd.api.types.is_integer_dtype(values):
+        days = (values.to_numpy() - EPOCH_ORDINAL).astype('datetime64[D]')
+        return pd.Series(days, index=values.index).where(values > 0)
+    ordinals = values.map(lambda v: v if isinstance(v, int) and v > 0 else None).dropna()
+    parsed = parse_game_dates(values.where(~values.index.isin(ordinals.index)))
+    if len(ordinals):
+        parsed[ordinals.index] = (ordinals.astype('int64').to_numpy() - EPOCH_ORDINAL).astype('datetime64[D]')
+    return parsed
+
+
+def _category_codes(values, categories):
+    """
+    Return the dictionary codes of a categorical column, or None if the
+    column holds values rather than codes (plays stored before encoding).
+
+    Args:
+        values (Series): The stored column.
+        categories (list): The column's dictionary, or None.
+
+    Returns:
+        ndarray: The codes, -1 where a value is missing.
+    """
+    if categories is None or not pd.api.types.is_integer_dtype(values):
+        return None
+    return values.to_numpy()
+
+
+def _categorical(values, categories, codes=None):
+    """
+    Build a categorical column, "Unknown" where a value is missing.
+
+    Args:
+        values (Series): The stored column (used when there are no codes).
+        categories (list): The column's dictionary.
+        codes (ndarray, optional): Dictionary codes of the column.
+
+    Returns:
+        Series: Categorical values.
+    """
+    if codes is None:
+        if categories is not None:
+            values = values.map(lambda v: categories[v] if isinstance(v, int) and 0 <= v < len(categories) else v)
+        return values.fillna("Unknown").astype(str).astype("category")
+    column = pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=values.index)
+    if (codes < 0).any():
+        if "Unknown" not in column.cat.categories:
+            column = column.cat.add_categories(["Unknown"])
+        column = column.fillna("Unknown")
+    return column
+
+
+def plays_frame(plays, categories=None, injury_mask=None):
+    """
+    Load plays into a typed columnar frame holding only what the injury
+    analysis needs. Normalized plays (see ingest.normalize_chunk) are turned
+    into categoricals straight from their codes, and their injury flag is
+    read from InjuryFlags, without touching strings.
+
+    Args:
+        plays (iterable): Play dictionaries.
+        categories (dict, optional): Column -> dictionary values, for the
+            dictionary-encoded CATEGORY_COLUMNS (see storage.column_categories).
+        injury_mask (int, optional): InjuryFlags bits that count as an
+            injury (see storage.get_injury_tags).
+
+    Returns:
+        DataFrame: One row per RUSH/PASS play with GameDate (datetime64),
+            Formation, PlayType and Direction (categorical) and Injured (bool).
+    """
+    categories = categories or {}
+    df = pd.DataFrame.from_records(plays, columns=FRAME_COLUMNS)
+
+    type_codes = _category_codes(df['PlayType'], categories.get('PlayType'))
+    play_type = _categorical(df['PlayType'], categories.get('PlayType'), type_codes)
+    if type_codes is None:
+        play_type = play_type.astype(str).str.upper().astype("category")
+    is_rush = play_type == "RUSH"
+    is_pass = play_type == "PASS"
+    keep = is_rush | is_pass
+
+    # RushDirection and PassType share a dictionary, so their codes can be mixed
+    rush_codes = _category_codes(df['RushDirection'], categories.get('RushDirection'))
+    pass_codes = _category_codes(df['PassType'], categories.get('PassType'))
+    if rush_codes is not None and pass_codes is not None:
+        direction = _categorical(df['PassType'], categories['PassType'],
+                                 np.where(is_pass.to_numpy(), pass_codes, rush_codes))
+    else:
+        direction = _categorical(df['PassType'].where(is_pass, df['RushDirection']), categories.get('PassType'))
+
+    frame = pd.DataFrame({
+        'GameDate': _game_dates(df['GameDate']),
+        'Formation': _categorical(df['Formation'], categories.get('Formation'),
+                                  _category_codes(df['Formation'], categories.get('Formation'))),
+        'PlayType': play_type,
+        'Direction': direction,
+        'Injured': _injured(df, injury_mask)
+    })
+    return frame[keep].reset_index(drop=True)
+
+
+def date_mask(frame, start_date, end_date):
+    """
+    Build the boolean mask selecting plays inside [start_date, end_date].
+
+    Args:
+        frame (DataFrame): A frame from `plays_frame`.
+        start_date (datetime): First day of the range.
+        end_date (datetime): Last day of the range.
+
+    Returns:
+        Series: True for plays inside the range.
+    """
+    return frame['GameDate'].between(start_date, end_date)
+
+
+def _grouped_counts(frame, by):
+    """
+    Count total and injury plays per group with a single group-by.
+
+    Args:
+        frame (DataFrame): A frame from `plays_frame`.
+        by (list): The columns to group on.
+
+    Returns:
+        DataFrame: total_plays and injury_plays per group, in order of first appearance.
+    """
+    grouped = frame.groupby(by, sort=False, observed=True)['Injured']
+    return pd.DataFrame({
+        'total_plays': grouped.size(),
+        'injury_plays': grouped.sum()
+    })
+
+
+def injury_partials(frame):
+    """
+    Count total and injury plays for each (Formation, PlayType, Direction) combo
+    with a single group-by. The counts are additive, so partials from disjoint
+    sets of plays can be summed with `merge_partials`.
+
+    Args:
+        frame (DataFrame): A (filtered) frame from `plays_frame`.
+
+    Returns:
+        dict: Combo key -> [total_plays, injury_plays], in order of first appearance.
+    """
+    counts = _grouped_counts(frame, COMBO_COLUMNS)
+    return {
+        combo_key(*combo): [int(total), int(injuries)]
+        for combo, total, injuries in zip(counts.index, counts['total_plays'], counts['injury_plays'])
+    }
+
+
+def day_partials(frame):
+    """
+    Count total and injury plays per GameDate and combo, for precomputed
+    per-day rollups. Plays without a valid GameDate are left out.
+
+    Args:
+        frame (DataFrame): A frame from `plays_frame`.
+
+    Returns:
+        dict: GameDate day ordinal -> combo partials (see `injury_partials`).
+    """
+    dated = frame[frame['GameDate'].notna()]
+    days_since_epoch = dated['GameDate'].values.astype('datetime64[D]').astype('int64')
+    dated = dated.assign(DateOrdinal=days_since_epoch + EPOCH_ORDINAL)
+    counts = _grouped_counts(dated, ['DateOrdinal'] + COMBO_COLUMNS)
+
+    days = {}
+    for (ordinal, *combo), total, injuries in zip(counts.index, counts['total_plays'], counts['injury_plays']):
+        days.setdefault(int(ordinal), {})[combo_key(*combo)] = [int(total), int(injuries)]
+    return days
+
+
+def merge_partials(target, partials):
+    """
+    Add one set of combo partials into another, in place.
+
+    Args:
+        target (dict): Combo partials being accumulated.
+        partials (dict): Combo partials to add.
+
+    Returns:
+        dict: `target`, for convenience.
+    """
+    for key, (total, injuries) in partials.items():
+        counts = target.setdefault(key, [0, 0])
+        counts[0] += total
+        counts[1] += injuries
+    return target
+
+
+def combo_key(formation, play_type, direction):
+    """
+    Build the result key used for a combo in `injury_combo_counts`.
+
+    Args:
+        formation (str): The formation.
+        play_type (str): RUSH or PASS.
+        direction (str): The rush direction or pass type.
+
+    Returns:
+        str: The combo key.
+    """
+    return f"Formation: {formation}; PlayType: {play_type}; Direction: {direction}"
+
+
+def finalize_combo_counts(partials):
+    """
+    Turn combo partial counts into the `injury_combo_counts` result, deriving
+    each injury percentage once at the end.
+
+    Args:
+        partials (dict): Combo key -> [total_plays, injury_plays].
+
+    Returns:
+        dict: Combo key -> injury_plays, total_plays and injury_percentage.
+    """
+    counts = {}
+    for key, (total, injuries) in partials.items():
+        counts[key] = {
+            "injury_plays": injuries,
+            "total_plays": total,
+            "injury_percentage": round((injuries / total) * 100, 2) if total > 0 else 0.0
+        }
+    return counts
+
+
+def parse_analysis(group_by=None, metrics=None):
+    """
+    Validate the group-by dimensions and metrics of a generic analysis job.
+
+    Args:
+        group_by (list, optional): Dimension names (one grouping), or a list
+            of such lists (several groupings computed from the same pass).
+            An empty list aggregates over every play.
+        metrics (list, optional): Metric names (see GROUP_METRICS); defaults
+            to DEFAULT_GROUP_METRICS.
+
+    Returns:
+        dict: {"group_by": [[dimension, ...], ...], "metrics": [metric, ...]}.
+    """
+    group_by = [] if group_by is None else group_by
+    if not isinstance(group_by, list):
+        raise ValueError("group_by must be a list of dimensions or a list of lists of dimensions")
+    groupings = group_by if group_by and all(isinstance(g, list) for g in group_by) else [group_by]
+    if len(groupings) > MAX_GROUPINGS:
+        raise ValueError(f"At most {MAX_GROUPINGS} groupings can be requested at once")
+    for grouping in groupings:
+        unknown = [d for d in grouping if d not in GROUP_DIMENSIONS]
+        if unknown or len(set(grouping)) != len(grouping):
+            raise ValueError(f"group_by dimensions must be distinct and among {', '.join(GROUP_DIMENSIONS)}")
+
+    metrics = DEFAULT_GROUP_METRICS if metrics is None else metrics
+    if not isinstance(metrics, list) or not metrics or any(m not in GROUP_METRICS for m in metrics):
+        raise ValueError(f"metrics must be a non-empty list among {', '.join(GROUP_METRICS)}")
+    return {"group_by": [list(g) for g in groupings], "metrics": list(dict.fromkeys(metrics))}
+
+
+def _group_sums(analysis):
+    """
+    Return the sums an analysis needs, in the order they are kept in its partials.
+
+    Args:
+        analysis (dict): A spec from `parse_analysis`.
+
+    Returns:
+        list: Sum names, "plays" first.
+    """
+    needed = {name for m in analysis["metrics"] for name in GROUP_METRICS[m][:2] if name}
+    return ['plays'] + sorted(needed - {'plays'})
+
+
+def _dimension(df, column, categories):
+    """
+    Build one group-by dimension column of a group frame.
+
+    Args:
+        df (DataFrame): The stored play columns.
+        column (str): The dimension (see GROUP_DIMENSIONS).
+        categories (dict): Column -> dictionary values.
+
+    Returns:
+        Series: The dimension's values (categorical for dictionary-encoded columns).
+    """
+    if column == 'GameDate':
+        return _game_dates(df['GameDate']).dt.strftime('%Y-%m-%d')
+    if column == 'Direction':
+        is_pass = df['PlayType'] == "PASS"
+        rush_codes = _category_codes(df['RushDirection'], categories.get('RushDirection'))
+        pass_codes = _category_codes(df['PassType'], categories.get('PassType'))
+        if rush_codes is not None and pass_codes is not None:
+            return _categorical(df['PassType'], categories['PassType'],
+                                np.where(is_pass.to_numpy(), pass_codes, rush_codes))
+        return _categorical(df['PassType'].where(is_pass, df['RushDirection']), categories.get('PassType'))
+    if column in categories:
+        return _categorical(df[column], categories[column], _category_codes(df[column], categories[column]))
+    return df[column]
+
+
+def group_frame(plays, analysis, categories=None, injury_mask=None):
+    """
+    Load plays into a frame holding the dimensions and sums of a generic
+    analysis. Unlike `plays_frame`, every play is kept.
+
+    Args:
+        plays (iterable): Play dictionaries.
+        analysis (dict): A spec from `parse_analysis`.
+        categories (dict, optional): Column -> dictionary values, for
+            dictionary-encoded columns (see storage.column_categories).
+        injury_mask (int, optional): InjuryFlags bits that count as an injury.
+
+    Returns:
+        DataFrame: One row per play with the requested dimensions and sums.
+    """
+    categories = categories or {}
+    dimensions = sorted({d for grouping in analysis["group_by"] for d in grouping})
+    sums = [name for name in _group_sums(analysis) if name != 'plays']
+    columns = {c for d in dimensions for c in (['PlayType', 'RushDirection', 'PassType'] if d == 'Direction' else [d])}
+    columns |= {GROUP_SUMS[name] for name in sums if name != 'injuries'}
+    columns |= {'Description', 'InjuryFlags'} if 'injuries' in sums else set()
+    df = pd.DataFrame.from_records(plays, columns=sorted(columns))
+
+    if 'Direction' in dimensions:
+        # Compared against "PASS" in `_dimension`, so it is decoded first
+        type_codes = _category_codes(df['PlayType'], categories.get('PlayType'))
+        df['PlayType'] = _categorical(df['PlayType'], categories.get('PlayType'), type_codes)
+        if type_codes is None:
+            df['PlayType'] = df['PlayType'].astype(str).str.upper()
+
+    frame = pd.DataFrame({d: _dimension(df, d, categories) for d in dimensions}, index=df.index)
+    for name in sums:
+        if name == 'injuries':
+            frame[name] = np.asarray(_injured(df, injury_mask), dtype='int64')
+        else:
+            frame[name] = pd.to_numeric(df[GROUP_SUMS[name]], errors='coerce').fillna(0)
+    return frame
+
+
+def _plain(value):
+    """Turn a group value into a JSON-friendly scalar (None for missing)."""
+    value = value.item() if isinstance(value, np.generic) else value
+    if isinstance(value, float):
+        if np.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def group_partials(frame, analysis):
+    """
+    Compute the sums of every grouping of an analysis, one vectorized
+    group-by per grouping over the same frame. The sums are additive, so
+    partials from disjoint sets of plays can be added with `merge_group_partials`.
+
+    Args:
+        frame (DataFrame): A (filtered) frame from `group_frame`.
+        analysis (dict): A spec from `parse_analysis`.
+
+    Returns:
+        list: Per grouping, JSON-encoded group values -> sums (see `_group_sums`).
+    """
+    sums = _group_sums(analysis)[1:]
+    partials = []
+    for grouping in analysis["group_by"]:
+        if not grouping:
+            totals = [len(frame)] + [frame[name].sum() for name in sums]
+            partials.append({"[]": [_plain(v) for v in totals]} if len(frame) else {})
+            continue
+        grouped = frame.groupby(grouping, sort=False, observed=True, dropna=False)
+        counts = grouped[sums].sum() if sums else pd.DataFrame(index=grouped.size().index)
+        counts.insert(0, 'plays', grouped.size())
+        keys = counts.index if len(grouping) > 1 else [(k,) for k in counts.index]
+        partials.append({
+            json.dumps([_plain(v) for v in key]): [_plain(v) for v in row]
+            for key, row in zip(keys, counts.itertuples(index=False))
+        })
+    return partials
+
+
+def merge_group_partials(target, partials):
+    """
+    Add one set of group partials into another, in place.
+
+    Args:
+        target (list): Group partials being accumulated (may be empty).
+        partials (list): Group partials to add.
+
+    Returns:
+        list: `target`, for convenience.
+    """
+    if not target:
+        target.extend({} for _ in partials)
+    for accumulated, groups in zip(target, partials):
+        for key, values in groups.items():
+            sums = accumulated.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                sums[i] += value
+    return target
+
+
+def finalize_groups(analysis, partials):
+    """
+    Turn group partials into the `aggregations` result, deriving each metric
+    once at the end.
+
+    Args:
+        analysis (dict): A spec from `parse_analysis`.
+        partials (list): Group partials (see `group_partials`).
+
+    Returns:
+        list: Per grouping, {"group_by", "metrics", "groups"}, each group
+            holding its dimension values and metrics.
+    """
+    sums = _group_sums(analysis)
+    aggregations = []
+    for i, grouping in enumerate(analysis["group_by"]):
+        groups = []
+        for key, values in (partials[i] if i < len(partials) else {}).items():
+            totals = dict(zip(sums, values))
+            group = dict(zip(grouping, json.loads(key)))
+            for metric in analysis["metrics"]:
+                numerator, denominator, scale = GROUP_METRICS[metric]
+                if denominator is None:
+                    group[metric] = totals[numerator]
+                else:
+                    total = totals[denominator]
+                    group[metric] = round(totals[numerator] / total * scale, 2) if total else 0.0
+            groups.append(group)
+        groups.sort(key=lambda g: -g['plays'] if 'plays' in g else 0)
+        aggregations.append({"group_by": grouping, "metrics": analysis["metrics"], "groups": groups})
+    return aggregations
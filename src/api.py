@@ -1,14 +1,47 @@
-import requests
-import uuid
-import math
+import time
 import logging
-import pandas as pd
-from flask import Flask, request, jsonify
-import json
+from flask import Flask, request, jsonify, g
 import os
 import redis
 from datetime import datetime
-from jobs import add_job, get_job_by_id, jdb, results_db
+from jobs import (
+    add_job,
+    add_batch,
+    PRIORITIES,
+    get_job_by_id,
+    get_job_stats,
+    list_job_ids,
+    job_expired,
+    get_result,
+    get_result_stats,
+    get_worker_stats,
+    count_jobs_by_status,
+    read_events,
+    get_job_cprofile,
+    qdb,
+    jdb,
+    results_db
+)
+from storage import (
+    BATCH_SIZE,
+    get_play,
+    get_plays,
+    expand_play,
+    iter_plays,
+    iter_play_id_pages,
+    has_plays_after,
+    count_plays,
+    delete_plays,
+    get_dataset_version,
+    get_dataset_meta,
+    get_partitions,
+    lock_dataset,
+    unlock_dataset
+)
+from ingest import ingest_csv, append_csv, ensure_snapshot, LoadInProgress
+from analysis import parse_analysis
+from codec import decode
+import metrics
 
 app = Flask(__name__)
 log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
@@ -24,7 +57,26 @@ def get_redis_client() -> redis.Redis:
 
 
 rd = get_redis_client()
-CSV_FILE_PATH = '/code/data/pbp-2024.csv'
+CSV_FILE_PATH = os.environ.get("CSV_FILE_PATH", "/code/data/pbp-2024.csv")  # several files separated by os.pathsep
+CSV_FILE_PATHS = CSV_FILE_PATH.split(os.pathsep)
+DATA_DIR = os.environ.get("DATA_DIR", os.path.dirname(CSV_FILE_PATHS[0]))  # where POST /data may read files from
+_plays_snapshot = {}  # encoded GET /plays body for the current dataset version
+MAX_BATCH_RANGES = int(os.environ.get('MAX_BATCH_RANGES', 500))
+SSE_KEEPALIVE = int(os.environ.get('SSE_KEEPALIVE', 15))  # seconds between keep-alive comments
+
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+    return response
 
 
 @app.route('/help', methods=['GET'])
@@ -32,71 +84,136 @@ def help():
     return jsonify({
         "routes": {
             "/plays/load": "POST - Load full play data into Redis and return it",
-            "/data": "POST/GET/DELETE - Load, view, or delete basic play data subset",
-            "/plays": "GET - Get all plays",
+            "/data": "POST/GET/DELETE - Load (mode=replace/append, file=, one or more files), view (?limit=&cursor=&season=&format=ndjson), or delete basic play data subset",
+            "/data/meta": "GET - Dataset metadata (date range, row counts, version, season partitions)",
+            "/plays": "GET - Get all plays (?season= for one season)",
             "/plays/<play_id>": "GET - Get formation/playtype/description by ID",
-            "/plays/rush": "GET - Get all rush plays",
-            "/plays/pass": "GET - Get all pass plays",
-            "/jobs": "POST - Submit a job for analysis",
-            "/jobs": "GET - List all job IDs",
-            "/jobs/<jobid>": "GET - Get job status",
+            "/plays/rush": "GET - Get all rush plays (?limit=&cursor=&format=ndjson)",
+            "/plays/pass": "GET - Get all pass plays (?limit=&cursor=&format=ndjson)",
+            "/jobs": "POST - Submit a job for analysis (optional priority: high/low, group_by and metrics)",
+            "/jobs": "GET - List job IDs (?status=&since=&limit=&cursor=)",
+            "/jobs/batch": "POST - Submit many date ranges as one batch of jobs",
+            "/jobs/stats": "GET - Job result reuse and coalescing counters, queue depth per lane",
+            "/jobs/<jobid>": "GET - Get job status (?profile=true adds per-stage timings)",
+            "/jobs/<jobid>/events": "GET - Server-Sent Events stream of job status, progress and result",
+            "/workers": "GET - Per-worker concurrency and utilization",
+            "/results/stats": "GET - Stored result bytes, budget and evictions",
             "/results/<jobid>": "GET - Return result of injury analysis",
+            "/metrics": "GET - Prometheus metrics (requests, queues, jobs, workers, Redis)",
             "/help": "GET - Describe all routes"
         }
     }), 200
 
+def _stream_plays(play_type=None):
+    """
+    Builds a streamed response of stored plays, optionally paginated.
+
+    Query parameters:
+        limit (int): Maximum number of plays to return.
+        cursor (int): Only return plays with a play_id greater than this.
+        season (str): Only return plays of this SeasonYear; other partitions are not read.
+        format (str): "ndjson" for one JSON play per line instead of a JSON array.
+
+    When a page is cut short by `limit`, the cursor for the next page is sent
+    in the X-Next-Cursor header. Plays are decoded and written out batch by
+    batch, so the full list is never held in memory.
+
+    Args: play_type (str, optional): Only return plays of this PlayType.
+    Returns: A streamed Flask response.
+    """
+    limit = request.args.get("limit", type=int)
+    cursor = request.args.get("cursor", 0, type=int)
+    season = request.args.get("season")
+    ndjson = request.args.get("format") == "ndjson" or \
+        request.accept_mimetypes.best == "application/x-ndjson"
+
+    headers = {}
+    pages = iter_play_id_pages(cursor, limit, play_type, season=season)
+    if limit is not None:
+        ids = [pid for page in pages for pid in page]
+        if ids and has_plays_after(ids[-1], play_type, season):
+            headers["X-Next-Cursor"] = str(ids[-1])
+        pages = [ids[i:i + BATCH_SIZE] for i in range(0, len(ids), BATCH_SIZE)]
+
+    def generate():
+        first = True
+        if not ndjson:
+            yield "["
+        for page in pages:
+            for play in map(expand_play, get_plays(page)):
+                if ndjson:
+                    yield app.json.dumps(play, separators=(",", ":")) + "\n"
+                else:
+                    yield ("" if first else ",") + app.json.dumps(play, separators=(",", ":"))
+                    first = False
+        if not ndjson:
+            yield "]"
+
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    return app.response_class(generate(), mimetype=mimetype, headers=headers)
+
+
+def _data_file(name):
+    """
+    Resolve a CSV file named in a request, which must live inside DATA_DIR.
+
+    Args:
+        name (str): File name (or path relative to DATA_DIR).
+
+    Returns:
+        str: The absolute path of the file.
+    """
+    data_dir = os.path.realpath(DATA_DIR)
+    path = os.path.realpath(os.path.join(data_dir, name))
+    if os.path.commonpath([data_dir, path]) != data_dir or not os.path.isfile(path):
+        raise ValueError(f"No CSV file named {name} in the data directory")
+    return path
+
+
 @app.route('/data', methods=['POST'])
 def pull_data():
     """
     Loads NFL play-by-play data from a CSV file and stores it in Redis.
+
+    Request body (optional JSON): {"file": "<CSV in DATA_DIR>" or a list of them, "mode": "replace" | "append"}.
+    "replace" (the default) reloads everything from the files (CSV_FILE_PATH if
+    none are named), several files in parallel; "append" only adds one file's
+    new or changed games (keyed by GameId) to the stored plays.
+
     Args: none
     Returns: jsonify: JSON response describing the outcome of the function.
     """
     logging.debug("Request to load NFL play-by-play data received.")
 
     try:
-        # Load CSV data into a pandas DataFrame
-        df = pd.read_csv(CSV_FILE_PATH)
-
-        # Print out the column names for debugging purposes
-        logging.debug(f"CSV Columns: {df.columns.tolist()}")
-
-        # Check if the CSV contains the necessary columns
-        required_columns = ['Formation', 'PlayType', 'Description', 'RushDirection', 'PassType']
-        if not all(col in df.columns for col in required_columns):
-            logging.error(f"CSV file is missing required columns. Found columns: {df.columns}")
-            return jsonify({"error": "CSV file is missing required columns"}), 400
-
-        # Handle missing or invalid data
-        df['Formation'] = df['Formation'].fillna('Unknown')  # Fill missing formation with 'Unknown'
-        df['PlayType'] = df['PlayType'].fillna('Unknown')  # Fill missing play type with 'Unknown'
-        df['Description'] = df['Description'].fillna('No description')  # Fill missing description
-        df['RushDirection'] = df['RushDirection'].fillna('Unknown')  # Fill missing rush direction
-        df['PassType'] = df['PassType'].fillna('Unknown')  # Fill missing pass type
-
-        # Add play_id as a unique identifier for each row
-        df['play_id'] = range(1, len(df) + 1)  # Sequential play_id (1-based index)
-
-        # Convert the DataFrame to a list of dictionaries
-        selected_columns = [
-            'play_id', "GameId", "GameDate", "Quarter", "Minute", "Second", "OffenseTeam", "DefenseTeam",
-            "Down", "ToGo", "YardLine", "SeriesFirstDown", "NextScore", "Description", "TeamWin",
-            "SeasonYear", "Yards", "Formation", "PlayType", "IsRush", "IsPass", "IsIncomplete",
-            "IsTouchdown", "PassType", "IsSack", "IsChallenge", "IsChallengeReversed", "Challenger",
-            "IsMeasurement", "IsInterception", "IsFumble", "IsPenalty", "IsTwoPointConversion",
-            "IsTwoPointConversionSuccessful", "RushDirection", "YardLineFixed", "YardLineDirection",
-            "IsPenaltyAccepted", "PenaltyTeam", "IsNoPlay", "PenaltyType", "PenaltyYards"
-        ]
-
-        data = df[selected_columns].to_dict(orient='records')
-
-        # Store the data in Redis
-        rd.set("nfl_data", json.dumps(data))  # Store using a string key
-
+        options = request.get_json(silent=True) or {}
+        mode = options.get("mode", request.args.get("mode", "replace"))
+        if mode not in ("replace", "append"):
+            return jsonify({"error": "mode must be replace or append"}), 400
+        names = options.get("file", request.args.getlist("file"))
+        names = [names] if isinstance(names, str) else names
+        csv_paths = [_data_file(name) for name in names] if names else CSV_FILE_PATHS
+
+        if mode == "append":
+            if len(csv_paths) != 1:
+                return jsonify({"error": "append takes exactly one file"}), 400
+            csv_path = csv_paths[0]
+            stats = append_csv(csv_path)
+            logging.info(f"Appended {csv_path}: {stats}")
+            changed = stats["games_added"] + stats["games_replaced"]
+            return jsonify({"message": f"{changed} new or changed games loaded", "ingest": stats}), \
+                (201 if changed else 200)
+
+        # Stream the CSV into Redis in chunks so memory stays bounded
+        stats = ingest_csv(csv_paths)
 
         logging.info("NFL play-by-play data successfully fetched and stored in Redis.")
-        return jsonify({"message": "NFL play-by-play data loaded successfully"}), 201
+        return jsonify({"message": "NFL play-by-play data loaded successfully", "ingest": stats}), 201
 
+    except LoadInProgress as e:
+        return jsonify({"error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.error(f"Error loading data from CSV: {str(e)}")
         return jsonify({"error": f"Error loading data from CSV: {str(e)}"}), 500
@@ -104,18 +221,33 @@ def pull_data():
 @app.route('/data', methods=['GET'])
 def return_data():
     """
-    Returns the cached NFL play-by-play data from Redis.
+    Returns the cached NFL play-by-play data from Redis. Supports the `limit`,
+    `cursor`, `season` and `format=ndjson` query parameters (see `_stream_plays`).
     Args: None
     Returns: The cached data or an error message.
     """
     logging.debug("Request to retrieve NFL play-by-play data received.")
-    cached_data = rd.get("nfl_data")
-    if cached_data:
+    if count_plays():
         logging.info("Data retrieved from Redis cache.")
-        return jsonify(json.loads(cached_data))
+        return _stream_plays()
     return jsonify({"error": "No NFL play-by-play data available"}), 500
 
 
+@app.route('/data/meta', methods=['GET'])
+def data_meta():
+    """
+    Returns the metadata record written at ingest: min/max GameDate, row count,
+    per-season row counts, dataset version and load timestamp, along with the
+    partition manifest (first/last GameDate and rows of each SeasonYear).
+    Args: None
+    Returns: The metadata record or an error message.
+    """
+    meta = get_dataset_meta()
+    if meta:
+        return jsonify({**meta, "partitions": get_partitions()}), 200
+    return jsonify({"error": "No NFL play-by-play data available"}), 404
+
+
 @app.route('/data', methods=['DELETE'])
 def delete():
     """
@@ -124,7 +256,12 @@ def delete():
     Returns: A message regarding the outcome of the function.
     """
     logging.debug("Request to delete NFL play-by-play data received.")
-    deleted_data = rd.delete("nfl_data")
+    if not lock_dataset():
+        return jsonify({"error": "Another load of the play data is running"}), 409
+    try:
+        deleted_data = delete_plays()
+    finally:
+        unlock_dataset()
     if deleted_data > 0:
         logging.info("NFL play-by-play data deleted from Redis cache.")
         return "", 204  # No Content (successful delete)
@@ -135,44 +272,28 @@ def delete():
 @app.route('/plays', methods=['GET'])
 def load_plays():
     """
-    Loads data from CSV into Redis and returns the data immediately.
+    Returns every play, reloading first only if the files the stored plays
+    came from (CSV_FILE_PATH when nothing is loaded yet) changed since the last load. The encoded response is kept per dataset
+    version so repeated polls skip both the CSV and Redis. With ?season= only
+    that season's partition is read and streamed (see `_stream_plays`).
     """
+    global _plays_snapshot
     try:
-        # Load CSV data into a pandas DataFrame
-        df = pd.read_csv(CSV_FILE_PATH)
-
-        required_columns = ['Formation', 'PlayType', 'Description', 'RushDirection', 'PassType']
-        if not all(col in df.columns for col in required_columns):
-            return jsonify({"error": "CSV file is missing required columns"}), 400
-
-        df['Formation'] = df['Formation'].fillna('Unknown')
-        df['PlayType'] = df['PlayType'].fillna('Unknown')
-        df['Description'] = df['Description'].fillna('No description')
-        df['RushDirection'] = df['RushDirection'].fillna('Unknown')
-        df['PassType'] = df['PassType'].fillna('Unknown')
-
-        # ✅ Safely parse GameDate and convert to string
-        df['GameDate'] = pd.to_datetime(df['GameDate'], errors='coerce')  # convert invalid dates to NaT
-        df['GameDate'] = df['GameDate'].fillna(pd.Timestamp("1900-01-01"))  # fallback
-        df['GameDate'] = df['GameDate'].dt.strftime('%Y-%m-%d')  # convert to string
-
-        df['play_id'] = range(1, len(df) + 1)
-
-        selected_columns = [
-            'play_id', 'GameId', 'GameDate', 'Quarter', 'Minute', 'Second', 'OffenseTeam', 'DefenseTeam',
-            'Down', 'ToGo', 'YardLine', 'SeriesFirstDown', 'NextScore', 'Description', 'TeamWin',
-            'SeasonYear', 'Yards', 'Formation', 'PlayType', 'IsRush', 'IsPass', 'IsIncomplete',
-            'IsTouchdown', 'PassType', 'IsSack', 'IsChallenge', 'IsChallengeReversed', 'Challenger',
-            'IsMeasurement', 'IsInterception', 'IsFumble', 'IsPenalty', 'IsTwoPointConversion',
-            'IsTwoPointConversionSuccessful', 'RushDirection', 'YardLineFixed', 'YardLineDirection',
-            'IsPenaltyAccepted', 'PenaltyTeam', 'IsNoPlay', 'PenaltyType', 'PenaltyYards'
-        ]
+        rebuilt = ensure_snapshot(CSV_FILE_PATHS)
+        if request.args.get("season"):
+            response = _stream_plays()
+            response.status_code = 201 if rebuilt else 200
+            return response
+        version = get_dataset_version()
 
-        data = df[selected_columns].to_dict(orient='records')
-        rd.set("nfl_data", json.dumps(data))
+        if _plays_snapshot.get("version") != version:
+            body = app.json.dumps([expand_play(p) for p in iter_plays()], separators=(",", ":"))
+            _plays_snapshot = {"version": version, "body": body}
 
-        return jsonify(data), 201
+        return app.response_class(_plays_snapshot["body"], mimetype="application/json"), (201 if rebuilt else 200)
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Failed to load and return data: {str(e)}"}), 500
 
@@ -185,28 +306,25 @@ def get_play_structure(play_id):
     Also includes rush direction or pass type if applicable.
     """
     logging.debug(f"Request to retrieve play with play_id: {play_id}")
-    cached_data = rd.get("nfl_data")
-    
-    if not cached_data:
+    if not count_plays():
         return jsonify({"error": "No play structure data available"}), 500
 
-    data = json.loads(cached_data)
-
-    for item in data:
-        if str(item.get("play_id")) == str(play_id):
-            play_info = {
-                "play_id": item.get("play_id"),
-                "formation": item.get("Formation"),
-                "play_type": item.get("PlayType"),
-                "description": item.get("Description")
-            }
+    item = get_play(play_id)
+    if item:
+        item = expand_play(item)
+        play_info = {
+            "play_id": item.get("play_id"),
+            "formation": item.get("Formation"),
+            "play_type": item.get("PlayType"),
+            "description": item.get("Description")
+        }
 
-            if item.get("PlayType", "").lower() == "rush":
-                play_info["rush_direction"] = item.get("RushDirection")
-            elif item.get("PlayType", "").lower() == "pass":
-                play_info["pass_type"] = item.get("PassType")
+        if item.get("PlayType", "").lower() == "rush":
+            play_info["rush_direction"] = item.get("RushDirection")
+        elif item.get("PlayType", "").lower() == "pass":
+            play_info["pass_type"] = item.get("PassType")
 
-            return jsonify(play_info), 200
+        return jsonify(play_info), 200
 
     return jsonify({"error": f"Play ID {play_id} not found"}), 404
 
@@ -215,24 +333,16 @@ def get_play_structure(play_id):
 @app.route('/plays/pass', methods=['GET'])
 def pass_pull():
     """
-    Retrieves a specific play structure based off the unique play_id.
-    Args: play_id (str): The unique identifier of the play.
-    Returns: A JSON response containing the play details or an error message if not found.
+    Retrieves every pass play, read through the PASS PlayType index.
+    Supports the `limit`, `cursor`, `season` and `format=ndjson` query parameters (see `_stream_plays`).
+    Returns: A JSON response containing the pass plays or an error message.
     """
     try:
         logging.debug(f"Request to retrieve play structure for passes received.")
-        cached_data = rd.get("nfl_data")
-        if cached_data:
+        if count_plays():
             logging.info("Data retrieved from Redis cache.")
-            data = json.loads(cached_data)
-            
-            pass_list = []
-            
-            # Search for the play with the provided play_id
-            for item in data:
-                if item.get("PlayType") == "PASS":
-                    pass_list.append(item)
-            return jsonify(pass_list), 200
+            return _stream_plays("PASS"), 200
+        return jsonify({"error": "No NFL play-by-play data available"}), 500
     except Exception as e:
         return jsonify({"error": f"Error: {e}"}), 404
     
@@ -240,24 +350,16 @@ def pass_pull():
 @app.route('/plays/rush', methods=['GET'])
 def rush_pull():
     """
-    Retrieves a specific play structure based off the unique play_id.
-    Args: play_id (str): The unique identifier of the play.
-    Returns: A JSON response containing the play details or an error message if not found.
+    Retrieves every rush play, read through the RUSH PlayType index.
+    Supports the `limit`, `cursor`, `season` and `format=ndjson` query parameters (see `_stream_plays`).
+    Returns: A JSON response containing the rush plays or an error message.
     """
     try:
         logging.debug(f"Request to retrieve play structure for rush received.")
-        cached_data = rd.get("nfl_data")
-        if cached_data:
+        if count_plays():
             logging.info("Data retrieved from Redis cache.")
-            data = json.loads(cached_data)
-            
-            rush_list = []
-            
-            # Search for the play with the provided play_id
-            for item in data:
-                if item.get("PlayType") == "RUSH":
-                    rush_list.append(item)
-            return jsonify(rush_list), 200
+            return _stream_plays("RUSH"), 200
+        return jsonify({"error": "No NFL play-by-play data available"}), 500
     except Exception as e:
         return jsonify({"error": f"Error: {e}"}), 404
 
@@ -272,11 +374,12 @@ def create_job():
         
         data = request.get_json()
 
-        # Load and parse Redis data
-        cached_data = json.loads(rd.get("nfl_data"))
-        df = pd.DataFrame(cached_data)
-        oldest_date = df['GameDate'].min()
-        newest_date = df['GameDate'].max()
+        # Validate against the metadata record written at ingest
+        meta = get_dataset_meta()
+        if not meta:
+            return jsonify({"error": "No NFL play-by-play data available"}), 500
+        oldest_date = meta['min_date']
+        newest_date = meta['max_date']
 
         if not data or "start_date" not in data or "end_date" not in data:
             logging.warning("Missing start_date or end_date — defaulting to full range.")
@@ -295,9 +398,21 @@ def create_job():
                 "error": "Dates must be in YYYY-MM-DD format and within dataset range."
             }), 400
 
-        job = add_job(data["start_date"], data["end_date"])
+        priority = data.get("priority")
+        if priority is not None and priority not in PRIORITIES:
+            return jsonify({"error": f"priority must be one of {', '.join(PRIORITIES)}"}), 400
+
+        # Optional generic analysis: group-by dimensions and metrics instead of the injury combos
+        analysis = None
+        if data.get("group_by") is not None or data.get("metrics") is not None:
+            try:
+                analysis = parse_analysis(data.get("group_by"), data.get("metrics"))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
+        job = add_job(data["start_date"], data["end_date"], priority=priority, analysis=analysis)
         logging.info(f"New job submitted: {job['id']} | Start: {data['start_date']} | End: {data['end_date']}")
-        return jsonify({"job_id": job['id'], "status": job["status"]}), 201
+        return jsonify({"job_id": job['id'], "status": job["status"], "priority": job.get("priority")}), 201
 
     except Exception as e:
         logging.error(f"Exception in create_job: {str(e)}")
@@ -305,29 +420,134 @@ def create_job():
 
 
 
+@app.route('/jobs/batch', methods=['POST'])
+def create_batch():
+    """
+    Submits many date ranges at once. Each range becomes its own job, but the
+    worker evaluates all of them in a single pass over the data.
+
+    Request body: {"ranges": [{"start_date": "YYYY-MM-DD", "end_date": "YYYY-MM-DD"}, ...],
+                   "priority": "high" | "low" (optional)}
+
+    Returns: A JSON response with the batch ID and one job ID per range, in
+        request order, or an error message if something goes wrong.
+    """
+    logging.debug("Batch job creation request received.")
+    try:
+        if not request.is_json:
+            return jsonify({"error": "Request must be JSON"}), 400
+
+        data = request.get_json()
+        ranges = data.get("ranges") if isinstance(data, dict) else None
+        if not isinstance(ranges, list) or not ranges:
+            return jsonify({"error": "ranges must be a non-empty list of {start_date, end_date} objects"}), 400
+        if len(ranges) > MAX_BATCH_RANGES:
+            return jsonify({"error": f"A batch can hold at most {MAX_BATCH_RANGES} ranges"}), 400
+
+        # Validate against the metadata record written at ingest
+        meta = get_dataset_meta()
+        if not meta:
+            return jsonify({"error": "No NFL play-by-play data available"}), 500
+
+        pairs = []
+        for i, date_range in enumerate(ranges):
+            try:
+                start, end = date_range["start_date"], date_range["end_date"]
+                datetime.strptime(start, "%Y-%m-%d")
+                datetime.strptime(end, "%Y-%m-%d")
+
+                if start > end or start < meta['min_date'] or end > meta['max_date']:
+                    raise ValueError("Dates are out of bounds.")
+            except Exception as e:
+                logging.warning(f"Invalid range {i} in batch: {e}")
+                return jsonify({
+                    "error": f"Range {i}: dates must be in YYYY-MM-DD format, in order and within dataset range."
+                }), 400
+            pairs.append((start, end))
+
+        priority = data.get("priority")
+        if priority is not None and priority not in PRIORITIES:
+            return jsonify({"error": f"priority must be one of {', '.join(PRIORITIES)}"}), 400
+
+        batch, jobs = add_batch(pairs, priority=priority)
+        logging.info(f"New batch submitted: {batch['id']} | {len(jobs)} ranges")
+        return jsonify({
+            "batch_id": batch['id'],
+            "status": batch['status'],
+            "priority": batch['priority'],
+            "jobs": [
+                {"job_id": job['id'], "start_date": job['start'], "end_date": job['end'], "status": job['status']}
+                for job in jobs
+            ]
+        }), 201
+
+    except Exception as e:
+        logging.error(f"Exception in create_batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/jobs', methods=['GET'])
 def list_jobs():
     """
-    Lists all submitted job IDs stored in Redis.
+    Lists submitted job IDs in submission order, read from the job registry.
+
+    Query parameters:
+        status (str): Only list jobs with this status.
+        since (str): Only list jobs submitted after this time (Unix seconds or ISO 8601).
+        limit (int): Page size, default 100 and at most 1000.
+        cursor (str): The next_cursor returned with the previous page.
     
-    Returns: A JSON response of job IDs stored in Redis, or an error message if something goes wrong.
+    Returns: A JSON response of job IDs and the next page cursor, or an error message if something goes wrong.
     """
     try:
-        keys = jdb.keys('*')  # <- read from the actual jobs DB
-        job_ids = [k.decode() if isinstance(k, bytes) else k for k in keys]
+        limit = min(request.args.get("limit", 100, type=int), 1000)
+        cursor = request.args.get("cursor")
+        since = request.args.get("since")
+        if since is not None:
+            try:
+                since = float(since)
+            except ValueError:
+                try:
+                    since = datetime.fromisoformat(since).timestamp()
+                except ValueError:
+                    return jsonify({"error": "since must be Unix seconds or an ISO 8601 time"}), 400
+
+        job_ids, next_cursor = list_job_ids(request.args.get("status"), since, max(limit, 0), cursor)
         logging.info(f"Returning {len(job_ids)} jobs from Redis.")
-        return jsonify({"jobs": job_ids}), 200
+        return jsonify({"jobs": job_ids, "next_cursor": next_cursor}), 200
+    except ValueError as e:
+        return jsonify({"error": f"Invalid cursor: {e}"}), 400
     except Exception as e:
         logging.error(f"Error listing jobs: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/jobs/stats', methods=['GET'])
+def job_stats():
+    """
+    Returns how many job submissions were answered by an existing result or
+    attached to an identical in-flight job instead of being queued, and how
+    many tasks wait in each queue.
+    
+    Returns: A JSON response with the reuse and coalescing counters and queue depths.
+    """
+    try:
+        return jsonify(get_job_stats()), 200
+    except Exception as e:
+        logging.error(f"Error reading job stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/jobs/<jobid>', methods=['GET'])
 def get_job(jobid: str):
     """
     Retrieves a specific job status by its unique jobid.
     
     Args: jobid (str) - The unique identifier of the job request.
+
+    Query parameters:
+        profile (bool): Include the job's per-stage timings, and its cProfile
+            report if the job was sampled.
     
     Returns: JSON response with job data and status, or an error message if not found.
     """
@@ -336,7 +556,16 @@ def get_job(jobid: str):
         job = get_job_by_id(jobid)
         if job:
             logging.info(f"Job {jobid} retrieved successfully.")
+            if request.args.get("profile", "").lower() in ("1", "true", "yes"):
+                cprofile = get_job_cprofile(jobid)
+                if cprofile:
+                    job["cprofile"] = cprofile
+            else:
+                job.pop("profile", None)
             return jsonify(job), 200
+        elif job_expired(jobid):
+            logging.info(f"Job {jobid} has expired.")
+            return jsonify({"error": f"Job {jobid} has expired", "status": "expired"}), 410
         else:
             logging.warning(f"Job {jobid} not found.")
             return jsonify({"error": "Job not found"}), 404
@@ -345,6 +574,153 @@ def get_job(jobid: str):
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route('/workers', methods=['GET'])
+def list_workers():
+    """
+    Returns the latest report of every worker heard from recently: its pool
+    size, tasks running and prefetched, tasks done and utilization.
+    
+    Returns: A JSON response with one report per worker.
+    """
+    try:
+        return jsonify({"workers": get_worker_stats()}), 200
+    except Exception as e:
+        logging.error(f"Error reading worker stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def _sse(event, data, event_id=None):
+    """
+    Formats one Server-Sent Event.
+
+    Args:
+        event (str): The event type.
+        data: The JSON-serializable payload.
+        event_id (str, optional): The event ID, echoed back as Last-Event-ID on reconnect.
+
+    Returns:
+        str: The encoded event.
+    """
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {app.json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+@app.route('/jobs/<jobid>/events', methods=['GET'])
+def job_events(jobid: str):
+    """
+    Streams a job's status changes and progress (plays scanned, percent done
+    and running partial counts) as Server-Sent Events, ending with a "result"
+    event once the job completes, so clients do not need to poll.
+
+    Args: jobid (str) - The unique identifier of the job request.
+
+    Returns: A text/event-stream response, or an error message if the job is not found.
+    """
+    job = get_job_by_id(jobid)
+    if not job:
+        if job_expired(jobid):
+            return jsonify({"error": f"Job {jobid} has expired", "status": "expired"}), 410
+        return jsonify({"error": "Job not found"}), 404
+    after = request.headers.get("Last-Event-ID", "0")
+
+    def finish(status):
+        if status == "complete":
+            result = get_result(jobid)
+            if result:
+                return _sse("result", decode(result))
+        return _sse("end", {"status": status})
+
+    def generate():
+        last_id = after
+        if last_id == "0":
+            yield _sse("status", {"status": job["status"]})
+            if job["status"] in ("complete", "failed"):
+                yield finish(job["status"])
+                return
+        while True:
+            events = read_events(jobid, last_id, block_ms=SSE_KEEPALIVE * 1000)
+            for event_id, event, data in events:
+                last_id = event_id
+                yield _sse(event, data, event_id)
+                if event == "status" and data["status"] in ("complete", "failed"):
+                    yield finish(data["status"])
+                    return
+            if not events:
+                # The stream may have been trimmed or expired; fall back to the record
+                current = get_job_by_id(jobid)
+                if not current or current["status"] in ("complete", "failed"):
+                    yield finish(current["status"] if current else "expired")
+                    return
+                yield ": keep-alive\n\n"
+
+    logging.info(f"Streaming events for job {jobid}.")
+    return app.response_class(generate(), mimetype="text/event-stream",
+                              headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Returns metrics in the Prometheus text format: this API process's request
+    counts and latency per route, queue depths, job counts by status, job
+    latency and run time histograms and per-worker counters pushed to Redis
+    by the workers, result retention, and Redis latency, keys and bytes per db.
+
+    Returns: A text/plain response in the Prometheus exposition format.
+    """
+    try:
+        job_stats = get_job_stats()
+        result_stats = get_result_stats()
+        workers = get_worker_stats()
+        worker_fields = [
+            ("worker_concurrency", "gauge", "concurrency", "Tasks a worker runs at once."),
+            ("worker_running_tasks", "gauge", "running", "Tasks a worker is running."),
+            ("worker_prefetched_tasks", "gauge", "prefetched", "Tasks a worker holds ahead of a free slot."),
+            ("worker_utilization_ratio", "gauge", "utilization", "Share of a worker's slot time spent running tasks."),
+            ("worker_tasks_done_total", "counter", "tasks_done", "Tasks a worker has finished."),
+            ("worker_tasks_failed_total", "counter", "tasks_failed", "Tasks that raised in a worker."),
+            ("worker_busy_seconds_total", "counter", "busy_seconds", "Seconds a worker has spent running tasks."),
+        ]
+
+        lines = metrics.request_metrics()
+        lines += metrics.family("queue_depth", "gauge", "Tasks waiting in each queue.",
+                                [({"queue": name}, depth) for name, depth in job_stats["queue_depths"].items()])
+        lines += metrics.family("jobs", "gauge", "Registered jobs by status.",
+                                [({"status": status}, n) for status, n in count_jobs_by_status().items()])
+        lines += metrics.family("job_reuse_hits_total", "counter", "Jobs answered from a finished job's result.",
+                                [({}, job_stats["reuse_hits"])])
+        lines += metrics.family("job_coalesce_hits_total", "counter", "Jobs attached to an identical in-flight job.",
+                                [({}, job_stats["coalesce_hits"])])
+        lines += metrics.shared_metrics()
+        for name, kind, field, help_text in worker_fields:
+            lines += metrics.family(name, kind, help_text,
+                                    [({"worker": w["worker_id"]}, w.get(field, 0)) for w in workers])
+        lines += metrics.family("results_bytes", "gauge", "Bytes of stored job results.",
+                                [({}, result_stats["bytes_held"])])
+        lines += metrics.family("results_evictions_total", "counter", "Results evicted to stay within the byte budget.",
+                                [({}, result_stats["evictions"])])
+        lines += metrics.redis_metrics({0: rd, 1: qdb, 2: jdb, 3: results_db})
+        return app.response_class(metrics.render(lines), mimetype="text/plain; version=0.0.4")
+    except Exception as e:
+        logging.error(f"Error rendering metrics: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/results/stats', methods=['GET'])
+def result_stats():
+    """
+    Returns how many results and result bytes are held, the byte budget and
+    how many results were evicted to stay within it.
+    
+    Returns: A JSON response with the result retention stats.
+    """
+    try:
+        return jsonify(get_result_stats()), 200
+    except Exception as e:
+        logging.error(f"Error reading result stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/results/<jobid>', methods=['GET'])
 def get_injury_summary(jobid: str):
     """
@@ -354,17 +730,25 @@ def get_injury_summary(jobid: str):
     logging.debug(f"Fetching analysis result for job {jobid}")
     try:
         # Check if result already cached
-        result = results_db.get(jobid)
+        result = get_result(jobid)
         if result:
             logging.info(f"Returning cached result for job {jobid}")
-            return jsonify(json.loads(result)), 200
+            return jsonify(decode(result)), 200
 
         # Get job metadata
-        job_data_raw = jdb.get(jobid)
-        if not job_data_raw:
+        job_data = get_job_by_id(jobid)
+        if not job_data:
+            if job_expired(jobid):
+                return jsonify({"error": f"Job {jobid} and its result have expired", "status": "expired"}), 410
             return jsonify({"error": "Job ID not found"}), 404
 
-        job_data = json.loads(job_data_raw)
+        if job_data.get("type") == "batch":
+            # A batch has no result of its own; each range is a job with its own result
+            return jsonify({
+                "batch_id": jobid,
+                "status": job_data.get("status", "unknown"),
+                "jobs": job_data.get("jobs", [])
+            }), 200
 
         if job_data.get("status") != "complete":
             return jsonify({
@@ -372,14 +756,11 @@ def get_injury_summary(jobid: str):
                 "status": job_data.get("status", "unknown")
             }), 202
 
-        output = {
-            "job_id": jobid,
-            "start_date": job_data.get("start"),
-            "end_date": job_data.get("end"),
-            "injury_combo_counts": job_data.get("injury_combo_counts", {})
-        }
-
-        return jsonify(output), 200
+        # The job finished but its result has since expired or been evicted
+        return jsonify({
+            "error": f"The result of job {jobid} has expired; submit the job again.",
+            "status": "expired"
+        }), 410
 
     except Exception as e:
         logging.error(f"Unexpected error in get_injury_summary({jobid}): {e}")
@@ -0,0 +1,75 @@
+import os
+import json
+import zlib
+import msgpack
+
+# Encoded values start with MAGIC followed by a one-byte format tag. MAGIC is a
+# byte msgpack never emits and JSON text never starts with, so untagged values
+# written before the codec existed are still read as plain JSON.
+MAGIC = b"\xc1"
+FORMAT_MSGPACK = 1
+FORMAT_MSGPACK_ZLIB = 2
+
+CODEC = os.environ.get("STORAGE_CODEC", "msgpack")  # "msgpack" or "json"
+COMPRESS_MIN_BYTES = int(os.environ.get("STORAGE_COMPRESS_MIN_BYTES", 256))
+
+
+def _default(obj):
+    """
+    Convert values msgpack cannot pack natively (e.g. numpy scalars).
+
+    Args:
+        obj: The value msgpack could not pack.
+
+    Returns:
+        A plain Python equivalent of `obj`.
+    """
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError(f"Cannot encode object of type {type(obj).__name__}")
+
+
+def encode(obj, codec=None):
+    """
+    Encode a value for storage in Redis. With the msgpack codec the payload
+    is zlib-compressed when it is large enough for that to pay off.
+
+    Args:
+        obj: A JSON-compatible value.
+        codec (str, optional): "msgpack" or "json"; defaults to STORAGE_CODEC.
+
+    Returns:
+        bytes or str: The encoded value.
+    """
+    if (codec or CODEC) == "json":
+        return json.dumps(obj)
+
+    packed = msgpack.packb(obj, default=_default, use_bin_type=True)
+    if len(packed) >= COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(packed)
+        if len(compressed) < len(packed):
+            return MAGIC + bytes([FORMAT_MSGPACK_ZLIB]) + compressed
+    return MAGIC + bytes([FORMAT_MSGPACK]) + packed
+
+
+def decode(raw):
+    """
+    Decode a value read from Redis, whichever format it was written in.
+
+    Args:
+        raw (bytes or str): The stored value.
+
+    Returns:
+        The decoded value.
+    """
+    if isinstance(raw, str):
+        return json.loads(raw)
+    if not raw.startswith(MAGIC):
+        return json.loads(raw)
+
+    tag, payload = raw[1], raw[2:]
+    if tag == FORMAT_MSGPACK_ZLIB:
+        payload = zlib.decompress(payload)
+    elif tag != FORMAT_MSGPACK:
+        raise ValueError(f"Unknown storage format tag {tag}")
+    return msgpack.unpackb(payload, raw=False, strict_map_key=False)
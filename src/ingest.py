@@ -0,0 +1,686 @@
+import os
+import time
+import hashlib
+import logging
+import resource
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from datetime import datetime, timezone
+import pandas as pd
+from storage import (
+    save_plays,
+    save_rollups,
+    mark_rollups_ready,
+    get_dataset_source,
+    set_dataset_source,
+    set_dataset_meta,
+    bump_dataset_version,
+    count_plays,
+    iter_plays,
+    get_plays,
+    date_ordinal,
+    play_season,
+    date_bounds,
+    max_play_id,
+    rollups_ready,
+    remove_rollups,
+    save_games,
+    delete_games,
+    get_game_fingerprints,
+    get_game_play_ids,
+    get_dataset_version,
+    delete_rollups,
+    get_dataset_meta,
+    refresh_partitions,
+    discard_staged,
+    publish_staged,
+    register_injury_keywords,
+    get_injury_tags,
+    set_injury_tags,
+    lock_injury_tagging,
+    unlock_injury_tagging,
+    lock_dataset,
+    unlock_dataset,
+    category_codes,
+    column_categories,
+    ordinal_date,
+    CATEGORY_DICTIONARIES,
+    MISSING_CODE
+)
+from analysis import (
+    plays_frame,
+    day_partials,
+    parse_game_dates,
+    injury_flags,
+    keyword_mask,
+    CATEGORY_COLUMNS,
+    EPOCH_ORDINAL,
+    INJURY_KEYWORDS
+)
+
+log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=getattr(logging, log_level))
+
+CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", 10000))
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 4))  # CSV files (e.g. seasons) loaded at once
+
+REQUIRED_COLUMNS = ['GameId', 'GameDate', 'SeasonYear', 'Formation', 'PlayType', 'Description', 'RushDirection', 'PassType']
+SCHEMA_VERSION = 4  # bumped whenever the stored (normalized) form of a play changes
+
+SELECTED_COLUMNS = [
+    'play_id', 'GameId', 'GameDate', 'Quarter', 'Minute', 'Second', 'OffenseTeam', 'DefenseTeam',
+    'Down', 'ToGo', 'YardLine', 'SeriesFirstDown', 'NextScore', 'Description', 'TeamWin',
+    'SeasonYear', 'Yards', 'Formation', 'PlayType', 'IsRush', 'IsPass', 'IsIncomplete',
+    'IsTouchdown', 'PassType', 'IsSack', 'IsChallenge', 'IsChallengeReversed', 'Challenger',
+    'IsMeasurement', 'IsInterception', 'IsFumble', 'IsPenalty', 'IsTwoPointConversion',
+    'IsTwoPointConversionSuccessful', 'RushDirection', 'YardLineFixed', 'YardLineDirection',
+    'IsPenaltyAccepted', 'PenaltyTeam', 'IsNoPlay', 'PenaltyType', 'PenaltyYards'
+]
+FLAG_COLUMNS = [c for c in SELECTED_COLUMNS if c.startswith('Is')]
+TEXT_COLUMNS = [
+    'GameDate', 'OffenseTeam', 'DefenseTeam', 'Description', 'Formation', 'PlayType', 'PassType',
+    'Challenger', 'RushDirection', 'YardLineDirection', 'PenaltyTeam', 'PenaltyType'
+]
+NUMERIC_COLUMNS = [c for c in SELECTED_COLUMNS if c not in TEXT_COLUMNS and c != 'play_id']
+DERIVED_COLUMNS = ['InjuryFlags']  # computed at ingest, stored after the CSV columns
+
+
+class LoadInProgress(RuntimeError):
+    """Raised when the plays cannot be changed because another load holds the dataset lock."""
+
+
+def _peak_rss_mb():
+    """
+    Return the peak resident set size of this process in megabytes.
+
+    Args: none
+
+    Returns:
+        float: Peak RSS in MB.
+    """
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _file_sha256(csv_path, block_size=1 << 20):
+    """
+    Hash the contents of a file without reading it into memory at once.
+
+    Args:
+        csv_path (str): Path of the file.
+        block_size (int, optional): Number of bytes read per block.
+
+    Returns:
+        str: The hex SHA-256 digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(csv_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_stat(csv_path):
+    """
+    Return the modification time and size of a file.
+
+    Args:
+        csv_path (str): Path of the file.
+
+    Returns:
+        dict: The path, mtime (nanoseconds) and size (bytes) as strings.
+    """
+    st = os.stat(csv_path)
+    return {"path": str(csv_path), "mtime": str(st.st_mtime_ns), "size": str(st.st_size)}
+
+
+def _csv_paths(csv_paths):
+    """Return one CSV path or an iterable of them as a list."""
+    if isinstance(csv_paths, (str, os.PathLike)):
+        return [csv_paths]
+    return list(csv_paths)
+
+
+def _source_stat(csv_paths):
+    """
+    Return the source record fields of one or more files. Several files are
+    joined with os.pathsep, so a single file gives the same record as `_file_stat`.
+
+    Args:
+        csv_paths (list): Paths of the files.
+
+    Returns:
+        dict: The path(s), mtime(s) and size(s) as strings.
+    """
+    stats = [_file_stat(path) for path in csv_paths]
+    return {field: os.pathsep.join(st[field] for st in stats) for field in ("path", "mtime", "size")}
+
+
+def _source_sha256(csv_paths):
+    """
+    Hash the contents of one or more files.
+
+    Args:
+        csv_paths (list): Paths of the files.
+
+    Returns:
+        str: The hex SHA-256 digest of a single file, or of the files' digests.
+    """
+    digests = [_file_sha256(path) for path in csv_paths]
+    if len(digests) == 1:
+        return digests[0]
+    return hashlib.sha256("".join(digests).encode()).hexdigest()
+
+
+def _check_columns(csv_path):
+    """
+    Read only the CSV header and make sure the required columns are present.
+
+    Args:
+        csv_path (str): Path of the CSV file.
+
+    Returns:
+        None
+    """
+    columns = pd.read_csv(csv_path, nrows=0).columns
+    logging.debug(f"CSV Columns: {columns.tolist()}")
+    if not all(col in columns for col in REQUIRED_COLUMNS):
+        logging.error(f"CSV file is missing required columns. Found columns: {columns}")
+        raise ValueError("CSV file is missing required columns")
+
+
+def _encode_categories(df):
+    """
+    Replace each categorical column of a chunk with its dictionary codes
+    (see storage.CATEGORY_DICTIONARIES), MISSING_CODE where a value is missing.
+
+    Args:
+        df (DataFrame): A chunk of CSV rows, modified in place.
+
+    Returns:
+        None
+    """
+    for column, name in CATEGORY_DICTIONARIES.items():
+        values = df[column].where(df[column].notna(), None)
+        values = values.map(lambda v: v if v is None else str(v))
+        codes = category_codes(name, [v for v in values.dropna().unique()])
+        df[column] = values.map(codes).fillna(MISSING_CODE).astype('int32')
+
+
+def normalize_chunk(df, first_play_id, keywords=INJURY_KEYWORDS):
+    """
+    Turn one chunk of raw CSV rows into plays in the canonical stored form:
+    GameDate as an integer day ordinal (0 when it cannot be parsed), PlayType
+    upper-cased, categorical columns as dictionary codes, the Is* flags as
+    small integers and the injury keywords found in Description as the
+    InjuryFlags bitmask. Every ingest path goes through here, so readers never
+    have to parse dates or strings.
+
+    Args:
+        df (DataFrame): A chunk of raw CSV rows.
+        first_play_id (int): The play_id given to the first row of the chunk.
+        keywords (list, optional): Injury keywords, indexed by bit.
+
+    Returns:
+        list: The normalized plays as dictionaries.
+    """
+    play_type = df['PlayType']
+    df['PlayType'] = play_type.where(play_type.isna(), play_type.astype(str).str.strip().str.upper())
+    for column in ('Formation', 'PlayType', 'RushDirection', 'PassType'):
+        df[column] = df[column].fillna('Unknown')
+    df['Description'] = df['Description'].fillna('No description')
+    df['InjuryFlags'] = injury_flags(df['Description'], keywords)
+
+    dates = parse_game_dates(df['GameDate'])
+    days_since_epoch = dates.values.astype('datetime64[D]').astype('int64') + EPOCH_ORDINAL
+    df['GameDate'] = pd.Series(days_since_epoch, index=df.index).where(dates.notna(), 0).astype('int32')
+
+    _encode_categories(df)
+    for column in FLAG_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0).astype('int8')
+
+    df['play_id'] = range(first_play_id, first_play_id + len(df))
+    return df[SELECTED_COLUMNS + DERIVED_COLUMNS].to_dict(orient='records')
+
+
+def _read_chunks(csv_path, chunk_size):
+    """
+    Read a CSV in chunks with every column as text, so values (and the game
+    fingerprints taken from them) do not depend on how pandas would infer
+    each chunk's types. Use `_coerce_types` before normalizing a chunk.
+
+    Args:
+        csv_path (str): Path of the CSV file.
+        chunk_size (int): Number of CSV rows read per chunk.
+
+    Returns:
+        iterator: DataFrame chunks.
+    """
+    return pd.read_csv(csv_path, chunksize=chunk_size, dtype=str)
+
+
+def _coerce_types(df):
+    """
+    Convert the numeric columns of a chunk read by `_read_chunks`, in place.
+
+    Args:
+        df (DataFrame): A chunk of CSV rows.
+
+    Returns:
+        None
+    """
+    for column in NUMERIC_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+
+
+def _fingerprint_games(df, digests):
+    """
+    Fold the rows of a chunk into per-game fingerprints, so a game whose rows
+    did not change can be recognized in a later file. Rows without a GameId
+    belong to no game.
+
+    Args:
+        df (DataFrame): A chunk read by `_read_chunks`, before `_coerce_types`.
+        digests (dict): GameId -> running hashlib digest, updated in place.
+
+    Returns:
+        None
+    """
+    row_hashes = pd.util.hash_pandas_object(df.fillna(""), index=False).to_numpy()
+    for game_id, rows in df.groupby('GameId', sort=False).indices.items():
+        digests.setdefault(game_id, hashlib.sha1()).update(row_hashes[rows].tobytes())
+
+
+def _load_chunk(df, first_play_id, keywords, injury_mask, seasons, staging=False):
+    """
+    Normalize and store one chunk of plays, adding them to the game sets and
+    the per-day rollups.
+
+    Args:
+        df (DataFrame): A chunk read by `_read_chunks`.
+        first_play_id (int): The play_id given to the first row of the chunk.
+        keywords (list): Injury keywords, indexed by bit.
+        injury_mask (int): InjuryFlags bits that count as an injury.
+        seasons (dict): Season -> play count, updated in place. Seasons come
+            from `play_season`, like the SeasonYear partitions.
+        staging (bool, optional): Write to the staged indexes and rollups.
+
+    Returns:
+        tuple: (plays stored, set of GameDate day ordinals in the chunk).
+    """
+    play_ids = pd.Series(range(first_play_id, first_play_id + len(df)), index=df.index)
+    save_games({}, {game_id: ids.tolist() for game_id, ids in play_ids.groupby(df['GameId'])}, staging)
+
+    _coerce_types(df)
+    plays = normalize_chunk(df, first_play_id, keywords)
+    for play in plays:
+        season = play_season(play, date_ordinal(play['GameDate']))
+        if season is not None:
+            seasons[season] = seasons.get(season, 0) + 1
+    stored = save_plays(plays, staging=staging)
+    save_rollups(day_partials(plays_frame(plays, column_categories(CATEGORY_COLUMNS), injury_mask)), staging)
+
+    dated = df['GameDate'][df['GameDate'] > 0]
+    return stored, {int(day) for day in dated.unique()}
+
+
+def _widen(bounds, first, last):
+    """Return (first, last) day ordinals widened to include another range."""
+    if first is None:
+        return bounds
+    if bounds[0] is None:
+        return first, last
+    return min(bounds[0], first), max(bounds[1], last)
+
+
+def _count_rows(csv_path, chunk_size):
+    """Return the number of rows (plays) in a CSV file, reading only its first column."""
+    return sum(len(chunk) for chunk in pd.read_csv(csv_path, usecols=[0], chunksize=chunk_size, dtype=str))
+
+
+def _load_file(csv_path, chunk_size, first_play_id, keywords, injury_mask):
+    """
+    Load every chunk of one CSV into the staged keys, as part of `ingest_csv`.
+
+    Args:
+        csv_path (str): Path of the CSV file.
+        chunk_size (int): Number of CSV rows read per chunk.
+        first_play_id (int): The play_id of the file's first row.
+        keywords (list): Injury keywords, indexed by bit.
+        injury_mask (int): InjuryFlags bits that count as an injury.
+
+    Returns:
+        dict: rows, chunks, bounds (first and last day ordinals), seasons
+            (season -> play count) and digests (GameId -> fingerprint hash).
+    """
+    started = time.perf_counter()
+    load = {"rows": 0, "chunks": 0, "bounds": (None, None), "seasons": {}, "digests": {}}
+    for chunk in _read_chunks(csv_path, chunk_size):
+        _fingerprint_games(chunk, load["digests"])
+        stored, days = _load_chunk(chunk, first_play_id, keywords, injury_mask, load["seasons"], staging=True)
+        first_play_id += len(chunk)
+        load["rows"] += stored
+        if days:
+            load["bounds"] = _widen(load["bounds"], min(days), max(days))
+        load["chunks"] += 1
+        elapsed = time.perf_counter() - started
+        logging.info(f"Ingested chunk {load['chunks']} of {csv_path}: {load['rows']} rows so far "
+                     f"({load['rows'] / elapsed:.0f} rows/sec).")
+    return load
+
+
+def ingest_csv(csv_paths, chunk_size=CHUNK_SIZE, workers=INGEST_WORKERS):
+    """
+    Stream one or more play-by-play CSVs (e.g. one per season) into Redis one
+    chunk at a time, replacing any previous load. Up to `workers` files are
+    loaded at once; play_ids follow row order across the files, as in a
+    single-file load, so they do not depend on which file finishes first and
+    stay the same when the same files are loaded again.
+    Each thread holds one chunk in memory, so peak memory depends on
+    `chunk_size` and `workers` rather than on the size of the files. Per-day
+    injury rollups, game fingerprints, the SeasonYear partitions and the
+    dataset metadata record are accumulated from each chunk as it is stored.
+    Only one load (or append) runs at a time; LoadInProgress is raised when
+    another one holds the dataset lock.
+
+    Args:
+        csv_paths (str or list): Path of the CSV file, or a list of paths.
+        chunk_size (int, optional): Number of CSV rows read per chunk.
+        workers (int, optional): Number of files loaded in parallel.
+
+    Returns:
+        dict: Ingest statistics (version, files, rows, chunks, seconds, rows_per_sec, peak_rss_mb).
+    """
+    if not lock_dataset():
+        raise LoadInProgress("Another load of the play data is running")
+    try:
+        return _ingest(csv_paths, chunk_size, workers)
+    finally:
+        unlock_dataset()
+
+
+def _ingest(csv_paths, chunk_size, workers):
+    """Body of `ingest_csv`, run while holding the dataset lock."""
+    paths = _csv_paths(csv_paths)
+    for path in paths:
+        _check_columns(path)
+    source = _source_stat(paths)
+    source["sha256"] = _source_sha256(paths)
+    source["schema"] = SCHEMA_VERSION
+    keywords = register_injury_keywords(INJURY_KEYWORDS)
+    injury_mask = keyword_mask(keywords, INJURY_KEYWORDS)
+    discard_staged()
+
+    started = time.perf_counter()
+    first_ids = [1]  # play_id = 1-based row position across the files
+    for path in paths[:-1]:
+        first_ids.append(first_ids[-1] + _count_rows(path, chunk_size))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths)))) as pool:
+        loads = list(pool.map(lambda path, first_id: _load_file(path, chunk_size, first_id, keywords, injury_mask),
+                              paths, first_ids))
+
+    rows = sum(load["rows"] for load in loads)
+    bounds = (None, None)
+    seasons = {}
+    fingerprints = {}
+    for load in loads:
+        bounds = _widen(bounds, *load["bounds"])
+        for season, count in load["seasons"].items():
+            seasons[season] = seasons.get(season, 0) + count
+        fingerprints.update({game_id: digest.hexdigest() for game_id, digest in load["digests"].items()})
+
+    save_games(fingerprints, {}, staging=True)
+    refresh_partitions(staging=True)  # the files' threads may have refreshed shared partitions out of order
+    mark_rollups_ready(staging=True)
+    publish_staged()
+    set_injury_tags(len(keywords), injury_mask)
+    set_dataset_source(source)
+    version = bump_dataset_version()
+    min_date, max_date = bounds
+    set_dataset_meta({
+        "min_date": ordinal_date(min_date) if min_date is not None else "",
+        "max_date": ordinal_date(max_date) if max_date is not None else "",
+        "rows": rows,
+        "seasons": seasons,
+        "version": version,
+        "loaded_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
+    })
+
+    seconds = time.perf_counter() - started
+    stats = {
+        "version": version,
+        "files": len(paths),
+        "rows": rows,
+        "chunks": sum(load["chunks"] for load in loads),
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds) if seconds > 0 else rows,
+        "peak_rss_mb": _peak_rss_mb()
+    }
+    logging.info(f"Ingest of {os.pathsep.join(map(str, paths))} finished: {stats}")
+    return stats
+
+
+def append_csv(csv_path, chunk_size=CHUNK_SIZE):
+    """
+    Add the games of a CSV (e.g. a new week) to the stored plays without
+    reloading the rest. Games are keyed by GameId: games not stored yet are
+    inserted, games whose rows changed replace the stored ones, and unchanged
+    games are skipped. Indexes and rollups are updated in place, and the
+    dataset version bump records only the days that changed, so results for
+    other date ranges stay reusable. The file is read twice (fingerprints,
+    then the changed games), one chunk at a time. Like `ingest_csv`, it
+    raises LoadInProgress while another load holds the dataset lock.
+
+    Args:
+        csv_path (str): Path of the CSV file.
+        chunk_size (int, optional): Number of CSV rows read per chunk.
+
+    Returns:
+        dict: Append statistics (version, games, games_added, games_replaced,
+            rows, rows_removed, seconds).
+    """
+    if not lock_dataset():
+        raise LoadInProgress("Another load of the play data is running")
+    try:
+        return _append(csv_path, chunk_size)
+    finally:
+        unlock_dataset()
+
+
+def _append(csv_path, chunk_size):
+    """Body of `append_csv`, run while holding the dataset lock."""
+    _check_columns(csv_path)
+    started = time.perf_counter()
+    digests = {}
+    for chunk in _read_chunks(csv_path, chunk_size):
+        _fingerprint_games(chunk, digests)
+    fingerprints = {game_id: digest.hexdigest() for game_id, digest in digests.items()}
+    stored = get_game_fingerprints(list(fingerprints))
+    changed = {game_id for game_id, fingerprint in fingerprints.items() if stored.get(game_id) != fingerprint}
+    replaced = sorted(game_id for game_id in changed if game_id in stored)
+    stats = {"version": get_dataset_version(), "games": len(fingerprints), "games_added": len(changed) - len(replaced),
+             "games_replaced": len(replaced), "rows": 0, "rows_removed": 0}
+    if not changed:
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        logging.info(f"Append of {csv_path}: no new or changed games.")
+        return stats
+
+    keywords = register_injury_keywords(INJURY_KEYWORDS)
+    tags = get_injury_tags()
+    injury_mask = tags.get("mask", keyword_mask(keywords, INJURY_KEYWORDS))
+    ready = rollups_ready() or not count_plays()
+    seasons = get_dataset_meta().get("seasons", {})
+    days = set()
+
+    # Take the stored plays of replaced games out of the rollups and season counts
+    old_ids = get_game_play_ids(replaced)
+    for i in range(0, len(old_ids), chunk_size):
+        plays = get_plays(old_ids[i:i + chunk_size])
+        remove_rollups(day_partials(plays_frame(plays, column_categories(CATEGORY_COLUMNS), injury_mask)))
+        for play in plays:
+            ordinal = date_ordinal(play.get('GameDate'))
+            if ordinal is not None:
+                days.add(ordinal)
+            season = play_season(play, ordinal)
+            if seasons.get(season):
+                seasons[season] -= 1
+    stats["rows_removed"] = delete_games(replaced)
+
+    next_id = max_play_id() + 1
+    for chunk in _read_chunks(csv_path, chunk_size):
+        chunk = chunk[chunk['GameId'].isin(changed)].copy()
+        if chunk.empty:
+            continue
+        rows, loaded_days = _load_chunk(chunk, next_id + stats["rows"], keywords, injury_mask, seasons)
+        stats["rows"] += rows
+        days |= loaded_days
+
+    save_games({game_id: fingerprints[game_id] for game_id in changed}, {})
+    if ready:
+        mark_rollups_ready()
+    if not tags:
+        set_injury_tags(len(keywords), injury_mask)
+    version = bump_dataset_version(days)
+    min_date, max_date = date_bounds()
+    set_dataset_meta({
+        "min_date": ordinal_date(min_date) if min_date is not None else "",
+        "max_date": ordinal_date(max_date) if max_date is not None else "",
+        "rows": count_plays(),
+        "seasons": {season: count for season, count in seasons.items() if count > 0},
+        "version": version,
+        "loaded_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
+    })
+
+    stats["version"] = version
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    logging.info(f"Append of {csv_path} finished: {stats}")
+    return stats
+
+
+def _snapshot_current(paths):
+    """
+    Tell whether the stored plays were loaded from the current contents of
+    `paths`. A matching mtime and size is trusted as-is; otherwise the
+    content hash decides. A snapshot stored in an older schema is stale.
+
+    Args:
+        paths (list): Paths of the CSV files.
+
+    Returns:
+        bool: True if no reload is needed.
+    """
+    stored = get_dataset_source()
+    current = _source_stat(paths)
+    if stored.get("path") != current["path"] or stored.get("schema") != str(SCHEMA_VERSION):
+        return False
+    if stored.get("mtime") == current["mtime"] and stored.get("size") == current["size"]:
+        return True
+    if stored.get("sha256") == _source_sha256(paths):
+        logging.info(f"{current['path']} was touched but its contents are unchanged.")
+        set_dataset_source({**stored, **current})
+        return True
+    return False
+
+
+def ensure_snapshot(csv_paths):
+    """
+    Make sure the stored plays reflect the current contents of the files they
+    were loaded from, reloading only when a file has actually changed (see
+    `_snapshot_current`). `csv_paths` is only loaded when nothing is loaded
+    yet; a dataset loaded from other files (e.g. several seasons) or built
+    only by appends, which records no source, is never replaced by it. Only
+    one caller rebuilds: while another load holds the
+    dataset lock the current snapshot is kept as it is, and it stays
+    readable until the new load is published.
+
+    Args:
+        csv_paths (str or list): Path of the CSV file, or a list of paths,
+            loaded when no dataset is stored.
+
+    Returns:
+        bool: True if the plays were reloaded, False if the snapshot was kept.
+    """
+    source = get_dataset_source().get("path")
+    if not source and count_plays():
+        logging.info("The stored plays were not loaded from a CSV snapshot (e.g. appended); keeping them.")
+        return False
+    paths = source.split(os.pathsep) if source else _csv_paths(csv_paths)
+    missing = [path for path in paths if not os.path.isfile(path)]
+    if source and missing:
+        logging.warning(f"Cannot check the snapshot against {', '.join(missing)}: no such file.")
+        return False
+    if _snapshot_current(paths):
+        return False
+    if not lock_dataset():
+        logging.info("Another load of the play data is running; keeping the current snapshot.")
+        return False
+    try:
+        if _snapshot_current(paths) or (not source and count_plays()):  # loaded by the caller that held the lock
+            return False
+        logging.info(f"{os.pathsep.join(map(str, paths))} changed since the last load; rebuilding the snapshot.")
+        _ingest(paths, CHUNK_SIZE, INGEST_WORKERS)
+        return True
+    finally:
+        unlock_dataset()
+
+
+def retag_injuries(keywords=INJURY_KEYWORDS, batch_size=CHUNK_SIZE):
+    """
+    Bring the stored plays in line with the configured injury keywords after
+    they change. Descriptions are only matched again when a keyword without a
+    bit in the stored InjuryFlags was added; dropping keywords just changes
+    the mask. Either way the rollups are rebuilt from the flags and the
+    dataset version is bumped, so results computed with the old keywords are
+    not reused.
+
+    Args:
+        keywords (iterable, optional): The keywords that count as an injury.
+        batch_size (int, optional): Plays re-tagged per batch.
+
+    Returns:
+        bool: True if the plays were re-tagged or the rollups rebuilt.
+    """
+    registered = register_injury_keywords(keywords)
+    injury_mask = keyword_mask(registered, keywords)
+    tags = get_injury_tags()
+    if not count_plays() or tags == {"tagged": len(registered), "mask": injury_mask}:
+        return False
+    if not lock_injury_tagging():
+        logging.info("Another process is re-tagging injuries; skipping.")
+        return False
+    if not lock_dataset():
+        unlock_injury_tagging()
+        logging.info("The play data is being loaded; skipping re-tagging.")
+        return False
+
+    try:
+        started = time.perf_counter()
+        retag = tags.get("tagged", 0) < len(registered)
+        logging.info(f"Injury keywords changed to {list(keywords)}; "
+                     f"{'re-tagging plays and ' if retag else ''}rebuilding rollups.")
+        delete_rollups()
+        plays = iter_plays(batch_size)
+        rows = 0
+        while True:
+            chunk = list(islice(plays, batch_size))
+            if not chunk:
+                break
+            if retag:
+                flags = injury_flags(pd.Series([p.get('Description') for p in chunk]), registered)
+                for play, play_flags in zip(chunk, flags):
+                    play['InjuryFlags'] = int(play_flags)
+                save_plays(chunk)
+            save_rollups(day_partials(plays_frame(chunk, column_categories(CATEGORY_COLUMNS), injury_mask)))
+            rows += len(chunk)
+
+        mark_rollups_ready()
+        set_injury_tags(len(registered), injury_mask)
+        version = bump_dataset_version()
+        meta = get_dataset_meta()
+        if meta:
+            set_dataset_meta({**meta, "version": version})
+        logging.info(f"Injury tags of {rows} plays updated in {time.perf_counter() - started:.1f}s (version {version}).")
+        return True
+    finally:
+        unlock_dataset()
+        unlock_injury_tagging()
@@ -1,9 +1,15 @@
 import os
 import json
+import time
 import uuid
 import redis
+import hashlib
 import logging
+from datetime import datetime
 from hotqueue import HotQueue
+from storage import get_dataset_version, dataset_changed_since, prune_dataset_changes
+from codec import encode, decode
+from metrics import observe_shared
 
 log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(level=logging.DEBUG)
@@ -14,8 +20,45 @@ _redis_port = int(os.environ.get('REDIS_PORT', 6379))
 
 rd = redis.Redis(host=_redis_ip, port=_redis_port, db=0)
 q = HotQueue("queue", host=_redis_ip, port=_redis_port, db=1)
+hq = HotQueue("queue:high", host=_redis_ip, port=_redis_port, db=1)  # cheap / high priority jobs
+sq = HotQueue("subtasks", host=_redis_ip, port=_redis_port, db=1)  # shards of fanned-out jobs
+qdb = redis.Redis(host=_redis_ip, port=_redis_port, db=1)
 jdb = redis.Redis(host=_redis_ip, port=_redis_port, db=2)
-results_db = redis.Redis(host=_redis_ip, port=_redis_port, db=3, decode_responses=True)
+results_db = redis.Redis(host=_redis_ip, port=_redis_port, db=3)
+
+REUSE_HITS_KEY = "stats:reuse_hits"  # jobs answered from a finished job's result
+COALESCE_HITS_KEY = "stats:coalesce_hits"  # jobs attached to an identical in-flight job
+JOBS_BY_TIME_KEY = "jobs:by_time"  # sorted set of job IDs, scored by submission time
+JOB_EXPIRY_KEY = "jobs:expiry"  # sorted set of job IDs whose record has a TTL, scored by expiry time
+JOB_VERSIONS_KEY = "jobs:versions"  # sorted set of live job IDs, scored by the dataset version they saw
+
+# Priority lanes: "high" holds cheap jobs, "low" (the original queue) the rest
+PRIORITIES = ("high", "low")
+HIGH_LANE_MAX_DAYS = int(os.environ.get('HIGH_LANE_MAX_DAYS', 31))  # spans up to this go to "high"
+LANE_STARVATION_LIMIT = int(os.environ.get('LANE_STARVATION_LIMIT', 10))  # "high" tasks in a row before "low" goes first
+HIGH_STREAK_KEY = "lanes:high_streak"  # "high" tasks taken since the last "low" one
+
+# Retention, in seconds. 0 keeps records forever.
+JOB_TTLS = {
+    'complete': int(os.environ.get('JOB_TTL_COMPLETE', 7 * 24 * 3600)),
+    'failed': int(os.environ.get('JOB_TTL_FAILED', 24 * 3600)),
+}
+RESULT_TTL = int(os.environ.get('RESULT_TTL', 7 * 24 * 3600))  # since the result was last read
+RESULTS_MAX_BYTES = int(os.environ.get('RESULTS_MAX_BYTES', 256 * 1024 * 1024))
+REGISTRY_RETENTION = int(os.environ.get('JOB_REGISTRY_RETENTION', 30 * 24 * 3600))
+
+RESULT_LRU_KEY = "results:lru"  # sorted set of job IDs, scored by last read (or write) time
+RESULT_SIZES_KEY = "results:sizes"  # hash of job ID -> stored result size in bytes
+RESULT_BYTES_KEY = "results:bytes"  # total bytes of stored results
+RESULT_EVICTIONS_KEY = "results:evictions"  # results evicted to stay within the byte budget
+
+PROFILE_TTL = int(os.environ.get('JOB_PROFILE_TTL', 24 * 3600))  # stage timings of unfinished jobs
+
+EVENTS_MAXLEN = int(os.environ.get('JOB_EVENTS_MAXLEN', 1000))  # progress events kept per job
+EVENTS_TTL = int(os.environ.get('JOB_EVENTS_TTL', 24 * 3600))  # since the last event
+
+WORKERS_KEY = "workers"  # sorted set of worker IDs, scored by last report time
+WORKER_STALE_AFTER = int(os.environ.get('WORKER_STALE_AFTER', 60))  # seconds without a report
 
 def _generate_jid():
     """
@@ -50,7 +93,9 @@ def _instantiate_job(jid, status, start, end):
             'end': end }
 
 def _save_job(jid, job_dict):
-    """Save a job object in the Redis database.
+    """Save a job object in the Redis database. Complete and failed jobs
+    expire after their configured TTL, which is also recorded in the expiry
+    index so registry reads can skip jobs whose record is gone.
     
     Args:
         jid (str): The job ID.
@@ -60,41 +105,384 @@ def _save_job(jid, job_dict):
         None
     """
     logging.info(f"Saving job {jid} to Redis DB.")
-    jdb.set(jid, json.dumps(job_dict))
+    ttl = JOB_TTLS.get(job_dict.get('status'))
+    pipe = jdb.pipeline()
+    pipe.set(jid, json.dumps(job_dict), ex=ttl or None)
+    if ttl:
+        pipe.zadd(JOB_EXPIRY_KEY, {jid: time.time() + ttl})
+    else:
+        pipe.zrem(JOB_EXPIRY_KEY, jid)
+    pipe.execute()
     return
 
-def _queue_job(jid):
-    """Add a job to the redis queue.
+def _status_key(status):
+    """Return the key of the sorted set holding the job IDs with a given status."""
+    return f"jobs:status:{status}"
+
+def _register_job(jid, status, version=None):
+    """Add a new job to the submission-time and status indexes.
+    
+    Args:
+        jid (str): The job ID.
+        status (str): The job's initial status.
+        version (int, optional): The dataset version the job was created
+            at, for jobs whose result may be reused.
+
+    Returns:
+        None
+    """
+    submitted = time.time()
+    pipe = jdb.pipeline()
+    pipe.zadd(JOBS_BY_TIME_KEY, {jid: submitted})
+    pipe.zadd(_status_key(status), {jid: submitted})
+    if version is not None:
+        pipe.zadd(JOB_VERSIONS_KEY, {jid: version})
+    pipe.execute()
+    _prune_registry(submitted)
+
+def _prune_registry(now):
+    """Drop jobs whose record has expired from the status indexes, and
+    registry entries older than the registry retention. Submission-time
+    entries are kept well past the job TTLs so expired jobs can still be
+    recognised. Dataset changes no live job can be invalidated by are
+    forgotten.
+    
+    Args:
+        now (float): The current Unix time.
+
+    Returns:
+        None
+    """
+    statuses = ("submitted", "in progress", "complete", "failed")
+    expired = jdb.zrangebyscore(JOB_EXPIRY_KEY, "-inf", now)
+    pipe = jdb.pipeline()
+    if expired:
+        for status in statuses:
+            pipe.zrem(_status_key(status), *expired)
+        pipe.zrem(JOB_EXPIRY_KEY, *expired)
+        pipe.zrem(JOB_VERSIONS_KEY, *expired)
+    if REGISTRY_RETENTION:
+        cutoff = now - REGISTRY_RETENTION
+        retired = jdb.zrangebyscore(JOBS_BY_TIME_KEY, "-inf", cutoff)
+        if retired:
+            pipe.zrem(JOB_VERSIONS_KEY, *retired)
+        pipe.zremrangebyscore(JOBS_BY_TIME_KEY, "-inf", cutoff)
+        for status in statuses:
+            pipe.zremrangebyscore(_status_key(status), "-inf", cutoff)
+    pipe.execute()
+
+    # Only changes after a job's version can stop it being reused
+    oldest = jdb.zrange(JOB_VERSIONS_KEY, 0, 0, withscores=True)
+    prune_dataset_changes(int(oldest[0][1]) if oldest else get_dataset_version())
+
+def job_expired(jid):
+    """Return whether `jid` was a registered job whose record has expired.
+    
+    Args:
+        jid (str): The job ID.
+
+    Returns:
+        bool: True if the job is in the registry but its record is gone.
+    """
+    return jdb.zscore(JOBS_BY_TIME_KEY, jid) is not None and not jdb.exists(jid)
+
+def _lane(priority):
+    return hq if priority == "high" else q
+
+def job_priority(start, end, priority=None):
+    """Pick the lane for a job: the caller's priority if given, otherwise
+    "high" for short date spans, which are cheap to compute.
+    
+    Args:
+        start (str): Start date of the range (YYYY-MM-DD).
+        end (str): End date of the range (YYYY-MM-DD).
+        priority (str, optional): "high" or "low" as requested by the caller.
+
+    Returns:
+        str: "high" or "low".
+    """
+    if priority in PRIORITIES:
+        return priority
+    span = (datetime.strptime(end, "%Y-%m-%d") - datetime.strptime(start, "%Y-%m-%d")).days + 1
+    return "high" if span <= HIGH_LANE_MAX_DAYS else "low"
+
+def _queue_job(jid, priority="low"):
+    """Add a job to the redis queue of its priority lane.
     
     Args:
         jid (str): The job ID to enqueue.
+        priority (str, optional): "high" or "low". Default is "low".
 
     Returns:
         None
     
     """
-    logging.info(f"Queueing job {jid} for processing.")
-    q.put(jid)
+    logging.info(f"Queueing job {jid} for processing in the {priority} priority lane.")
+    _lane(priority).put(jid)
     return
 
-def add_job(start, end, status="submitted"):
-    """Add a job to the redis queue.
+def _param_key(start, end, analysis=None):
+    """Build the canonical key for a job's parameters. Whether the job it maps
+    to is still valid for the current dataset is checked on lookup (see
+    `_find_reusable_job`).
     
     Args:
         start (str): Start date of the range (YYYY-MM-DD).
         end (str): End date of the range (YYYY-MM-DD).
-        status (str, optional): Initial job status. Default is "submitted".
+        analysis (dict, optional): Group-by dimensions and metrics of a generic analysis.
+
+    Returns:
+        str: The Redis key mapping these parameters to the job that computes them.
+    """
+    key = f"jobkey:{start}:{end}"
+    if analysis:
+        key += ":" + hashlib.sha1(json.dumps(analysis, sort_keys=True).encode()).hexdigest()[:16]
+    return key
+
+def _find_reusable_job(param_key):
+    """Return the job already registered for `param_key` if it can be shared.
+    
+    A complete job with a stored result is reused; a submitted or in progress
+    job is joined. Failed or missing jobs are not shared, and neither are jobs
+    whose date range overlaps plays that changed after they were submitted.
+
+    Args:
+        param_key (str): The canonical parameter key.
 
     Returns:
-        dict: The job dictionary that was created and queued.
+        dict: The existing job dictionary, or None.
     """
+    jid = jdb.get(param_key)
+    if not jid:
+        return None
+    job_dict = get_job_by_id(jid.decode())
+    if not job_dict:
+        return None
+    if dataset_changed_since(job_dict.get('version', 0), job_dict['start'], job_dict['end']):
+        logging.info(f"Job {job_dict['id']} predates a change to its date range; not reusing it.")
+        return None
+    if job_dict['status'] == "complete" and results_db.exists(job_dict['id']):
+        jdb.incr(REUSE_HITS_KEY)
+        logging.info(f"Reusing result of job {job_dict['id']}.")
+        return job_dict
+    if job_dict['status'] in ("submitted", "in progress"):
+        jdb.incr(COALESCE_HITS_KEY)
+        logging.info(f"Attaching to in-flight job {job_dict['id']}.")
+        return job_dict
+    return None
+
+def _claim_job(start, end, status, priority, batch_id=None, analysis=None):
+    """Create and register a job for a date range, unless an identical job
+    already finished or is still running and none of the plays in its range
+    changed since it was submitted.
+    The new job is not queued.
+
+    Args:
+        start (str): Start date of the range (YYYY-MM-DD).
+        end (str): End date of the range (YYYY-MM-DD).
+        status (str): Initial job status.
+        priority (str): The job's lane, "high" or "low".
+        batch_id (str, optional): The batch the new job belongs to.
+        analysis (dict, optional): Group-by dimensions and metrics (see
+            analysis.parse_analysis); the injury combo breakdown when not given.
+
+    Returns:
+        tuple: (job dictionary, True if it was created here).
+    """
+    param_key = _param_key(start, end, analysis)
+    existing = _find_reusable_job(param_key)
+    if existing:
+        return existing, False
+
     logging.info(f"Creating new job for range {start} to {end} with status '{status}'.")
     jid = _generate_jid()
     job_dict = _instantiate_job(jid, status, start, end)
+    job_dict['priority'] = priority
+    job_dict['version'] = get_dataset_version()
+    if batch_id:
+        job_dict['batch'] = batch_id
+    if analysis:
+        job_dict['analysis'] = analysis
     _save_job(jid, job_dict)
-    _queue_job(jid)
+    param_ttl = max(JOB_TTLS.values()) or None
+    if not jdb.set(param_key, jid, nx=True, ex=param_ttl):
+        # Another submission registered these parameters first
+        existing = _find_reusable_job(param_key)
+        if existing:
+            jdb.delete(jid)
+            return existing, False
+        jdb.set(param_key, jid, ex=param_ttl)
+    _register_job(jid, status, job_dict['version'])
+    return job_dict, True
+
+def add_job(start, end, status="submitted", priority=None, analysis=None):
+    """Add a job to the redis queue, unless an identical job already finished
+    or is still running and the plays in its range have not changed since, in
+    which case that job is returned instead.
+    
+    Args:
+        start (str): Start date of the range (YYYY-MM-DD).
+        end (str): End date of the range (YYYY-MM-DD).
+        status (str, optional): Initial job status. Default is "submitted".
+        priority (str, optional): "high" or "low"; chosen from the date span
+            when not given.
+        analysis (dict, optional): Group-by dimensions and metrics (see
+            analysis.parse_analysis); the injury combo breakdown when not given.
+
+    Returns:
+        dict: The job dictionary that was created and queued, or the existing
+            job it was matched to.
+    """
+    priority = job_priority(start, end, priority)
+    job_dict, created = _claim_job(start, end, status, priority, analysis=analysis)
+    if created:
+        _queue_job(job_dict['id'], priority)
     return job_dict
 
+def add_batch(ranges, status="submitted", priority=None):
+    """Add a batch of date ranges as one parent job. Each range gets its own
+    child job (or is matched to an existing identical job, as in `add_job`);
+    only the parent is queued, so the worker reads the data for all new
+    children in a single pass.
+
+    Args:
+        ranges (list): (start, end) YYYY-MM-DD pairs.
+        status (str, optional): Initial job status. Default is "submitted".
+        priority (str, optional): "high" or "low"; chosen from the span of
+            the whole batch when not given.
+
+    Returns:
+        tuple: (batch job dictionary, list of child job dictionaries in
+            the order of `ranges`).
+    """
+    bid = _generate_jid()
+    first = min(start for start, _ in ranges)
+    last = max(end for _, end in ranges)
+    priority = job_priority(first, last, priority)
+    children = []
+    pending = []
+    for start, end in ranges:
+        child, created = _claim_job(start, end, status, priority, batch_id=bid)
+        children.append(child)
+        if created:
+            pending.append(child['id'])
+
+    batch_status = status if pending else "complete"
+    batch = _instantiate_job(bid, batch_status, first, last)
+    batch['type'] = "batch"
+    batch['priority'] = priority
+    batch['jobs'] = [child['id'] for child in children]
+    batch['pending'] = pending
+    _save_job(bid, batch)
+    _register_job(bid, batch_status)
+    logging.info(f"Created batch {bid} with {len(children)} jobs, {len(pending)} to compute.")
+    if pending:
+        _queue_job(bid, priority)
+    return batch, children
+
+def list_job_ids(status=None, since=None, limit=100, cursor=None):
+    """Return job IDs in submission order from the registry indexes. Jobs
+    whose record has expired are skipped. The cost depends on `limit`, not
+    on how many jobs have ever been submitted. Jobs submitted at the same
+    time are ordered by ID (as Redis orders equal scores), and the cursor
+    holds both, so a page boundary between them skips none.
+    
+    Args:
+        status (str, optional): Only return jobs with this status.
+        since (float, optional): Only return jobs submitted after this Unix time.
+        limit (int, optional): Maximum number of job IDs to return.
+        cursor (str, optional): The `next_cursor` of the previous page,
+            "<submission time>:<job ID>".
+
+    Returns:
+        tuple: (list of job IDs, next_cursor or None when there are no more).
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    key = _status_key(status) if status else JOBS_BY_TIME_KEY
+    low = "-inf"
+    if since is not None:
+        low = since
+    after = None  # (score, job ID) of the last job of the previous page
+    if cursor is not None:
+        score, _, last_jid = cursor.partition(":")
+        after = (float(score), last_jid)
+        if since is None or after[0] >= since:
+            low = after[0]
+    live = []
+    start = 0
+    while len(live) <= limit:
+        num = limit + 1 - len(live)
+        scanned = jdb.zrangebyscore(key, low, "+inf", start=start, num=num, withscores=True)
+        if not scanned:
+            break
+        start += len(scanned)
+        page = [(jid.decode(), score) for jid, score in scanned]
+        if after:
+            page = [(jid, score) for jid, score in page if (score, jid) > after]
+        pipe = jdb.pipeline()
+        for jid, _ in page:
+            pipe.exists(jid)
+        live += [(jid, score) for (jid, score), exists in zip(page, pipe.execute()) if exists]
+        if len(scanned) < num:
+            break
+    jids = [jid for jid, _ in live[:limit]]
+    next_cursor = None
+    if len(live) > limit and limit > 0:
+        next_cursor = f"{live[limit - 1][1]!r}:{live[limit - 1][0]}"
+    return jids, next_cursor
+
+def get_job_stats():
+    """Return the job reuse and coalescing counters.
+    
+    Args: none
+
+    Returns:
+        dict: reuse_hits, coalesce_hits and queue_depths.
+    """
+    reuse_hits, coalesce_hits = jdb.mget(REUSE_HITS_KEY, COALESCE_HITS_KEY)
+    return {'reuse_hits': int(reuse_hits or 0),
+            'coalesce_hits': int(coalesce_hits or 0),
+            'queue_depths': get_queue_depths()}
+
+def count_jobs_by_status():
+    """Return how many registered jobs are in each status, leaving out jobs
+    whose record has expired but that are still in the status indexes.
+    
+    Args: none
+
+    Returns:
+        dict: Status -> number of jobs.
+    """
+    statuses = ("submitted", "in progress", "complete", "failed")
+    expired = jdb.zrangebyscore(JOB_EXPIRY_KEY, "-inf", time.time())
+    pipe = jdb.pipeline()
+    for status in statuses:
+        pipe.zcard(_status_key(status))
+        if expired:
+            pipe.zmscore(_status_key(status), expired)
+    replies = pipe.execute()
+    if not expired:
+        return dict(zip(statuses, replies))
+    return {status: total - sum(score is not None for score in scores)
+            for status, total, scores in zip(statuses, replies[::2], replies[1::2])}
+
+def get_queue_depths():
+    """Return how many tasks wait in each queue.
+    
+    Args: none
+
+    Returns:
+        dict: Waiting tasks per priority lane, plus "shards".
+    """
+    pipe = qdb.pipeline()
+    for priority in PRIORITIES:
+        pipe.llen(_lane(priority).key)
+    pipe.llen(sq.key)
+    *lanes, shards = pipe.execute()
+    return {**dict(zip(PRIORITIES, lanes)), 'shards': shards}
+
 def get_job_by_id(jid):
     """Return job dictionary given jid
     
@@ -102,10 +490,11 @@ def get_job_by_id(jid):
         jid (str): The job ID to retrieve.
 
     Returns:
-        dict: The job dictionary retrieved from Redis.
+        dict: The job dictionary retrieved from Redis, or None if it does not exist.
     """
     logging.debug(f"Fetching job {jid} from Redis DB.")
-    return json.loads(jdb.get(jid))
+    job_data = jdb.get(jid)
+    return json.loads(job_data) if job_data else None
 
 def update_job_status(jid, status):
     """Update the status of job with job id `jid` to status `status`.
@@ -121,8 +510,386 @@ def update_job_status(jid, status):
     logging.info(f"Updating job {jid} status to '{status}'.")
     job_dict = get_job_by_id(jid)
     if job_dict:
+        old_status = job_dict['status']
         job_dict['status'] = status
         _save_job(jid, job_dict)
+        submitted = jdb.zscore(JOBS_BY_TIME_KEY, jid) or time.time()
+        pipe = jdb.pipeline()
+        pipe.zrem(_status_key(old_status), jid)
+        pipe.zadd(_status_key(status), {jid: submitted})
+        pipe.execute()
+        publish_event(jid, "status", {"status": status})
+        if status in ("complete", "failed") and old_status != status:
+            observe_shared("job_latency_seconds", max(time.time() - submitted, 0.0),
+                           status=status, priority=job_dict.get('priority', "low"))
     else:
         logging.error(f"Failed to update job status. Job {jid} not found.")
         raise Exception("Job not found")
+
+def _profile_key(jid):
+    return f"profile:{jid}"
+
+def add_job_profile(jid, stages, started=None):
+    """Add stage timings to a job's profile. Timings from several workers
+    (e.g. the shards of a job) add up.
+    
+    Args:
+        jid (str): The job ID.
+        stages (dict): Stage name -> {"seconds": float, "rows": int}.
+        started (float, optional): Unix time the job started running; only
+            the first value given is kept.
+
+    Returns:
+        None
+    """
+    key = _profile_key(jid)
+    pipe = jdb.pipeline()
+    for stage, entry in stages.items():
+        pipe.hincrbyfloat(key, f"{stage}:seconds", entry["seconds"])
+        pipe.hincrby(key, f"{stage}:rows", entry["rows"])
+    if started is not None:
+        pipe.hsetnx(key, "started", started)
+    pipe.expire(key, PROFILE_TTL)
+    pipe.execute()
+
+def save_job_profile(jid):
+    """Move a job's accumulated stage timings onto its job record.
+    
+    Args:
+        jid (str): The job ID.
+
+    Returns:
+        dict: The profile: seconds and rows per stage, their total, and the
+            wall time since the job started running.
+    """
+    key = _profile_key(jid)
+    raw = jdb.hgetall(key)
+    jdb.delete(key)
+
+    stages = {}
+    started = None
+    for field, value in raw.items():
+        field = field.decode()
+        if field == "started":
+            started = float(value)
+            continue
+        stage, kind = field.rsplit(":", 1)
+        stages.setdefault(stage, {})[kind] = round(float(value), 4) if kind == "seconds" else int(value)
+
+    profile = {
+        "stages": stages,
+        "stage_seconds": round(sum(entry.get("seconds", 0.0) for entry in stages.values()), 4),
+        "wall_seconds": round(time.time() - started, 4) if started else None
+    }
+    job_dict = get_job_by_id(jid)
+    if job_dict:
+        job_dict['profile'] = profile
+        _save_job(jid, job_dict)
+    return profile
+
+def save_job_cprofile(jid, report):
+    """Keep the cProfile report of a sampled job next to its record.
+    
+    Args:
+        jid (str): The job ID.
+        report (str): The pstats text report.
+
+    Returns:
+        None
+    """
+    jdb.set(f"{_profile_key(jid)}:cprofile", report, ex=JOB_TTLS['complete'] or None)
+
+def get_job_cprofile(jid):
+    """Return the cProfile report of a sampled job, if there is one.
+    
+    Args:
+        jid (str): The job ID.
+
+    Returns:
+        str: The pstats text report, or None.
+    """
+    report = jdb.get(f"{_profile_key(jid)}:cprofile")
+    return report.decode() if report else None
+
+def _events_key(jid):
+    return f"job:{jid}:events"
+
+def publish_event(jid, event, data):
+    """Append a progress event to the job's event stream.
+    
+    Args:
+        jid (str): The job ID.
+        event (str): The event type, e.g. "status" or "progress".
+        data (dict): The event payload.
+
+    Returns:
+        str: The stream ID of the new event.
+    """
+    pipe = jdb.pipeline()
+    pipe.xadd(_events_key(jid), {'event': event, 'data': json.dumps(data)},
+              maxlen=EVENTS_MAXLEN, approximate=True)
+    pipe.expire(_events_key(jid), EVENTS_TTL)
+    event_id, _ = pipe.execute()
+    return event_id.decode()
+
+def read_events(jid, after="0", block_ms=None):
+    """Return the job's events published after stream ID `after`, waiting up
+    to `block_ms` milliseconds for one if there are none yet.
+    
+    Args:
+        jid (str): The job ID.
+        after (str, optional): The last stream ID already seen; "0" for all.
+        block_ms (int, optional): How long to wait; None to return at once.
+
+    Returns:
+        list: (event ID, event type, payload dict) tuples, oldest first.
+    """
+    streams = jdb.xread({_events_key(jid): after}, block=block_ms)
+    return [(event_id.decode(), fields[b'event'].decode(), json.loads(fields[b'data']))
+            for _, entries in streams for event_id, fields in entries]
+
+def _forget_result(jid, evicted=False):
+    """Delete a stored result and its size and recency bookkeeping.
+    
+    Args:
+        jid (str): The job ID whose result is removed.
+        evicted (bool, optional): Count the removal as a budget eviction.
+
+    Returns:
+        None
+    """
+    size = int(results_db.hget(RESULT_SIZES_KEY, jid) or 0)
+    pipe = results_db.pipeline()
+    pipe.delete(jid)
+    pipe.hdel(RESULT_SIZES_KEY, jid)
+    pipe.zrem(RESULT_LRU_KEY, jid)
+    pipe.decrby(RESULT_BYTES_KEY, size)
+    if evicted:
+        pipe.incr(RESULT_EVICTIONS_KEY)
+    pipe.execute()
+
+def _enforce_result_retention():
+    """Forget results idle for longer than RESULT_TTL, then evict the least
+    recently read results until the total is within RESULTS_MAX_BYTES.
+    
+    Args: none
+
+    Returns:
+        None
+    """
+    if RESULT_TTL:
+        for jid in results_db.zrangebyscore(RESULT_LRU_KEY, "-inf", time.time() - RESULT_TTL):
+            _forget_result(jid.decode())
+    while int(results_db.get(RESULT_BYTES_KEY) or 0) > RESULTS_MAX_BYTES:
+        oldest = results_db.zpopmin(RESULT_LRU_KEY)
+        if not oldest:
+            break
+        jid = oldest[0][0].decode()
+        logging.info(f"Evicting result of job {jid} to stay within the results byte budget.")
+        _forget_result(jid, evicted=True)
+
+def store_result(jid, payload):
+    """Store an encoded job result, then apply the results TTL and byte budget.
+    
+    Args:
+        jid (str): The job ID.
+        payload (bytes): The encoded result.
+
+    Returns:
+        None
+    """
+    old_size = int(results_db.hget(RESULT_SIZES_KEY, jid) or 0)
+    pipe = results_db.pipeline()
+    pipe.set(jid, payload, ex=RESULT_TTL or None)
+    pipe.hset(RESULT_SIZES_KEY, jid, len(payload))
+    pipe.zadd(RESULT_LRU_KEY, {jid: time.time()})
+    pipe.incrby(RESULT_BYTES_KEY, len(payload) - old_size)
+    pipe.execute()
+    _enforce_result_retention()
+
+def get_result(jid):
+    """Return a stored job result and mark it as recently read, which also
+    restarts its TTL.
+    
+    Args:
+        jid (str): The job ID.
+
+    Returns:
+        bytes: The encoded result, or None if there is none (or it expired or
+            was evicted).
+    """
+    payload = results_db.get(jid)
+    if payload is not None:
+        pipe = results_db.pipeline()
+        pipe.zadd(RESULT_LRU_KEY, {jid: time.time()}, xx=True)
+        if RESULT_TTL:
+            pipe.expire(jid, RESULT_TTL)
+        pipe.execute()
+    return payload
+
+def get_result_stats():
+    """Return how many result bytes are held and how many results were
+    evicted. Results idle past RESULT_TTL are left out but not forgotten
+    here; retention is applied when a result is stored.
+    
+    Args: none
+
+    Returns:
+        dict: results_held, bytes_held, budget_bytes and evictions.
+    """
+    stale = results_db.zrangebyscore(RESULT_LRU_KEY, "-inf", time.time() - RESULT_TTL) if RESULT_TTL else []
+    stale_bytes = sum(int(size or 0) for size in results_db.hmget(RESULT_SIZES_KEY, stale)) if stale else 0
+    held, bytes_held, evictions = (results_db.zcard(RESULT_LRU_KEY),
+                                   results_db.get(RESULT_BYTES_KEY),
+                                   results_db.get(RESULT_EVICTIONS_KEY))
+    return {'results_held': held - len(stale),
+            'bytes_held': int(bytes_held or 0) - stale_bytes,
+            'budget_bytes': RESULTS_MAX_BYTES,
+            'evictions': int(evictions or 0)}
+
+def _shard_key(jid):
+    """Return the key of the hash tracking a fanned-out job's shards."""
+    return f"shards:{jid}"
+
+def _shard_ttl():
+    """Expiry of a job's shard hashes, so a job that never finishes does not leave them behind."""
+    return max(JOB_TTLS.values()) or None
+
+def queue_shards(jid, ranges):
+    """Split job `jid` into one shard per date range and queue them on the
+    sub-task queue, where any worker can pick them up.
+    
+    Args:
+        jid (str): The job ID being fanned out.
+        ranges (list): (start, end) YYYY-MM-DD pairs, one per shard.
+
+    Returns:
+        None
+    """
+    logging.info(f"Fanning job {jid} out into {len(ranges)} shards.")
+    pipe = jdb.pipeline()
+    pipe.hset(_shard_key(jid), mapping={'total': len(ranges), 'remaining': len(ranges)})
+    if _shard_ttl():
+        pipe.expire(_shard_key(jid), _shard_ttl())
+    pipe.execute()
+    sq.put(*[{'job_id': jid, 'shard': i, 'shards': len(ranges), 'start': start, 'end': end}
+             for i, (start, end) in enumerate(ranges)])
+
+def save_shard_result(jid, shard, partials):
+    """Store the partial counts of one shard and count it as finished.
+    
+    Args:
+        jid (str): The job ID the shard belongs to.
+        shard (int): The shard index.
+        partials (dict): The shard's partial counts.
+
+    Returns:
+        int: The number of shards of the job still outstanding.
+    """
+    pipe = jdb.pipeline()
+    pipe.hset(f"{_shard_key(jid)}:partials", shard, encode(partials))
+    if _shard_ttl():
+        pipe.expire(f"{_shard_key(jid)}:partials", _shard_ttl())
+    pipe.hincrby(_shard_key(jid), 'remaining', -1)
+    return pipe.execute()[-1]
+
+def pop_shard_results(jid):
+    """Return and delete the partial counts of every shard of a job.
+    
+    Args:
+        jid (str): The job ID.
+
+    Returns:
+        list: The shards' partial counts, in shard order.
+    """
+    raw = jdb.hgetall(f"{_shard_key(jid)}:partials")
+    discard_shards(jid)
+    return [decode(raw[k]) for k in sorted(raw, key=int)]
+
+def discard_shards(jid):
+    """Delete the shard bookkeeping and partial counts of a job, e.g. once
+    one of its shards failed.
+    
+    Args:
+        jid (str): The job ID.
+
+    Returns:
+        None
+    """
+    jdb.delete(_shard_key(jid), f"{_shard_key(jid)}:partials")
+
+def get_next_task(timeout=0):
+    """Block until a shard or a job is waiting and pop it. Shards are taken
+    first so fanned-out jobs finish before new ones start, then the "high"
+    lane. After LANE_STARVATION_LIMIT "high" jobs in a row, a waiting "low"
+    job goes ahead of the next one.
+    
+    Args:
+        timeout (int, optional): Seconds to wait, 0 to wait forever.
+
+    Returns:
+        tuple: (is_shard, message), or None if the timeout expired.
+    """
+    lanes = [hq.key, q.key]
+    if int(qdb.get(HIGH_STREAK_KEY) or 0) >= LANE_STARVATION_LIMIT:
+        lanes.reverse()
+    popped = qdb.blpop([sq.key] + lanes, timeout=timeout)
+    if popped is None:
+        return None
+    key, msg = popped
+    key = key.decode()
+    if key == hq.key:
+        qdb.incr(HIGH_STREAK_KEY)
+    elif key == q.key:
+        qdb.set(HIGH_STREAK_KEY, 0)
+    return key == sq.key, q.serializer.loads(msg)
+
+def _worker_key(worker_id):
+    return f"worker:{worker_id}"
+
+def report_worker(worker_id, stats):
+    """Publish a worker's concurrency and utilization report. Reports from
+    workers that stop reporting expire on their own.
+    
+    Args:
+        worker_id (str): The reporting worker's ID.
+        stats (dict): Flat mapping of report fields to numbers or strings.
+
+    Returns:
+        None
+    """
+    pipe = jdb.pipeline()
+    pipe.hset(_worker_key(worker_id), mapping=stats)
+    pipe.expire(_worker_key(worker_id), WORKER_STALE_AFTER)
+    pipe.zadd(WORKERS_KEY, {worker_id: time.time()})
+    pipe.zremrangebyscore(WORKERS_KEY, "-inf", time.time() - WORKER_STALE_AFTER)
+    pipe.execute()
+
+def get_worker_stats():
+    """Return the latest report of every worker heard from recently.
+    
+    Args: none
+
+    Returns:
+        list: One report dict per worker, ordered by worker ID.
+    """
+    worker_ids = sorted(w.decode() for w in
+                        jdb.zrangebyscore(WORKERS_KEY, time.time() - WORKER_STALE_AFTER, "+inf"))
+    pipe = jdb.pipeline()
+    for worker_id in worker_ids:
+        pipe.hgetall(_worker_key(worker_id))
+
+    reports = []
+    for worker_id, raw in zip(worker_ids, pipe.execute()):
+        if not raw:
+            continue
+        report = {'worker_id': worker_id}
+        for field, value in raw.items():
+            value = value.decode()
+            try:
+                value = float(value) if "." in value else int(value)
+            except ValueError:
+                pass
+            report[field.decode()] = value
+        reports.append(report)
+    return reports
@@ -0,0 +1,302 @@
+import os
+import time
+import math
+import redis
+import logging
+import threading
+
+log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=getattr(logging, log_level))
+
+_redis_ip = os.environ.get('REDIS_HOST', 'redis-db')
+_redis_port = int(os.environ.get('REDIS_PORT', 6379))
+
+# Histograms observed by workers are kept in Redis so the API can expose them
+mdb = redis.Redis(host=_redis_ip, port=_redis_port, db=2)
+
+METRIC_PREFIX = "nfl_"
+SHARED_HISTOGRAMS_KEY = "metrics:histograms"  # set of Redis keys holding shared histograms
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+SHARED_HELP = {
+    "job_latency_seconds": "Time from job submission to completion or failure.",
+    "task_run_seconds": "Time a worker spent running one job or shard.",
+}
+
+# Per-db memory is estimated from a sample of keys, taken at most once per interval
+REDIS_MEMORY_SAMPLE_SECONDS = int(os.environ.get("REDIS_MEMORY_SAMPLE_SECONDS", 300))
+REDIS_MEMORY_SAMPLE_KEYS = 20
+
+_lock = threading.Lock()
+_request_counts = {}  # (method, route, status) -> requests served by this process
+_request_latency = {}  # (method, route) -> [bucket counts..., sum, count]
+_memory_samples = {}  # db -> (monotonic time sampled, mean bytes per key or None)
+
+
+def _format_labels(labels):
+    """
+    Render a label set in the Prometheus text format.
+
+    Args:
+        labels (dict): Label name -> value.
+
+    Returns:
+        str: e.g. '{route="/jobs",method="GET"}', or "" for no labels.
+    """
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _bucket_index(buckets, value):
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            return i
+    return len(buckets)
+
+
+def observe_request(method, route, status, seconds):
+    """
+    Count one API request and add its latency to the route's histogram.
+
+    Args:
+        method (str): The HTTP method.
+        route (str): The matched route rule (not the raw path, to bound cardinality).
+        status (int): The response status code.
+        seconds (float): Time taken to build the response.
+
+    Returns:
+        None
+    """
+    with _lock:
+        key = (method, route, status)
+        _request_counts[key] = _request_counts.get(key, 0) + 1
+        counts = _request_latency.setdefault((method, route), [0] * (len(LATENCY_BUCKETS) + 3))
+        counts[_bucket_index(LATENCY_BUCKETS, seconds)] += 1
+        counts[-2] += seconds
+        counts[-1] += 1
+
+
+def _shared_key(name, labels):
+    return f"metrics:{name}:" + ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+
+
+def observe_shared(name, value, buckets=JOB_BUCKETS, **labels):
+    """
+    Add an observation to a histogram kept in Redis, so observations from
+    every worker end up in the same series.
+
+    Args:
+        name (str): The metric name, without the prefix.
+        value (float): The observed value.
+        buckets (tuple, optional): Upper bounds of the buckets.
+        **labels: Labels of the series.
+
+    Returns:
+        None
+    """
+    key = _shared_key(name, labels)
+    pipe = mdb.pipeline(transaction=False)
+    bucket = _bucket_index(buckets, value)
+    pipe.hincrby(key, f"bucket:{buckets[bucket] if bucket < len(buckets) else '+Inf'}", 1)
+    pipe.hincrbyfloat(key, "sum", value)
+    pipe.hincrby(key, "count", 1)
+    pipe.hsetnx(key, "buckets", ",".join(map(str, buckets)))
+    pipe.sadd(SHARED_HISTOGRAMS_KEY, key)
+    pipe.execute()
+
+
+def _histogram_lines(name, labels, buckets, counts, total, count):
+    """
+    Render one histogram series.
+
+    Args:
+        name (str): Full metric name.
+        labels (dict): Series labels.
+        buckets (tuple): Upper bounds of the buckets.
+        counts (list): Observations per bucket, including the +Inf bucket last.
+        total (float): Sum of observations.
+        count (int): Number of observations.
+
+    Returns:
+        list: Exposition lines.
+    """
+    lines = []
+    cumulative = 0
+    for bound, n in zip(list(buckets) + [math.inf], counts):
+        cumulative += n
+        lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_value(float(bound))})} {cumulative}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(total))}")
+    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return lines
+
+
+def family(name, kind, help_text, samples):
+    """
+    Render a counter or gauge metric family.
+
+    Args:
+        name (str): The metric name, without the prefix.
+        kind (str): "counter" or "gauge".
+        help_text (str): The HELP text.
+        samples (list): (labels dict, value) pairs.
+
+    Returns:
+        list: Exposition lines.
+    """
+    name = METRIC_PREFIX + name
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples]
+    return lines
+
+
+def request_metrics():
+    """
+    Render this process's per-route request counts and latency histograms.
+
+    Args: none
+
+    Returns:
+        list: Exposition lines.
+    """
+    with _lock:
+        counts = dict(_request_counts)
+        latency = {key: list(v) for key, v in _request_latency.items()}
+
+    lines = family("http_requests_total", "counter", "API requests served, by route and status.",
+                   [({"method": m, "route": r, "status": s}, n) for (m, r, s), n in sorted(counts.items())])
+    name = METRIC_PREFIX + "http_request_duration_seconds"
+    lines += [f"# HELP {name} Time to build API responses, by route.", f"# TYPE {name} histogram"]
+    for (method, route), v in sorted(latency.items()):
+        lines += _histogram_lines(name, {"method": method, "route": route}, LATENCY_BUCKETS, v[:-2], v[-2], v[-1])
+    return lines
+
+
+def shared_metrics():
+    """
+    Render the histograms that workers keep in Redis.
+
+    Args: none
+
+    Returns:
+        list: Exposition lines.
+    """
+    keys = sorted(k.decode() for k in mdb.smembers(SHARED_HISTOGRAMS_KEY))
+    pipe = mdb.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+
+    series = {}
+    for key, raw in zip(keys, pipe.execute()):
+        if not raw:
+            continue
+        _, name, label_text = key.split(":", 2)
+        labels = dict(pair.split("=", 1) for pair in label_text.split(",") if pair)
+        raw = {k.decode(): v.decode() for k, v in raw.items()}
+        buckets = tuple(float(b) for b in raw["buckets"].split(","))
+        counts = [int(raw.get(f"bucket:{b}", 0)) for b in buckets] + [int(raw.get("bucket:+Inf", 0))]
+        series.setdefault(name, []).append((labels, buckets, counts, float(raw["sum"]), int(raw["count"])))
+
+    lines = []
+    for name, entries in sorted(series.items()):
+        full = METRIC_PREFIX + name
+        help_text = SHARED_HELP.get(name, f"Histogram {name}, observed by the workers.")
+        lines += [f"# HELP {full} {help_text}", f"# TYPE {full} histogram"]
+        for labels, buckets, counts, total, count in entries:
+            lines += _histogram_lines(full, labels, buckets, counts, total, count)
+    return lines
+
+
+def _bytes_per_key(db, client, size):
+    """
+    Return the mean memory use of the keys of a Redis db, sampling
+    REDIS_MEMORY_SAMPLE_KEYS keys at most once every
+    REDIS_MEMORY_SAMPLE_SECONDS so scrapes do not load Redis.
+
+    Args:
+        db (int): The db number.
+        client (Redis): A client of that db.
+        size (int): The number of keys in the db.
+
+    Returns:
+        float: Bytes per key, or None if no sample could be taken.
+    """
+    with _lock:
+        sample = _memory_samples.get(db)
+    if sample and time.monotonic() - sample[0] < REDIS_MEMORY_SAMPLE_SECONDS:
+        return sample[1]
+    per_key = None
+    try:
+        keys = [k for k in (client.randomkey() for _ in range(min(size, REDIS_MEMORY_SAMPLE_KEYS))) if k]
+        usage = [client.memory_usage(k) or 0 for k in keys]
+        if usage:
+            per_key = sum(usage) / len(usage)
+    except redis.exceptions.ResponseError as e:
+        logging.debug(f"MEMORY USAGE unavailable for db {db}: {e}")
+    with _lock:
+        _memory_samples[db] = (time.monotonic(), per_key)
+    return per_key
+
+
+def redis_metrics(clients):
+    """
+    Report Redis command latency from INFO commandstats (calls and time
+    spent per command, server-wide), along with the PING round trip, key
+    count and memory use of each db. Per-db bytes are estimated from a
+    periodic sample of keys (see `_bytes_per_key`).
+
+    Args:
+        clients (dict): db number -> Redis client.
+
+    Returns:
+        list: Exposition lines.
+    """
+    latency, keys, db_bytes = [], [], []
+    for db, client in sorted(clients.items()):
+        started = time.perf_counter()
+        client.ping()
+        latency.append(({"db": db}, round(time.perf_counter() - started, 6)))
+        size = client.dbsize()
+        keys.append(({"db": db}, size))
+        per_key = _bytes_per_key(db, client, size)
+        if per_key is not None:
+            db_bytes.append(({"db": db}, int(per_key * size)))
+
+    server = clients[min(clients)]
+    calls, seconds = [], []
+    try:
+        for name, stats in sorted(server.info("commandstats").items()):
+            command = {"command": name.removeprefix("cmdstat_")}
+            calls.append((command, int(stats["calls"])))
+            seconds.append((command, stats["usec"] / 1e6))
+    except redis.exceptions.ResponseError as e:
+        logging.debug(f"INFO commandstats unavailable: {e}")
+    used_memory = None
+    try:
+        used_memory = server.info("memory").get("used_memory")
+    except redis.exceptions.ResponseError as e:
+        logging.debug(f"INFO memory unavailable: {e}")
+
+    lines = family("redis_commands_total", "counter", "Commands executed by the Redis server, by command.", calls)
+    lines += family("redis_command_seconds_total", "counter",
+                    "Time the Redis server spent executing each command.", seconds)
+    lines += family("redis_ping_seconds", "gauge", "Round-trip time of a PING to each Redis db.", latency)
+    lines += family("redis_keys", "gauge", "Keys held in each Redis db.", keys)
+    lines += family("redis_db_bytes", "gauge", "Estimated bytes held in each Redis db (sampled).", db_bytes)
+    if used_memory is not None:
+        lines += family("redis_used_memory_bytes", "gauge", "Memory used by the Redis server.", [({}, used_memory)])
+    return lines
+
+
+def render(lines):
+    return "\n".join(lines) + "\n"
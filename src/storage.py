@@ -0,0 +1,1288 @@
+import os
+import json
+import time
+import redis
+import hashlib
+import logging
+import threading
+from datetime import date
+from functools import lru_cache
+from dateutil import parser
+from codec import encode, decode
+
+log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=getattr(logging, log_level))
+
+_redis_ip = os.environ.get('REDIS_HOST', 'redis-db')
+_redis_port = int(os.environ.get('REDIS_PORT', 6379))
+
+rd = redis.Redis(host=_redis_ip, port=_redis_port, db=0)  # play data
+
+PLAY_INDEX_KEY = "plays:ids"  # sorted set of play_ids, scored by play_id
+SEASONS_KEY = "plays:seasons"  # set of SeasonYear partitions that hold plays
+PARTITIONS_KEY = "partitions"  # manifest: hash of SeasonYear -> JSON {min_date, max_date, rows}
+PLAY_TYPES_KEY = "plays:types"  # set of PlayType values that have a type index
+SCHEMA_KEY = "plays:schemas"  # hash of schema id -> JSON list of play column names
+ROLLUP_DAYS_KEY = "rollups:days"  # sorted set of GameDate ordinals that have a rollup
+ROLLUP_READY_KEY = "rollups:ready"  # set once ingest has written every rollup
+META_KEY = "dataset:meta"  # hash summarizing the loaded dataset
+SOURCE_KEY = "dataset:source"  # hash describing the CSV the stored plays came from
+VERSION_KEY = "dataset:version"  # incremented on every completed load
+CHANGES_KEY = "dataset:changes"  # sorted set of "version:first:last" day ordinals changed, scored by version
+GAMES_KEY = "games"  # hash of GameId -> fingerprint of the game's CSV rows
+INJURY_KEYWORDS_KEY = "injury:keywords"  # list of injury keywords, position = bit in InjuryFlags
+INJURY_TAGS_KEY = "injury:tags"  # hash: keywords tagged in the stored plays and the active mask
+INJURY_LOCK_KEY = "injury:tagging"  # held while stored plays are being re-tagged
+INJURY_LOCK_TTL = 3600
+STAGING_PREFIX = "staging:"  # a full load writes its plays, indexes and rollups under this prefix until published
+RETIRED_INDEX_KEY = "plays:retired"  # play_id index of a replaced load, whose plays are being deleted
+DATASET_LOCK_KEY = "dataset:loading"  # held while the stored plays are being loaded or changed
+DATASET_LOCK_TTL = int(os.environ.get("DATASET_LOCK_TTL", 3600))
+MAX_INJURY_KEYWORDS = 63  # InjuryFlags must fit in a signed 64-bit integer
+BATCH_SIZE = 1000
+
+# Categorical columns are stored as integer codes into an append-only
+# dictionary (a Redis list of values, code = position). Columns holding the
+# same kind of value share a dictionary, so their codes can be compared.
+CATEGORY_DICTIONARIES = {
+    'Formation': 'formation',
+    'PlayType': 'play_type',
+    'RushDirection': 'direction',
+    'PassType': 'direction',
+    'OffenseTeam': 'team',
+    'DefenseTeam': 'team',
+    'PenaltyTeam': 'team',
+    'PenaltyType': 'penalty_type',
+    'YardLineDirection': 'yard_line_direction',
+}
+MISSING_CODE = -1  # code stored for a missing categorical value
+
+_schema_columns = {}  # schema id -> column names, cached from SCHEMA_KEY
+_category_values = {}  # dictionary name -> values, cached from its Redis list
+_category_codes = {}  # dictionary name -> {value: code}
+_category_lock = threading.Lock()  # ingest threads must not add the same value twice
+
+
+def _staged(key, staging):
+    """Return `key`, or its name under STAGING_PREFIX when `staging` is set."""
+    return STAGING_PREFIX + key if staging else key
+
+
+def _play_key(play_id):
+    """
+    Build the Redis key that holds a single play.
+
+    Args:
+        play_id (int or str): The unique identifier of the play.
+
+    Returns:
+        str: The Redis key for the play record.
+    """
+    return f"play:{play_id}"
+
+
+def _schema_id(columns):
+    """
+    Return the id of a play schema (an ordered tuple of column names).
+
+    Args:
+        columns (tuple): The column names.
+
+    Returns:
+        str: A short, stable id for the schema.
+    """
+    return hashlib.sha1("\x1f".join(columns).encode()).hexdigest()[:10]
+
+
+def _decode_play(raw):
+    """
+    Decode a stored play back into a dictionary. Plays written as plain JSON
+    objects before the codec existed are returned as they are.
+
+    Args:
+        raw (bytes): The stored play.
+
+    Returns:
+        dict: The play record.
+    """
+    value = decode(raw)
+    if isinstance(value, dict):
+        return value
+    schema_id, values = value
+    columns = _schema_columns.get(schema_id)
+    if columns is None:
+        columns = json.loads(rd.hget(SCHEMA_KEY, schema_id))
+        _schema_columns[schema_id] = columns
+    return dict(zip(columns, values))
+
+
+def _type_index_key(play_type):
+    """
+    Build the Redis key of the index holding the play_ids of one PlayType.
+
+    Args:
+        play_type (str): The PlayType, e.g. "PASS".
+
+    Returns:
+        str: The Redis key of the sorted set, scored by play_id.
+    """
+    return f"plays:type:{play_type}"
+
+
+def _season_index_key(season):
+    """
+    Build the Redis key of the index holding the play_ids of one SeasonYear partition.
+
+    Args:
+        season (str): The SeasonYear, e.g. "2024".
+
+    Returns:
+        str: The Redis key of the sorted set, scored by play_id.
+    """
+    return f"plays:season:{season}"
+
+
+def _season_date_key(season):
+    """
+    Build the Redis key of the GameDate index of one SeasonYear partition.
+
+    Args:
+        season (str): The SeasonYear, e.g. "2024".
+
+    Returns:
+        str: The Redis key of the sorted set of play_ids, scored by GameDate ordinal.
+    """
+    return f"plays:season:{season}:by_date"
+
+
+def play_season(play, ordinal=None):
+    """
+    Return the SeasonYear partition a play belongs to. Plays without a
+    SeasonYear fall back to the season of their GameDate (a season starts in
+    September and ends in February).
+
+    Args:
+        play (dict): The play record.
+        ordinal (int, optional): The play's GameDate day ordinal, if known.
+
+    Returns:
+        str: The SeasonYear, or None if it cannot be told.
+    """
+    try:
+        season = int(play.get("SeasonYear") or 0)
+    except (TypeError, ValueError):
+        season = 0
+    if season > 0:
+        return str(season)
+    if ordinal:
+        day = date.fromordinal(ordinal)
+        return str(day.year if day.month >= 3 else day.year - 1)
+    return None
+
+
+def _rollup_key(ordinal):
+    """
+    Build the Redis key that holds the injury rollup for one GameDate.
+
+    Args:
+        ordinal (int): The GameDate day ordinal.
+
+    Returns:
+        str: The Redis key for the day's rollup hash.
+    """
+    return f"rollup:{ordinal}"
+
+
+def _category_key(name):
+    return f"dict:{name}"
+
+
+def _load_categories(name):
+    """
+    Refresh the cached values and codes of one dictionary from Redis.
+
+    Args:
+        name (str): The dictionary name.
+
+    Returns:
+        list: The dictionary's values, indexed by code.
+    """
+    values = [v.decode() for v in rd.lrange(_category_key(name), 0, -1)]
+    codes = {}
+    for code, value in enumerate(values):
+        codes.setdefault(value, code)
+    _category_values[name] = values
+    _category_codes[name] = codes
+    return values
+
+
+def category_codes(name, values):
+    """
+    Return the codes of categorical values, adding values not seen before to
+    the end of the dictionary. Codes never change once assigned.
+
+    Args:
+        name (str): The dictionary name (see CATEGORY_DICTIONARIES).
+        values (iterable): Distinct string values.
+
+    Returns:
+        dict: Value -> code.
+    """
+    with _category_lock:
+        codes = _category_codes.get(name)
+        if codes is None or any(v not in codes for v in values):
+            _load_categories(name)
+            codes = _category_codes[name]
+        for value in values:
+            if value not in codes:
+                codes[value] = rd.rpush(_category_key(name), value) - 1
+                _category_values[name].append(value)
+        return {value: codes[value] for value in values}
+
+
+def category_values(name, refresh=False):
+    """
+    Return the values of a dictionary, indexed by code.
+
+    Args:
+        name (str): The dictionary name (see CATEGORY_DICTIONARIES).
+        refresh (bool, optional): Re-read the dictionary from Redis.
+
+    Returns:
+        list: The dictionary's values.
+    """
+    if refresh or name not in _category_values:
+        return _load_categories(name)
+    return _category_values[name]
+
+
+def column_categories(columns):
+    """
+    Return fresh dictionary values for some categorical columns, for turning
+    their codes back into values (e.g. with pandas.Categorical.from_codes).
+
+    Args:
+        columns (iterable): Column names from CATEGORY_DICTIONARIES.
+
+    Returns:
+        dict: Column -> values indexed by code.
+    """
+    names = {CATEGORY_DICTIONARIES[c] for c in columns}
+    loaded = {name: _load_categories(name) for name in names}
+    return {c: loaded[CATEGORY_DICTIONARIES[c]] for c in columns}
+
+
+def _category_value(name, code):
+    values = category_values(name)
+    if code >= len(values):
+        values = category_values(name, refresh=True)
+    return values[code]
+
+
+@lru_cache(maxsize=4096)
+def ordinal_date(ordinal):
+    """
+    Format a GameDate day ordinal as YYYY-MM-DD.
+
+    Args:
+        ordinal (int): The day ordinal; 0 means the date is unknown.
+
+    Returns:
+        str: The date, or None if it is unknown.
+    """
+    return date.fromordinal(ordinal).isoformat() if ordinal > 0 else None
+
+
+def expand_play(play):
+    """
+    Turn a stored play back into the form clients see: GameDate as
+    YYYY-MM-DD and categorical codes as their values. Values that are not
+    codes (plays stored before dictionary encoding) are left as they are.
+
+    Args:
+        play (dict): A play as stored.
+
+    Returns:
+        dict: A copy of the play with readable values.
+    """
+    play = dict(play)
+    game_date = play.get('GameDate')
+    if isinstance(game_date, int) and not isinstance(game_date, bool):
+        play['GameDate'] = ordinal_date(game_date)
+    for column, name in CATEGORY_DICTIONARIES.items():
+        code = play.get(column)
+        if isinstance(code, int) and not isinstance(code, bool):
+            play[column] = None if code == MISSING_CODE else _category_value(name, code)
+    return play
+
+
+def date_ordinal(game_date):
+    """
+    Convert a GameDate value to its proleptic Gregorian day ordinal.
+
+    Args:
+        game_date (int or str): The GameDate as a day ordinal (already
+            normalized) or a date string, ideally YYYY-MM-DD.
+
+    Returns:
+        int: The day ordinal, or None if the date cannot be parsed.
+    """
+    if isinstance(game_date, int) and not isinstance(game_date, bool):
+        return game_date if game_date > 0 else None
+    try:
+        return date.fromisoformat(game_date).toordinal()
+    except (TypeError, ValueError):
+        pass
+    try:
+        return parser.parse(game_date).date().toordinal()
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def save_plays(plays, batch_size=BATCH_SIZE, staging=False):
+    """
+    Store each play under its own key and add it to the play_id and PlayType
+    indexes and to its SeasonYear partition (play_id and GameDate indexes).
+    Writes are sent through a pipeline in batches of `batch_size` plays, and
+    the manifest entries of the partitions written to are refreshed at the end.
+
+    Args:
+        plays (iterable): Play dictionaries, each with a "play_id" field.
+        batch_size (int, optional): Number of plays written per pipeline round trip.
+        staging (bool, optional): Write the plays and their indexes under the
+            staged keys (see `publish_staged`) instead of the live ones.
+
+    Returns:
+        int: The number of plays written.
+    """
+    written = 0
+    seasons = set()
+    schema_ids = {}  # column names -> schema id, for the schemas seen in this write
+    pipe = rd.pipeline(transaction=False)
+    for play in plays:
+        play_id = play["play_id"]
+        columns = tuple(play)
+        if columns not in schema_ids:
+            schema_ids[columns] = _schema_id(columns)
+            pipe.hsetnx(SCHEMA_KEY, schema_ids[columns], json.dumps(columns))
+        # Stored as [schema id, values] so column names are not repeated in every play
+        pipe.set(_staged(_play_key(play_id), staging), encode([schema_ids[columns], list(play.values())]))
+        pipe.zadd(_staged(PLAY_INDEX_KEY, staging), {str(play_id): play_id})
+        play_type = play.get("PlayType")
+        if isinstance(play_type, int) and play_type != MISSING_CODE:
+            play_type = _category_value(CATEGORY_DICTIONARIES['PlayType'], play_type)
+        if isinstance(play_type, str):
+            pipe.zadd(_staged(_type_index_key(play_type), staging), {str(play_id): play_id})
+            pipe.sadd(_staged(PLAY_TYPES_KEY, staging), play_type)
+        ordinal = date_ordinal(play.get("GameDate"))
+        season = play_season(play, ordinal)
+        if season is not None:
+            pipe.zadd(_staged(_season_index_key(season), staging), {str(play_id): play_id})
+            if ordinal is not None:
+                pipe.zadd(_staged(_season_date_key(season), staging), {str(play_id): ordinal})
+            if season not in seasons:
+                seasons.add(season)
+                pipe.sadd(_staged(SEASONS_KEY, staging), season)
+        written += 1
+        if written % batch_size == 0:
+            pipe.execute()
+    pipe.execute()
+    refresh_partitions(seasons, staging)
+    logging.debug(f"Stored {written} plays in Redis.")
+    return written
+
+
+def get_play(play_id):
+    """
+    Return a single play given its play_id.
+
+    Args:
+        play_id (int or str): The unique identifier of the play.
+
+    Returns:
+        dict: The play record, or None if it does not exist.
+    """
+    raw = rd.get(_play_key(play_id))
+    return _decode_play(raw) if raw else None
+
+
+def get_plays(play_ids, timings=None):
+    """
+    Return the plays for a list of play_ids with a single MGET.
+
+    Args:
+        play_ids (list): The play_ids to fetch.
+        timings (dict, optional): Accumulates seconds spent in "redis" and "decode".
+
+    Returns:
+        list: The play records that exist, in the order requested.
+    """
+    if not play_ids:
+        return []
+    started = time.perf_counter()
+    raw_plays = rd.mget([_play_key(pid) for pid in play_ids])
+    fetched = time.perf_counter()
+    plays = [_decode_play(raw) for raw in raw_plays if raw]
+    if timings is not None:
+        timings["redis"] = timings.get("redis", 0.0) + fetched - started
+        timings["decode"] = timings.get("decode", 0.0) + time.perf_counter() - fetched
+    return plays
+
+
+def iter_play_ids(batch_size=BATCH_SIZE):
+    """
+    Yield play_ids from the index in ascending order, one batch at a time.
+
+    Args:
+        batch_size (int, optional): Number of ids read from the index per call.
+
+    Returns:
+        generator: Lists of play_id strings.
+    """
+    offset = 0
+    while True:
+        ids = rd.zrange(PLAY_INDEX_KEY, offset, offset + batch_size - 1)
+        if not ids:
+            return
+        yield [i.decode() if isinstance(i, bytes) else i for i in ids]
+        offset += len(ids)
+
+
+def iter_plays(batch_size=BATCH_SIZE):
+    """
+    Yield every stored play in play_id order without loading them all at once.
+
+    Args:
+        batch_size (int, optional): Number of plays fetched per round trip.
+
+    Returns:
+        generator: Play dictionaries.
+    """
+    for ids in iter_play_ids(batch_size):
+        yield from get_plays(ids)
+
+
+def _page_keys(play_type=None, season=None):
+    """
+    Pick the index to page through for a filter, and the index (if any) its
+    ids must also be in. A season filter reads only that partition's index.
+
+    Args:
+        play_type (str, optional): Only return plays of this PlayType.
+        season (str, optional): Only return plays of this SeasonYear.
+
+    Returns:
+        tuple: (index key, second index key or None).
+    """
+    if season:
+        return _season_index_key(season), _type_index_key(play_type) if play_type else None
+    return (_type_index_key(play_type) if play_type else PLAY_INDEX_KEY), None
+
+
+def iter_play_id_pages(after=0, limit=None, play_type=None, batch_size=BATCH_SIZE, season=None):
+    """
+    Yield play_ids greater than `after` in ascending order, one batch at a time.
+    Each batch is a range query on the index scores, so reading deep into the
+    dataset costs the same as reading the start.
+
+    Args:
+        after (int, optional): Only return play_ids strictly greater than this.
+        limit (int, optional): Stop after this many play_ids; None for no limit.
+        play_type (str, optional): Only return plays of this PlayType.
+        batch_size (int, optional): Number of ids read from the index per call.
+        season (str, optional): Only return plays of this SeasonYear partition.
+
+    Returns:
+        generator: Lists of int play_ids.
+    """
+    key, also_in = _page_keys(play_type, season)
+    remaining = limit
+    while remaining is None or remaining > 0:
+        num = batch_size if remaining is None else min(batch_size, remaining)
+        ids = rd.zrangebyscore(key, f"({after}", "+inf", start=0, num=num)
+        if not ids:
+            return
+        after = int(ids[-1])
+        if also_in:
+            ids = [i for i, score in zip(ids, rd.zmscore(also_in, ids)) if score is not None]
+            if not ids:
+                continue
+        ids = [int(i) for i in ids]
+        yield ids
+        if remaining is not None:
+            remaining -= len(ids)
+
+
+def has_plays_after(after, play_type=None, season=None):
+    """
+    Return whether any play_id greater than `after` exists.
+
+    Args:
+        after (int): The play_id to look past.
+        play_type (str, optional): Only consider plays of this PlayType.
+        season (str, optional): Only consider plays of this SeasonYear partition.
+
+    Returns:
+        bool: True if there is at least one more play.
+    """
+    key, also_in = _page_keys(play_type, season)
+    if also_in:
+        return next(iter_play_id_pages(after, 1, play_type, season=season), None) is not None
+    return rd.zcount(key, f"({after}", "+inf") > 0
+
+
+def iter_plays_in_range(start_date, end_date, batch_size=BATCH_SIZE, timings=None):
+    """
+    Yield the plays whose GameDate falls inside [start_date, end_date] using
+    the GameDate indexes of the partitions whose dates overlap the range, so
+    other seasons are never touched and only plays in range are read.
+
+    Args:
+        start_date (date): First day of the range.
+        end_date (date): Last day of the range.
+        batch_size (int, optional): Number of plays fetched per round trip.
+        timings (dict, optional): Accumulates seconds spent in "redis" and "decode".
+
+    Returns:
+        generator: Play dictionaries in GameDate order within each season.
+    """
+    low, high = start_date.toordinal(), end_date.toordinal()
+    for season in partitions_in_range(low, high):
+        offset = 0
+        while True:
+            started = time.perf_counter()
+            ids = rd.zrangebyscore(_season_date_key(season), low, high, start=offset, num=batch_size)
+            if timings is not None:
+                timings["redis"] = timings.get("redis", 0.0) + time.perf_counter() - started
+            if not ids:
+                break
+            yield from get_plays([i.decode() for i in ids], timings)
+            offset += len(ids)
+
+
+def count_plays_in_range(start_date, end_date):
+    """
+    Return how many plays have a GameDate inside [start_date, end_date].
+
+    Args:
+        start_date (date): First day of the range.
+        end_date (date): Last day of the range.
+
+    Returns:
+        int: The number of plays in range.
+    """
+    low, high = start_date.toordinal(), end_date.toordinal()
+    pipe = rd.pipeline(transaction=False)
+    for season in partitions_in_range(low, high):
+        pipe.zcount(_season_date_key(season), low, high)
+    return sum(pipe.execute())
+
+
+def refresh_partitions(seasons=None, staging=False):
+    """
+    Rewrite the manifest entries of some SeasonYear partitions from their
+    indexes: first and last GameDate and row count. Partitions left without
+    plays are dropped from the manifest.
+
+    Args:
+        seasons (iterable, optional): The partitions to refresh; all of them if None.
+        staging (bool, optional): Refresh the staged manifest instead of the live one.
+
+    Returns:
+        None
+    """
+    if seasons is None:
+        seasons = [s.decode() for s in rd.smembers(_staged(SEASONS_KEY, staging))]
+    seasons = sorted(seasons)
+    if not seasons:
+        return
+    pipe = rd.pipeline(transaction=False)
+    for season in seasons:
+        pipe.zcard(_staged(_season_index_key(season), staging))
+        pipe.zrange(_staged(_season_date_key(season), staging), 0, 0, withscores=True)
+        pipe.zrange(_staged(_season_date_key(season), staging), -1, -1, withscores=True)
+    replies = pipe.execute()
+    pipe = rd.pipeline(transaction=False)
+    for i, season in enumerate(seasons):
+        rows, first, last = replies[3 * i:3 * i + 3]
+        if not rows:
+            pipe.hdel(_staged(PARTITIONS_KEY, staging), season)
+            pipe.srem(_staged(SEASONS_KEY, staging), season)
+            continue
+        pipe.hset(_staged(PARTITIONS_KEY, staging), season, json.dumps({
+            "min_date": ordinal_date(int(first[0][1])) if first else "",
+            "max_date": ordinal_date(int(last[0][1])) if last else "",
+            "rows": rows
+        }))
+    pipe.execute()
+
+
+def get_partitions():
+    """
+    Return the partition manifest.
+
+    Args: none
+
+    Returns:
+        dict: SeasonYear -> {"min_date", "max_date" (YYYY-MM-DD, "" if no play
+            is dated), "rows"}, in season order.
+    """
+    raw = rd.hgetall(PARTITIONS_KEY)
+    return {k.decode(): json.loads(v) for k, v in sorted(raw.items())}
+
+
+def partitions_in_range(low, high):
+    """
+    Return the partitions holding plays dated inside [low, high], using only
+    the manifest; every other partition can be skipped.
+
+    Args:
+        low (int): Day ordinal of the first day.
+        high (int): Day ordinal of the last day.
+
+    Returns:
+        list: SeasonYears, ordered by their first GameDate.
+    """
+    bounds = [(date_ordinal(p["min_date"]), date_ordinal(p["max_date"]), season)
+              for season, p in get_partitions().items() if p["min_date"]]
+    return [season for first, last, season in sorted(bounds) if first <= high and last >= low]
+
+
+def count_plays():
+    """
+    Return the number of plays currently stored.
+
+    Args: none
+
+    Returns:
+        int: The size of the play_id index.
+    """
+    return rd.zcard(PLAY_INDEX_KEY)
+
+
+def _game_key(game_id):
+    """
+    Build the Redis key of the set holding the play_ids of one game.
+
+    Args:
+        game_id (str): The GameId.
+
+    Returns:
+        str: The Redis key.
+    """
+    return f"game:{game_id}:plays"
+
+
+def max_play_id():
+    """
+    Return the highest stored play_id.
+
+    Args: none
+
+    Returns:
+        int: The play_id, or 0 if no plays are stored.
+    """
+    last = rd.zrange(PLAY_INDEX_KEY, -1, -1, withscores=True)
+    return int(last[0][1]) if last else 0
+
+
+def get_game_fingerprints(game_ids):
+    """
+    Return the stored fingerprints of some games.
+
+    Args:
+        game_ids (list): GameIds, as strings.
+
+    Returns:
+        dict: GameId -> fingerprint, for the games that are stored.
+    """
+    if not game_ids:
+        return {}
+    values = rd.hmget(GAMES_KEY, game_ids)
+    return {g: v.decode() for g, v in zip(game_ids, values) if v is not None}
+
+
+def get_game_play_ids(game_ids):
+    """
+    Return the play_ids stored for some games.
+
+    Args:
+        game_ids (list): GameIds, as strings.
+
+    Returns:
+        list: The play_ids, in ascending order.
+    """
+    pipe = rd.pipeline(transaction=False)
+    for game_id in game_ids:
+        pipe.smembers(_game_key(game_id))
+    return sorted(int(pid) for ids in pipe.execute() for pid in ids)
+
+
+def save_games(fingerprints, game_plays, staging=False):
+    """
+    Record the fingerprints of games and add play_ids to their sets.
+
+    Args:
+        fingerprints (dict): GameId -> fingerprint.
+        game_plays (dict): GameId -> play_ids to add to the game.
+        staging (bool, optional): Write to the staged keys instead of the live ones.
+
+    Returns:
+        None
+    """
+    pipe = rd.pipeline(transaction=False)
+    if fingerprints:
+        pipe.hset(_staged(GAMES_KEY, staging), mapping=fingerprints)
+    for game_id, play_ids in game_plays.items():
+        if play_ids:
+            pipe.sadd(_staged(_game_key(game_id), staging), *play_ids)
+    pipe.execute()
+
+
+def delete_games(game_ids):
+    """
+    Delete the plays of some games from every index, along with the games'
+    play_id sets, and refresh the partition manifest. Their fingerprints are
+    kept until `save_games` replaces them.
+
+    Args:
+        game_ids (list): GameIds, as strings.
+
+    Returns:
+        int: The number of plays deleted.
+    """
+    play_ids = get_game_play_ids(game_ids)
+    type_keys = [_type_index_key(t.decode()) for t in rd.smembers(PLAY_TYPES_KEY)]
+    seasons = [s.decode() for s in rd.smembers(SEASONS_KEY)]
+    season_keys = [key for s in seasons for key in (_season_index_key(s), _season_date_key(s))]
+    deleted = 0
+    for i in range(0, len(play_ids), BATCH_SIZE):
+        ids = [str(pid) for pid in play_ids[i:i + BATCH_SIZE]]
+        pipe = rd.pipeline(transaction=False)
+        pipe.delete(*[_play_key(pid) for pid in ids])
+        for index in [PLAY_INDEX_KEY] + type_keys + season_keys:
+            pipe.zrem(index, *ids)
+        deleted += pipe.execute()[0]
+    if game_ids:
+        rd.delete(*[_game_key(g) for g in game_ids])
+    if play_ids:
+        refresh_partitions(seasons)
+    return deleted
+
+
+def date_bounds():
+    """
+    Return the first and last GameDate of the stored plays, from the
+    partition manifest.
+
+    Args: none
+
+    Returns:
+        tuple: (first, last) day ordinals, or (None, None) if no play is dated.
+    """
+    dated = [p for p in get_partitions().values() if p["min_date"]]
+    if not dated:
+        return None, None
+    return min(date_ordinal(p["min_date"]) for p in dated), max(date_ordinal(p["max_date"]) for p in dated)
+
+
+def _dataset_keys(staging=False):
+    """
+    List the keys of the indexes, partitions, game sets and rollups of the
+    live or the staged load (play records not included).
+
+    Args:
+        staging (bool, optional): List the staged load's keys instead.
+
+    Returns:
+        list: Key names, without the staging prefix.
+    """
+    pipe = rd.pipeline(transaction=False)
+    pipe.smembers(_staged(PLAY_TYPES_KEY, staging))
+    pipe.smembers(_staged(SEASONS_KEY, staging))
+    pipe.zrange(_staged(ROLLUP_DAYS_KEY, staging), 0, -1)
+    pipe.hkeys(_staged(GAMES_KEY, staging))
+    types, seasons, days, games = pipe.execute()
+    keys = [PLAY_INDEX_KEY, PLAY_TYPES_KEY, SEASONS_KEY, PARTITIONS_KEY, ROLLUP_DAYS_KEY, ROLLUP_READY_KEY, GAMES_KEY]
+    keys += [_type_index_key(t.decode()) for t in types]
+    keys += [key for s in seasons for key in (_season_index_key(s.decode()), _season_date_key(s.decode()))]
+    keys += [_rollup_key(d.decode()) for d in days]
+    keys += [_game_key(g.decode()) for g in games]
+    return keys
+
+
+def _delete_indexed_plays(index_key, batch_size=BATCH_SIZE, staging=False):
+    """
+    Delete the play records listed in a play_id index, then the index.
+
+    Args:
+        index_key (str): Key of a sorted set of play_ids.
+        batch_size (int, optional): Number of play keys removed per DEL call.
+        staging (bool, optional): The records are staged ones.
+
+    Returns:
+        int: The number of plays deleted.
+    """
+    deleted = 0
+    while True:
+        ids = rd.zrange(index_key, 0, batch_size - 1)
+        if not ids:
+            break
+        deleted += rd.delete(*[_staged(_play_key(pid.decode()), staging) for pid in ids])
+        rd.zrem(index_key, *ids)
+    rd.delete(index_key)
+    return deleted
+
+
+def _delete_keys(keys, batch_size=BATCH_SIZE):
+    for i in range(0, len(keys), batch_size):
+        rd.delete(*keys[i:i + batch_size])
+
+
+def discard_staged(batch_size=BATCH_SIZE):
+    """
+    Remove whatever an interrupted load left behind: its staged plays and
+    keys, and the plays of a replaced load that were not deleted yet.
+
+    Args:
+        batch_size (int, optional): Number of keys removed per DEL call.
+
+    Returns:
+        None
+    """
+    _delete_keys([STAGING_PREFIX + key for key in _dataset_keys(staging=True)], batch_size)
+    _delete_indexed_plays(STAGING_PREFIX + PLAY_INDEX_KEY, batch_size, staging=True)
+    _delete_indexed_plays(RETIRED_INDEX_KEY, batch_size)
+
+
+def publish_staged(batch_size=BATCH_SIZE):
+    """
+    Make a staged load live. Its plays, indexes, partitions, game sets and
+    rollups replace the live ones in a single MULTI/EXEC, so readers see
+    either the old load or the new one, never a partly built one. Staged
+    plays are renamed over the live plays with the same play_id, so play_ids
+    stay stable across reloads; plays of the old load beyond the new one are
+    deleted afterwards.
+
+    Args:
+        batch_size (int, optional): Number of old play keys removed per DEL call.
+
+    Returns:
+        int: The number of old plays deleted.
+    """
+    staged = _dataset_keys(staging=True)
+    live = [key for key in _dataset_keys() if key != PLAY_INDEX_KEY]
+    play_ids = [pid.decode() for pid in rd.zrange(STAGING_PREFIX + PLAY_INDEX_KEY, 0, -1)]
+    pipe = rd.pipeline(transaction=False)
+    pipe.exists(PLAY_INDEX_KEY)
+    for key in staged:
+        pipe.exists(STAGING_PREFIX + key)
+    has_index, *has_staged = pipe.execute()
+
+    pipe = rd.pipeline(transaction=True)
+    if has_index:
+        # Old plays the new load does not overwrite
+        pipe.zdiffstore(RETIRED_INDEX_KEY, [PLAY_INDEX_KEY, STAGING_PREFIX + PLAY_INDEX_KEY])
+        pipe.delete(PLAY_INDEX_KEY)
+    if live:
+        pipe.delete(*live)
+    for key, exists in zip(staged, has_staged):
+        if exists:
+            pipe.rename(STAGING_PREFIX + key, key)
+    for play_id in play_ids:
+        pipe.rename(STAGING_PREFIX + _play_key(play_id), _play_key(play_id))
+    pipe.execute()
+    deleted = _delete_indexed_plays(RETIRED_INDEX_KEY, batch_size)
+    logging.debug(f"Published the staged load; deleted {deleted} plays of the previous one.")
+    return deleted
+
+
+def delete_plays(batch_size=BATCH_SIZE):
+    """
+    Delete every stored play along with the play_id and PlayType indexes,
+    the SeasonYear partitions and their manifest, and the per-day rollups.
+    The change log is reset to a single change covering every day.
+
+    Args:
+        batch_size (int, optional): Number of play keys removed per DEL call.
+
+    Returns:
+        int: The number of plays deleted.
+    """
+    keys = [key for key in _dataset_keys() if key != PLAY_INDEX_KEY]
+    deleted = _delete_indexed_plays(PLAY_INDEX_KEY, batch_size)
+    _delete_keys(keys + [META_KEY, SOURCE_KEY, INJURY_TAGS_KEY, CHANGES_KEY], batch_size)
+    bump_dataset_version()  # every earlier result is stale
+    logging.debug(f"Deleted {deleted} plays from Redis.")
+    return deleted
+
+
+def save_rollups(days, staging=False):
+    """
+    Add per-day combo counts into the stored rollups. Counts are added with
+    HINCRBY, so rollups for the same day from different chunks accumulate.
+
+    Args:
+        days (dict): GameDate ordinal -> {combo key: [total_plays, injury_plays]}.
+        staging (bool, optional): Add to the staged rollups instead of the live ones.
+
+    Returns:
+        None
+    """
+    pipe = rd.pipeline(transaction=False)
+    for ordinal, combos in days.items():
+        key = _staged(_rollup_key(ordinal), staging)
+        for combo, (total, injuries) in combos.items():
+            pipe.hincrby(key, f"total:{combo}", total)
+            pipe.hincrby(key, f"injury:{combo}", injuries)
+        pipe.zadd(_staged(ROLLUP_DAYS_KEY, staging), {str(ordinal): ordinal})
+    pipe.execute()
+
+
+def remove_rollups(days):
+    """
+    Subtract per-day combo counts from the stored rollups, the reverse of
+    `save_rollups`. Combos and days left without plays are dropped.
+
+    Args:
+        days (dict): GameDate ordinal -> {combo key: [total_plays, injury_plays]}.
+
+    Returns:
+        None
+    """
+    pipe = rd.pipeline(transaction=False)
+    fields = []
+    for ordinal, combos in days.items():
+        for combo, (total, injuries) in combos.items():
+            pipe.hincrby(_rollup_key(ordinal), f"total:{combo}", -total)
+            pipe.hincrby(_rollup_key(ordinal), f"injury:{combo}", -injuries)
+            fields.append((ordinal, combo))
+    remaining = pipe.execute()[::2]
+
+    pipe = rd.pipeline(transaction=False)
+    for (ordinal, combo), total in zip(fields, remaining):
+        if total <= 0:
+            pipe.hdel(_rollup_key(ordinal), f"total:{combo}", f"injury:{combo}")
+    pipe.execute()
+    for ordinal in days:
+        if not rd.exists(_rollup_key(ordinal)):
+            rd.zrem(ROLLUP_DAYS_KEY, str(ordinal))
+
+
+def mark_rollups_ready(staging=False):
+    """
+    Record that the rollups cover every stored play.
+
+    Args:
+        staging (bool, optional): Mark the staged rollups instead of the live ones.
+
+    Returns:
+        None
+    """
+    rd.set(_staged(ROLLUP_READY_KEY, staging), 1)
+
+
+def rollups_ready():
+    """
+    Return whether the per-day rollups cover every stored play.
+
+    Args: none
+
+    Returns:
+        bool: True once an ingest has finished writing rollups.
+    """
+    return bool(rd.exists(ROLLUP_READY_KEY))
+
+
+def get_day_rollups(start_date, end_date):
+    """
+    Return the per-day rollups for every GameDate inside [start_date, end_date].
+
+    Args:
+        start_date (date): First day of the range.
+        end_date (date): Last day of the range.
+
+    Returns:
+        dict: GameDate ordinal -> {combo key: [total_plays, injury_plays]}.
+    """
+    ordinals = [int(o) for o in rd.zrangebyscore(ROLLUP_DAYS_KEY, start_date.toordinal(), end_date.toordinal())]
+    pipe = rd.pipeline(transaction=False)
+    for ordinal in ordinals:
+        pipe.hgetall(_rollup_key(ordinal))
+
+    days = {}
+    for ordinal, day in zip(ordinals, pipe.execute()):
+        combos = days.setdefault(ordinal, {})
+        for field, value in day.items():
+            kind, combo = field.decode().split(":", 1)
+            counts = combos.setdefault(combo, [0, 0])
+            counts[0 if kind == "total" else 1] += int(value)
+    return days
+
+
+def sum_rollups(start_date, end_date):
+    """
+    Sum the per-day rollups for every GameDate inside [start_date, end_date].
+
+    Args:
+        start_date (date): First day of the range.
+        end_date (date): Last day of the range.
+
+    Returns:
+        dict: Combo key -> [total_plays, injury_plays].
+    """
+    totals = {}
+    for combos in get_day_rollups(start_date, end_date).values():
+        for combo, (total, injuries) in combos.items():
+            counts = totals.setdefault(combo, [0, 0])
+            counts[0] += total
+            counts[1] += injuries
+    return totals
+
+
+def delete_rollups():
+    """
+    Delete every per-day rollup.
+
+    Args: none
+
+    Returns:
+        None
+    """
+    ordinals = rd.zrange(ROLLUP_DAYS_KEY, 0, -1)
+    if ordinals:
+        rd.delete(*[_rollup_key(o.decode()) for o in ordinals])
+    rd.delete(ROLLUP_DAYS_KEY, ROLLUP_READY_KEY)
+
+
+def register_injury_keywords(keywords):
+    """
+    Give each injury keyword a bit in the InjuryFlags of stored plays. Bits are
+    never reused, so flags computed earlier stay valid when keywords are added
+    or dropped.
+
+    Args:
+        keywords (iterable): Lower-case keywords that should have a bit.
+
+    Returns:
+        list: Every registered keyword, indexed by bit.
+    """
+    registered = [k.decode() for k in rd.lrange(INJURY_KEYWORDS_KEY, 0, -1)]
+    for keyword in keywords:
+        if keyword not in registered:
+            if len(registered) >= MAX_INJURY_KEYWORDS:
+                raise ValueError(f"At most {MAX_INJURY_KEYWORDS} injury keywords can be registered")
+            rd.rpush(INJURY_KEYWORDS_KEY, keyword)
+            registered.append(keyword)
+    return registered
+
+
+def get_injury_tags():
+    """
+    Return how the stored plays are tagged.
+
+    Args: none
+
+    Returns:
+        dict: tagged (how many registered keywords the stored InjuryFlags
+            cover) and mask (the bits that count as an injury), or an empty
+            dict if the stored plays carry no flags.
+    """
+    raw = rd.hgetall(INJURY_TAGS_KEY)
+    return {k.decode(): int(v) for k, v in raw.items()}
+
+
+def set_injury_tags(tagged, mask):
+    """
+    Record how the stored plays are tagged (see `get_injury_tags`).
+
+    Args:
+        tagged (int): Number of registered keywords covered by InjuryFlags.
+        mask (int): The bits that count as an injury.
+
+    Returns:
+        None
+    """
+    rd.hset(INJURY_TAGS_KEY, mapping={"tagged": tagged, "mask": mask})
+
+
+def lock_injury_tagging():
+    """
+    Take the lock held while stored plays are re-tagged, so only one process
+    re-tags at a time.
+
+    Args: none
+
+    Returns:
+        bool: True if the lock was taken.
+    """
+    return bool(rd.set(INJURY_LOCK_KEY, os.getpid(), nx=True, ex=INJURY_LOCK_TTL))
+
+
+def unlock_injury_tagging():
+    rd.delete(INJURY_LOCK_KEY)
+
+
+def lock_dataset():
+    """
+    Take the lock held while plays are loaded, appended or re-tagged. The
+    rollups are built with HINCRBY, so two loads running at once would add
+    their counts on top of each other.
+
+    Args: none
+
+    Returns:
+        bool: True if the lock was taken.
+    """
+    return bool(rd.set(DATASET_LOCK_KEY, os.getpid(), nx=True, ex=DATASET_LOCK_TTL))
+
+
+def unlock_dataset():
+    rd.delete(DATASET_LOCK_KEY)
+
+
+def set_dataset_meta(meta):
+    """
+    Replace the metadata record describing the loaded dataset.
+
+    Args:
+        meta (dict): min_date, max_date, rows, seasons, version and loaded_at.
+
+    Returns:
+        None
+    """
+    fields = dict(meta)
+    fields["seasons"] = json.dumps(fields.get("seasons", {}))
+    pipe = rd.pipeline()
+    pipe.delete(META_KEY)
+    pipe.hset(META_KEY, mapping={k: str(v) for k, v in fields.items()})
+    pipe.execute()
+
+
+def get_dataset_meta():
+    """
+    Return the metadata record describing the loaded dataset.
+
+    Args: none
+
+    Returns:
+        dict: min_date and max_date (YYYY-MM-DD), rows, seasons (season -> row
+            count), version and loaded_at, or an empty dict if nothing is loaded.
+    """
+    raw = {k.decode(): v.decode() for k, v in rd.hgetall(META_KEY).items()}
+    if not raw:
+        return {}
+    meta = dict(raw)
+    meta["rows"] = int(raw["rows"])
+    meta["version"] = int(raw["version"])
+    meta["seasons"] = json.loads(raw["seasons"])
+    return meta
+
+
+def get_dataset_source():
+    """
+    Return the record describing the CSV file the stored plays were loaded from.
+
+    Args: none
+
+    Returns:
+        dict: The source record (path, mtime, size, sha256, schema), or an
+            empty dict if nothing is loaded.
+    """
+    raw = rd.hgetall(SOURCE_KEY)
+    return {k.decode(): v.decode() for k, v in raw.items()}
+
+
+def set_dataset_source(source):
+    """
+    Replace the record describing the CSV file the stored plays came from.
+
+    Args:
+        source (dict): The source fields to store.
+
+    Returns:
+        None
+    """
+    pipe = rd.pipeline()
+    pipe.delete(SOURCE_KEY)
+    pipe.hset(SOURCE_KEY, mapping={k: str(v) for k, v in source.items()})
+    pipe.execute()
+
+
+def get_dataset_version():
+    """
+    Return the current dataset version.
+
+    Args: none
+
+    Returns:
+        int: The version, or 0 if no load has ever completed.
+    """
+    return int(rd.get(VERSION_KEY) or 0)
+
+
+def _day_runs(days):
+    """Group day ordinals into (first, last) runs of consecutive days."""
+    runs = []
+    for day in sorted(set(days)):
+        if runs and day == runs[-1][1] + 1:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+def bump_dataset_version(days=None):
+    """
+    Increment the dataset version after the stored plays change, recording
+    each run of consecutive changed days so results for other days can still
+    be reused.
+
+    Args:
+        days (iterable, optional): Day ordinals of the changed GameDates.
+            Without any, every day counts as changed.
+
+    Returns:
+        int: The new version.
+    """
+    runs = _day_runs(days) if days else [(0, date.max.toordinal())]
+    version = rd.incr(VERSION_KEY)
+    rd.zadd(CHANGES_KEY, {f"{version}:{first}:{last}": version for first, last in runs})
+    return version
+
+
+def prune_dataset_changes(version):
+    """
+    Forget the changes recorded up to a dataset version. Only changes made
+    after a result's version can invalidate it, so once no live job is older
+    than `version` those entries are never read again.
+
+    Args:
+        version (int): The version of the oldest job that may still be reused.
+
+    Returns:
+        None
+    """
+    rd.zremrangebyscore(CHANGES_KEY, "-inf", version)
+
+
+def dataset_changed_since(version, start_date, end_date):
+    """
+    Tell whether any day inside [start_date, end_date] changed after a given
+    dataset version.
+
+    Args:
+        version (int): The dataset version a result was computed against.
+        start_date (str): First day of the range (YYYY-MM-DD).
+        end_date (str): Last day of the range (YYYY-MM-DD).
+
+    Returns:
+        bool: True if plays in the range were added, replaced or removed since.
+    """
+    start = date.fromisoformat(start_date).toordinal()
+    end = date.fromisoformat(end_date).toordinal()
+    for change in rd.zrangebyscore(CHANGES_KEY, f"({version}", "+inf"):
+        _, first, last = change.decode().split(":")
+        if int(first) <= end and int(last) >= start:
+            return True
+    return False
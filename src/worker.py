@@ -1,26 +1,327 @@
+import io
 import time
-import json
-import redis
+import math
+import random
+import cProfile
+import pstats
 import os
+import signal
+import socket
 import logging
-from hotqueue import HotQueue
-from datetime import datetime
-from dateutil import parser
-from jobs import get_job_by_id, update_job_status
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from jobs import (
+    get_job_by_id,
+    update_job_status,
+    queue_shards,
+    save_shard_result,
+    pop_shard_results,
+    discard_shards,
+    store_result,
+    get_next_task,
+    report_worker,
+    publish_event,
+    add_job_profile,
+    save_job_profile,
+    save_job_cprofile
+)
+from storage import (
+    iter_plays_in_range,
+    count_plays,
+    count_plays_in_range,
+    rollups_ready,
+    sum_rollups,
+    get_day_rollups,
+    column_categories,
+    get_injury_tags,
+    CATEGORY_DICTIONARIES
+)
+from ingest import retag_injuries
+from codec import encode
+from metrics import observe_shared
+from analysis import (
+    plays_frame,
+    injury_partials,
+    day_partials,
+    merge_partials,
+    finalize_combo_counts,
+    group_frame,
+    group_partials,
+    merge_group_partials,
+    finalize_groups,
+    CATEGORY_COLUMNS
+)
 
 # Setup logging
 log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(level=getattr(logging, log_level))
 
-# Redis configuration
-_redis_ip = os.environ.get('REDIS_HOST', 'redis-db')
-_redis_port = int(os.environ.get('REDIS_PORT', 6379))
+SHARD_SIZE = int(os.environ.get("SHARD_SIZE", 100000))  # plays per shard when a job fans out
+PROGRESS_ROWS = int(os.environ.get("PROGRESS_ROWS", 50000))  # plays scanned between progress events
+
+# Opt-in cProfile of a sample of jobs; reports are kept for the slow ones
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))  # share of jobs profiled
+PROFILE_MIN_SECONDS = float(os.environ.get("PROFILE_MIN_SECONDS", 5))  # keep reports of jobs slower than this
+PROFILE_TOP = int(os.environ.get("PROFILE_TOP", 40))  # functions listed in a report
+PROFILE_DIR = os.environ.get("PROFILE_DIR")  # also write raw .prof dumps here
+
+# Worker pool
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", 1))  # tasks run at once
+WORKER_POOL = os.environ.get("WORKER_POOL", "thread")  # "thread" or "process"
+WORKER_PREFETCH = int(os.environ.get("WORKER_PREFETCH", 0))  # tasks taken ahead of a free slot
+WORKER_REPORT_INTERVAL = float(os.environ.get("WORKER_REPORT_INTERVAL", 10))  # seconds
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_draining = threading.Event()  # set on SIGTERM/SIGINT: take no new tasks, finish the rest
+
+
+def _add_stage(stages, stage, seconds, rows=0):
+    """
+    Add time and rows to one stage of a job's profile.
+
+    Args:
+        stages (dict): Stage name -> {"seconds": float, "rows": int}.
+        stage (str): The stage name.
+        seconds (float): Time spent in the stage.
+        rows (int, optional): Rows the stage handled.
+
+    Returns:
+        None
+    """
+    entry = stages.setdefault(stage, {"seconds": 0.0, "rows": 0})
+    entry["seconds"] += seconds
+    entry["rows"] += rows
+
+
+def _result_fields(partials, analysis=None):
+    """
+    Finalize partials into the fields of a job's result.
+
+    Args:
+        partials: Combo partials, or group partials when `analysis` is given.
+        analysis (dict, optional): The job's group-by analysis.
+
+    Returns:
+        dict: {"aggregations": ...} for a group-by analysis, otherwise
+            {"injury_combo_counts": ...}.
+    """
+    if analysis:
+        return {"aggregations": finalize_groups(analysis, partials)}
+    return {"injury_combo_counts": finalize_combo_counts(partials)}
+
+
+def _scan_partials(start_date, end_date, job_id=None, total_rows=None, stages=None, analysis=None):
+    """
+    Compute partial counts by scanning the plays inside a date range: the
+    injury combo breakdown, or every grouping of a generic analysis, all from
+    the same pass. When `job_id` is given, a progress event with the running
+    result is published every PROGRESS_ROWS plays.
+
+    Args:
+        start_date (datetime): First day of the range.
+        end_date (datetime): Last day of the range.
+        job_id (str, optional): The job to publish progress for.
+        total_rows (int, optional): Plays in the range, for the percent done.
+        stages (dict, optional): Collects time and rows per stage (redis,
+            decode, parse, aggregate).
+        analysis (dict, optional): Group-by dimensions and metrics (see
+            analysis.parse_analysis).
+
+    Returns:
+        Combo key -> [total_plays, injury_plays], or per grouping the group
+            partials when `analysis` is given.
+    """
+    # The GameDate index only returns plays inside the range
+    timings = {} if stages is not None else None
+    injury_mask = get_injury_tags().get("mask")
+    plays = iter_plays_in_range(start_date, end_date, timings=timings)
+    partials = [] if analysis else {}
+    rows = 0
+    while True:
+        chunk = list(islice(plays, PROGRESS_ROWS))
+        if not chunk:
+            break
+        rows += len(chunk)
+        parse_started = time.perf_counter()
+        if analysis:
+            frame = group_frame(chunk, analysis, column_categories(CATEGORY_DICTIONARIES), injury_mask)
+            aggregate_started = time.perf_counter()
+            merge_group_partials(partials, group_partials(frame, analysis))
+        else:
+            frame = plays_frame(chunk, column_categories(CATEGORY_COLUMNS), injury_mask)
+            aggregate_started = time.perf_counter()
+            merge_partials(partials, injury_partials(frame))
+        if stages is not None:
+            _add_stage(stages, "parse", aggregate_started - parse_started, len(chunk))
+            _add_stage(stages, "aggregate", time.perf_counter() - aggregate_started, len(frame))
+        if job_id:
+            progress = {
+                "rows_processed": rows,
+                "rows_total": total_rows,
+                "percent": round(100 * rows / total_rows, 1) if total_rows else None
+            }
+            if analysis:
+                progress["partial_aggregations"] = finalize_groups(analysis, partials)
+            else:
+                progress["partial_counts"] = finalize_combo_counts(partials)
+            publish_event(job_id, "progress", progress)
+    if stages is not None:
+        _add_stage(stages, "redis", timings.get("redis", 0.0), rows)
+        _add_stage(stages, "decode", timings.get("decode", 0.0), rows)
+    logging.debug(f"Scanned {rows} plays from {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d}.")
+    return partials
+
+
+def _shard_ranges(start_date, end_date, shards):
+    """
+    Split a date range into at most `shards` contiguous, non-overlapping ranges.
+
+    Args:
+        start_date (datetime): First day of the range.
+        end_date (datetime): Last day of the range.
+        shards (int): The number of ranges wanted.
+
+    Returns:
+        list: (start, end) YYYY-MM-DD pairs covering the whole range.
+    """
+    days = (end_date - start_date).days + 1
+    shards = max(1, min(shards, days))
+    bounds = [start_date + timedelta(days=days * i // shards) for i in range(shards + 1)]
+    return [(bounds[i].strftime("%Y-%m-%d"), (bounds[i + 1] - timedelta(days=1)).strftime("%Y-%m-%d"))
+            for i in range(shards)]
+
+
+def _store_result(job, partials, stages=None):
+    """
+    Finalize partial counts into the job's result, store it and mark the job
+    complete. When `stages` is given, the job's profile is saved on its record.
+
+    Args:
+        job (dict): The job dictionary.
+        partials: Combo key -> [total_plays, injury_plays], or group partials
+            for a job with a group-by analysis.
+        stages (dict, optional): Time and rows per stage spent on the job.
+
+    Returns:
+        None
+    """
+    finalize_started = time.perf_counter()
+    result = {
+        "job_id": job["id"],
+        "start_date": job.get("start"),
+        "end_date": job.get("end"),
+        **_result_fields(partials, job.get("analysis"))
+    }
+    payload = encode(result)
+
+    store_started = time.perf_counter()
+    store_result(job["id"], payload)
+    if stages is not None:
+        _add_stage(stages, "finalize", store_started - finalize_started, len(partials))
+        _add_stage(stages, "store", time.perf_counter() - store_started, len(partials))
+        add_job_profile(job["id"], stages)
+        save_job_profile(job["id"])
+    update_job_status(job["id"], "complete")
+    logging.info(f"Job {job['id']} completed and result stored.")
+
+
+def _merge_ranges(ranges):
+    """
+    Merge overlapping or adjacent date ranges so each day is covered once.
+
+    Args:
+        ranges (list): (start, end) datetime pairs.
+
+    Returns:
+        list: Sorted, disjoint (start, end) datetime pairs covering the same days.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _batch_day_partials(ranges):
+    """
+    Read per-day combo partials for every day covered by any of the ranges,
+    touching each day (from the rollups, or from one scan of its plays) once.
+
+    Args:
+        ranges (list): (start, end) datetime pairs.
+
+    Returns:
+        dict: GameDate day ordinal -> combo partials.
+    """
+    use_rollups = rollups_ready()
+    days = {}
+    for start_date, end_date in _merge_ranges(ranges):
+        if use_rollups:
+            days.update(get_day_rollups(start_date, end_date))
+        else:
+            plays = list(iter_plays_in_range(start_date, end_date))
+            injury_mask = get_injury_tags().get("mask")
+            days.update(day_partials(plays_frame(plays, column_categories(CATEGORY_COLUMNS), injury_mask)))
+    return days
+
+
+def run_batch(batch: dict) -> None:
+    """
+    Compute every pending job of a batch from a single pass over the union of
+    their date ranges, then store each job's result.
+
+    Args:
+        batch (dict): The batch job dictionary.
+
+    Returns:
+        None
+    """
+    children = [job for job in (get_job_by_id(jid) for jid in batch.get("pending", [])) if job]
+    for job in children:
+        update_job_status(job["id"], "in progress")
+
+    stages = {}
+    try:
+        ranges = {job["id"]: (datetime.strptime(job["start"], "%Y-%m-%d"),
+                              datetime.strptime(job["end"], "%Y-%m-%d")) for job in children}
+        read_started = time.perf_counter()
+        days = _batch_day_partials(ranges.values())
+        _add_stage(stages, "read", time.perf_counter() - read_started, len(days))
+        logging.debug(f"Batch {batch['id']} read {len(days)} days for {len(children)} jobs.")
+
+        for done, job in enumerate(children, start=1):
+            aggregate_started = time.perf_counter()
+            first, last = (d.toordinal() for d in ranges[job["id"]])
+            partials = {}
+            for ordinal, day in days.items():
+                if first <= ordinal <= last:
+                    merge_partials(partials, day)
+            _add_stage(stages, "aggregate", time.perf_counter() - aggregate_started, len(partials))
+            store_started = time.perf_counter()
+            _store_result(job, partials)
+            _add_stage(stages, "store", time.perf_counter() - store_started, 1)
+            publish_event(batch["id"], "progress", {
+                "jobs_done": done,
+                "jobs_total": len(children),
+                "percent": round(100 * done / len(children), 1)
+            })
+
+        add_job_profile(batch["id"], stages)
+        save_job_profile(batch["id"])
+        update_job_status(batch["id"], "complete")
+        logging.info(f"Batch {batch['id']} completed {len(children)} jobs.")
+
+    except Exception as e:
+        logging.error(f"Error processing batch {batch['id']}: {e}")
+        for job in children:
+            if (get_job_by_id(job["id"]) or {}).get("status") != "complete":
+                update_job_status(job["id"], "failed")
+        update_job_status(batch["id"], "failed")
 
-# Redis connections
-rd = redis.Redis(host=_redis_ip, port=_redis_port, db=0)  # raw data
-q = HotQueue("queue", host=_redis_ip, port=_redis_port, db=1)  # hot queue
-jdb = redis.Redis(host=_redis_ip, port=_redis_port, db=2)  # job DB
-results_db = redis.Redis(host=_redis_ip, port=_redis_port, db=3, decode_responses=True)  # results
 
 def run_worker_job_logic(job_id: str) -> None:
     logging.info(f"Worker picked up job {job_id} from queue.")
@@ -31,77 +332,244 @@ def run_worker_job_logic(job_id: str) -> None:
             return
 
         update_job_status(job_id, "in progress")
+        add_job_profile(job_id, {}, started=time.time())
+
+        if job.get("type") == "batch":
+            run_batch(job)
+            return
 
         start_date = datetime.strptime(job.get("start"), "%Y-%m-%d")
         end_date = datetime.strptime(job.get("end"), "%Y-%m-%d")
 
-        raw_data = rd.get("nfl_data")
-        if not raw_data:
+        if not count_plays():
             logging.error("No NFL data found in Redis.")
             update_job_status(job_id, "failed")
             return
 
-        play_list = json.loads(raw_data)
-        injury_combo_counts = {}
-
-        for play in play_list:
-            try:
-                game_date_str = play.get("GameDate", "1900-01-01")
-                play_date = parser.parse(game_date_str)
-
-                if not (start_date <= play_date <= end_date):
-                    continue
-
-                description = play.get("Description", "").lower()
-                formation = play.get("Formation", "Unknown")
-                play_type = play.get("PlayType", "").upper()
-
-                if play_type == "RUSH":
-                    direction = play.get("RushDirection", "Unknown")
-                elif play_type == "PASS":
-                    direction = play.get("PassType", "Unknown")
-                else:
-                    continue
-
-                key = f"Formation: {formation}; PlayType: {play_type}; Direction: {direction}"
-                if key not in injury_combo_counts:
-                    injury_combo_counts[key] = {
-                        "injury_plays": 0,
-                        "total_plays": 0,
-                        "injury_percentage": 0.0
-                    }
-
-                injury_combo_counts[key]["total_plays"] += 1
-                if "injured" in description:
-                    injury_combo_counts[key]["injury_plays"] += 1
-
-                total = injury_combo_counts[key]["total_plays"]
-                injuries = injury_combo_counts[key]["injury_plays"]
-                injury_combo_counts[key]["injury_percentage"] = round((injuries / total) * 100, 2) if total > 0 else 0.0
-
-            except Exception as e:
-                logging.warning(f"Error parsing play: {e}")
-                continue
-
-        result = {
-            "job_id": job_id,
-            "start_date": job.get("start"),
-            "end_date": job.get("end"),
-            "injury_combo_counts": injury_combo_counts
-        }
+        stages = {}
+        analysis = job.get("analysis")
+        if rollups_ready() and not analysis:
+            # Sum the per-day rollups written at ingest (they only hold the injury combos)
+            rollups_started = time.perf_counter()
+            partials = sum_rollups(start_date, end_date)
+            _add_stage(stages, "rollups", time.perf_counter() - rollups_started, len(partials))
+        else:
+            plan_started = time.perf_counter()
+            total_rows = count_plays_in_range(start_date, end_date)
+            shards = math.ceil(total_rows / SHARD_SIZE)
+            _add_stage(stages, "plan", time.perf_counter() - plan_started, total_rows)
+            if shards > 1:
+                # Let every worker take a piece; the last shard to finish stores the result
+                add_job_profile(job_id, stages)
+                queue_shards(job_id, _shard_ranges(start_date, end_date, shards))
+                return
+            partials = _scan_partials(start_date, end_date, job_id, total_rows, stages, analysis)
 
-        results_db.set(job_id, json.dumps(result))
-        update_job_status(job_id, "complete")
-        logging.info(f"Job {job_id} completed and result stored.")
+        _store_result(job, partials, stages)
 
     except Exception as e:
         logging.error(f"Error processing job {job_id}: {e}")
         update_job_status(job_id, "failed")
 
 
-@q.worker
-def do_work(job_id):
-    run_worker_job_logic(job_id)
+def run_shard(task: dict) -> None:
+    """
+    Compute one shard of a fanned-out job. The worker that finishes the last
+    shard merges every shard's partial counts and completes the job. Once a
+    shard fails the job is failed, its shard keys are deleted and the
+    remaining shards are skipped.
+
+    Args:
+        task (dict): The shard message (job_id, shard, shards, start, end).
+
+    Returns:
+        None
+    """
+    job_id = task["job_id"]
+    logging.info(f"Worker picked up shard {task['shard']} of job {job_id}.")
+    try:
+        stages = {}
+        job = get_job_by_id(job_id)
+        if not job or job["status"] == "failed":
+            logging.info(f"Skipping shard {task['shard']} of job {job_id}: the job failed or expired.")
+            discard_shards(job_id)
+            return
+        analysis = job.get("analysis")
+        partials = _scan_partials(datetime.strptime(task["start"], "%Y-%m-%d"),
+                                  datetime.strptime(task["end"], "%Y-%m-%d"), stages=stages, analysis=analysis)
+        add_job_profile(job_id, stages)
+        if (get_job_by_id(job_id) or {}).get("status") == "failed":
+            discard_shards(job_id)  # another shard failed while this one ran
+            return
+        remaining = save_shard_result(job_id, task["shard"], partials)
+        shards = task.get("shards")
+        if shards:
+            publish_event(job_id, "progress", {
+                "shards_done": shards - remaining,
+                "shards_total": shards,
+                "percent": round(100 * (shards - remaining) / shards, 1)
+            })
+        if remaining > 0:
+            return
+
+        merge_started = time.perf_counter()
+        merged = [] if analysis else {}
+        merge = merge_group_partials if analysis else merge_partials
+        shard_results = pop_shard_results(job_id)
+        for shard_partials in shard_results:
+            merge(merged, shard_partials)
+        stages = {}
+        _add_stage(stages, "merge", time.perf_counter() - merge_started, len(shard_results))
+
+        job = get_job_by_id(job_id)
+        if job and job["status"] != "failed":
+            _store_result(job, merged, stages)
+
+    except Exception as e:
+        logging.error(f"Error processing shard {task['shard']} of job {job_id}: {e}")
+        update_job_status(job_id, "failed")
+        discard_shards(job_id)
+
+
+def run_profiled(job_id: str) -> None:
+    """
+    Run a job under cProfile. The report is kept with the job only if it took
+    at least PROFILE_MIN_SECONDS, so sampling costs storage only for outliers.
+
+    Args:
+        job_id (str): The job ID.
+
+    Returns:
+        None
+    """
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        run_worker_job_logic(job_id)
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+        if elapsed >= PROFILE_MIN_SECONDS:
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            save_job_cprofile(job_id, report.getvalue())
+            if PROFILE_DIR:
+                profiler.dump_stats(os.path.join(PROFILE_DIR, f"{job_id}.prof"))
+            logging.info(f"Kept cProfile report of job {job_id} ({elapsed:.2f}s).")
+
+
+def run_task(is_shard: bool, msg) -> float:
+    """
+    Run one task taken off the queues.
+
+    Args:
+        is_shard (bool): True for a shard message, False for a job ID.
+        msg: The shard message or job ID.
+
+    Returns:
+        float: Seconds spent running the task.
+    """
+    started = time.perf_counter()
+    if is_shard:
+        run_shard(msg)
+    elif PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        run_profiled(msg)
+    else:
+        run_worker_job_logic(msg)
+    elapsed = time.perf_counter() - started
+    observe_shared("task_run_seconds", elapsed, kind="shard" if is_shard else "job")
+    return elapsed
+
+
+def _request_drain(signum, frame):
+    logging.info(f"Received signal {signum}; draining worker {WORKER_ID}.")
+    _draining.set()
+
+
+def do_work(concurrency=None, pool=None, prefetch=None):
+    """
+    Take shards and jobs off the queues, shards first, and run up to
+    `concurrency` of them at once on a thread or process pool. Up to
+    `prefetch` more are taken ahead so a slot never waits on Redis. Runs
+    until SIGTERM/SIGINT, then stops taking tasks and finishes those it
+    already took.
+
+    Args:
+        concurrency (int, optional): Pool size; defaults to WORKER_CONCURRENCY.
+        pool (str, optional): "thread" or "process"; defaults to WORKER_POOL.
+        prefetch (int, optional): Extra tasks to hold; defaults to WORKER_PREFETCH.
+
+    Returns:
+        None
+    """
+    concurrency = max(1, concurrency or WORKER_CONCURRENCY)
+    pool = pool or WORKER_POOL
+    prefetch = max(0, WORKER_PREFETCH if prefetch is None else prefetch)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _request_drain)
+        signal.signal(signal.SIGINT, _request_drain)
+
+    slots = threading.BoundedSemaphore(concurrency + prefetch)
+    lock = threading.Lock()
+    in_flight = set()
+    stats = {"tasks_done": 0, "tasks_failed": 0, "busy_seconds": 0.0}
+    started = time.time()
+
+    def _finished(future):
+        with lock:
+            in_flight.discard(future)
+            if future.exception() is None:
+                stats["tasks_done"] += 1
+                stats["busy_seconds"] += future.result()
+            else:
+                stats["tasks_failed"] += 1
+                logging.error(f"Task failed in worker {WORKER_ID}: {future.exception()}")
+        slots.release()
+
+    def _report(state):
+        with lock:
+            held = len(in_flight)
+            uptime = max(time.time() - started, 1e-9)
+            report_worker(WORKER_ID, {
+                "state": state,
+                "pool": pool,
+                "concurrency": concurrency,
+                "prefetch": prefetch,
+                "running": min(held, concurrency),
+                "prefetched": max(held - concurrency, 0),
+                "tasks_done": stats["tasks_done"],
+                "tasks_failed": stats["tasks_failed"],
+                "busy_seconds": round(stats["busy_seconds"], 3),
+                "uptime_seconds": round(uptime, 3),
+                "utilization": round(min(stats["busy_seconds"] / (uptime * concurrency), 1.0), 4)
+            })
+
+    executor_class = ProcessPoolExecutor if pool == "process" else ThreadPoolExecutor
+    logging.info(f"Worker {WORKER_ID} running {concurrency} {pool}(s) with prefetch {prefetch}.")
+    last_report = 0.0
+    with executor_class(max_workers=concurrency) as executor:
+        while not _draining.is_set():
+            if time.time() - last_report >= WORKER_REPORT_INTERVAL:
+                _report("running")
+                last_report = time.time()
+            if not slots.acquire(timeout=1):
+                continue
+            task = get_next_task(timeout=1)
+            if task is None:
+                slots.release()
+                continue
+            future = executor.submit(run_task, *task)
+            with lock:
+                in_flight.add(future)
+            future.add_done_callback(_finished)
+
+        logging.info(f"Worker {WORKER_ID} draining {len(in_flight)} task(s).")
+        _report("draining")
+    _report("stopped")
+    logging.info(f"Worker {WORKER_ID} stopped.")
 
 if __name__ == "__main__":
+    # Pick up a changed INJURY_KEYWORDS setting once, before taking jobs
+    retag_injuries()
     do_work()
@@ -0,0 +1,140 @@
+import pytest
+import pandas as pd
+from datetime import datetime
+from analysis import (
+    plays_frame,
+    injury_flags,
+    keyword_mask,
+    parse_analysis,
+    group_frame,
+    group_partials,
+    merge_group_partials,
+    finalize_groups,
+    date_mask,
+    injury_partials,
+    day_partials,
+    merge_partials,
+    finalize_combo_counts
+)
+
+MOCK_PLAYS = [
+    {"GameDate": "01/01/12", "Description": "Player was INJURED on the play.", "Formation": "Shotgun",
+     "PlayType": "RUSH", "RushDirection": "CENTER"},
+    {"GameDate": "2012-01-01", "Description": "Another rush, no injury.", "Formation": "Shotgun",
+     "PlayType": "rush", "RushDirection": "CENTER"},
+    {"GameDate": "2012-01-02", "Description": "Standard pass.", "Formation": "I-Form",
+     "PlayType": "PASS", "PassType": "SHORT RIGHT"},
+    {"GameDate": "2012-01-02", "Description": "Punt.", "Formation": "Punt", "PlayType": "PUNT"},
+    {"GameDate": "2015-01-01", "Description": "Injured player.", "Formation": "Singleback",
+     "PlayType": "PASS", "PassType": "DEEP LEFT"}
+]
+
+def test_parse_game_dates_handles_mixed_formats():
+    frame = plays_frame(MOCK_PLAYS)
+    assert frame["GameDate"].iloc[0] == datetime(2012, 1, 1)
+    assert frame["GameDate"].iloc[1] == datetime(2012, 1, 1)
+
+def test_plays_frame_reads_dictionary_codes():
+    categories = {
+        "Formation": ["Shotgun", "I-Form", "Punt", "Singleback"],
+        "PlayType": ["RUSH", "PASS", "PUNT"],
+        "RushDirection": ["CENTER", "SHORT RIGHT", "DEEP LEFT", "Unknown"],
+        "PassType": ["CENTER", "SHORT RIGHT", "DEEP LEFT", "Unknown"]
+    }
+    encoded = [
+        {"GameDate": 734503, "Description": "Player was INJURED on the play.", "Formation": 0,
+         "PlayType": 0, "RushDirection": 0, "PassType": 3},
+        {"GameDate": 734504, "Description": "Standard pass.", "Formation": 1,
+         "PlayType": 1, "RushDirection": 3, "PassType": 1},
+        {"GameDate": 734504, "Description": "Punt.", "Formation": 2, "PlayType": 2,
+         "RushDirection": 3, "PassType": 3},
+        {"GameDate": 0, "Description": "Injured player.", "Formation": 3,
+         "PlayType": 1, "RushDirection": -1, "PassType": -1}
+    ]
+    frame = plays_frame(encoded, categories)
+
+    assert len(frame) == 3
+    assert frame["GameDate"].iloc[0] == datetime(2012, 1, 1)
+    assert frame["GameDate"].isna().iloc[2]
+    assert list(frame["Direction"]) == ["CENTER", "SHORT RIGHT", "Unknown"]
+    assert injury_partials(frame)["Formation: Shotgun; PlayType: RUSH; Direction: CENTER"] == [1, 1]
+
+def test_injury_flags_match_every_keyword_in_one_pass():
+    descriptions = pd.Series(["Player was INJURED and carted off.", "He was shaken up.", None, "Punt."])
+    flags = injury_flags(descriptions, ["injured", "shaken up", "carted off"])
+    assert list(flags) == [0b101, 0b010, 0, 0]
+    assert keyword_mask(["injured", "shaken up", "carted off"], ["carted off", "injured"]) == 0b101
+
+def test_injury_flags_tag_nested_keywords():
+    descriptions = pd.Series(["Placed on injured reserve.", "Player was injured.", "Reserve QB in."])
+    flags = injury_flags(descriptions, ["injured", "injured reserve"])
+    assert list(flags) == [0b11, 0b01, 0]
+
+def test_injury_flags_tag_overlapping_keywords_in_one_scan():
+    descriptions = pd.Series(["Placed on injured reserve.", "Player was shaken up."])
+    flags = injury_flags(descriptions, ["reserve", "injured reserve", "injured", "shaken up", "ken"])
+    assert list(flags) == [0b00111, 0b11000]
+
+def test_plays_frame_reads_injury_flags():
+    plays = [
+        {"GameDate": "2012-01-01", "Description": "No keyword here.", "InjuryFlags": 0b10,
+         "Formation": "Shotgun", "PlayType": "RUSH", "RushDirection": "CENTER"},
+        {"GameDate": "2012-01-01", "Description": "Player was injured.", "InjuryFlags": 0b01,
+         "Formation": "Shotgun", "PlayType": "RUSH", "RushDirection": "CENTER"}
+    ]
+    assert list(plays_frame(plays, injury_mask=0b10)["Injured"]) == [True, False]
+    assert list(plays_frame(plays)["Injured"]) == [False, True]
+
+def test_parse_analysis_validates_dimensions_and_metrics():
+    assert parse_analysis(["Quarter", "Down"]) == {
+        "group_by": [["Quarter", "Down"]], "metrics": ["plays", "injuries", "injury_rate"]}
+    assert parse_analysis([["OffenseTeam"], []], ["mean_yards"])["group_by"] == [["OffenseTeam"], []]
+    with pytest.raises(ValueError):
+        parse_analysis(["Description"])
+    with pytest.raises(ValueError):
+        parse_analysis(["Quarter"], ["median_yards"])
+
+def test_group_partials_are_additive_across_chunks():
+    plays = [dict(p, Quarter=q, Yards=y, IsTouchdown=t)
+             for p, q, y, t in zip(MOCK_PLAYS, [1, 1, 2, 2, 4], [3, 7, 12, None, 40], [0, 0, 0, 0, 1])]
+    analysis = parse_analysis([["Quarter"], []], ["plays", "injuries", "mean_yards", "touchdown_rate"])
+
+    merged = []
+    for chunk in (plays[:2], plays[2:]):
+        merge_group_partials(merged, group_partials(group_frame(chunk, analysis), analysis))
+    by_quarter, overall = finalize_groups(analysis, merged)
+
+    assert by_quarter["groups"][0] == {"Quarter": 1, "plays": 2, "injuries": 1, "mean_yards": 5.0, "touchdown_rate": 0.0}
+    assert overall["groups"] == [{"plays": 5, "injuries": 2, "mean_yards": 12.4, "touchdown_rate": 20.0}]
+
+def test_plays_frame_keeps_only_rush_and_pass():
+    frame = plays_frame(MOCK_PLAYS)
+    assert len(frame) == 4
+    assert set(frame["PlayType"]) == {"RUSH", "PASS"}
+    assert frame["Direction"].iloc[2] == "SHORT RIGHT"
+
+def test_injury_combo_counts_within_range():
+    frame = plays_frame(MOCK_PLAYS)
+    in_range = frame[date_mask(frame, datetime(2010, 1, 1), datetime(2014, 1, 1))]
+    counts = finalize_combo_counts(injury_partials(in_range))
+
+    key = "Formation: Shotgun; PlayType: RUSH; Direction: CENTER"
+    assert counts[key] == {"injury_plays": 1, "total_plays": 2, "injury_percentage": 50.0}
+    assert "Formation: Singleback; PlayType: PASS; Direction: DEEP LEFT" not in counts
+    assert len(counts) == 2
+
+def test_injury_combo_counts_empty_range():
+    frame = plays_frame(MOCK_PLAYS)
+    in_range = frame[date_mask(frame, datetime(2000, 1, 1), datetime(2000, 1, 2))]
+    assert finalize_combo_counts(injury_partials(in_range)) == {}
+
+def test_day_partials_sum_to_range_partials():
+    frame = plays_frame(MOCK_PLAYS)
+    days = day_partials(frame)
+    assert sorted(days) == [datetime(2012, 1, 1).toordinal(), datetime(2012, 1, 2).toordinal(),
+                            datetime(2015, 1, 1).toordinal()]
+
+    summed = {}
+    for partials in days.values():
+        merge_partials(summed, partials)
+    assert summed == injury_partials(frame)
@@ -25,6 +25,14 @@ def test_get_play_by_id():
     assert res.status_code == 200
     assert "formation" in res.json()
 
+def test_play_ids_are_stable_across_reloads():
+    requests.post(f"{BASE}/data")
+    before = requests.get(f"{BASE}/plays/1")
+    requests.post(f"{BASE}/data")
+    after = requests.get(f"{BASE}/plays/1")
+    assert before.status_code == 200
+    assert after.json() == before.json()
+
 def test_pass_plays():
     res = requests.get(f"{BASE}/plays/pass")
     assert res.status_code == 200
@@ -35,6 +43,29 @@ def test_rush_plays():
     assert res.status_code == 200
     assert isinstance(res.json(), list)
 
+def test_pass_plays_pagination():
+    first = requests.get(f"{BASE}/plays/pass", params={"limit": 5})
+    assert first.status_code == 200
+    assert len(first.json()) <= 5
+    cursor = first.headers.get("X-Next-Cursor")
+    if cursor:
+        second = requests.get(f"{BASE}/plays/pass", params={"limit": 5, "cursor": cursor})
+        assert second.json()[0]["play_id"] > first.json()[-1]["play_id"]
+
+def test_pass_plays_by_season():
+    seasons = requests.get(f"{BASE}/data/meta").json()["partitions"]
+    season = next(iter(seasons))
+    res = requests.get(f"{BASE}/plays/pass", params={"season": season, "limit": 5})
+    assert res.status_code == 200
+    assert all(str(play["SeasonYear"]) == season for play in res.json())
+    assert requests.get(f"{BASE}/plays/pass", params={"season": "1900"}).json() == []
+
+def test_return_data_ndjson():
+    res = requests.get(f"{BASE}/data", params={"format": "ndjson", "limit": 3})
+    assert res.status_code == 200
+    assert res.headers["Content-Type"].startswith("application/x-ndjson")
+    assert len(res.text.splitlines()) == 3
+
 def test_create_job():
     res = requests.post(f"{BASE}/jobs", json={
         "start_date": "2010-01-01",
@@ -45,11 +76,47 @@ def test_create_job():
     global job_id
     job_id = res.json()["job_id"]
 
+def test_create_group_by_job():
+    res = requests.post(f"{BASE}/jobs", json={
+        "start_date": "2024-09-05",
+        "end_date": "2024-09-30",
+        "group_by": [["OffenseTeam"], ["Quarter", "Down"]],
+        "metrics": ["plays", "injury_rate", "mean_yards"]
+    })
+    assert res.status_code == 201
+
+    res = requests.post(f"{BASE}/jobs", json={
+        "start_date": "2024-09-05", "end_date": "2024-09-30", "group_by": ["Description"]
+    })
+    assert res.status_code == 400
+
+def test_create_batch():
+    res = requests.post(f"{BASE}/jobs/batch", json={"ranges": [
+        {"start_date": "2024-09-05", "end_date": "2024-09-30"},
+        {"start_date": "2024-10-01", "end_date": "2024-10-31"}
+    ]})
+    assert res.status_code == 201
+    body = res.json()
+    assert len(body["jobs"]) == 2
+    assert body["jobs"][1]["start_date"] == "2024-10-01"
+
+    res = requests.post(f"{BASE}/jobs/batch", json={"ranges": []})
+    assert res.status_code == 400
+
 def test_job_status():
     res = requests.get(f"{BASE}/jobs/{job_id}")
     assert res.status_code in [200, 202]
     assert "status" in res.json()
 
+def test_job_events_stream():
+    res = requests.get(f"{BASE}/jobs/{job_id}/events", stream=True, timeout=30)
+    assert res.status_code == 200
+    assert res.headers["Content-Type"].startswith("text/event-stream")
+    events = [line.split(": ", 1)[1] for line in res.iter_lines(decode_unicode=True)
+              if line.startswith("event: ")]
+    assert events[0] == "status"
+    assert events[-1] in ("result", "end")
+
 def test_get_job_result():
     time.sleep(3)
     res = requests.get(f"{BASE}/results/{job_id}")
@@ -0,0 +1,32 @@
+import pytest
+import json
+import numpy as np
+from codec import encode, decode, MAGIC, FORMAT_MSGPACK, FORMAT_MSGPACK_ZLIB
+
+def test_round_trip_small_value_is_not_compressed():
+    value = {"play_id": 1, "Formation": "SHOTGUN", "Yards": 4.5, "Challenger": None}
+    raw = encode(value)
+    assert raw[:2] == MAGIC + bytes([FORMAT_MSGPACK])
+    assert decode(raw) == value
+
+def test_round_trip_large_value_is_compressed():
+    value = {"injury_combo_counts": {f"Formation: SHOTGUN; Direction: {i}": {"total_plays": i} for i in range(100)}}
+    raw = encode(value)
+    assert raw[:2] == MAGIC + bytes([FORMAT_MSGPACK_ZLIB])
+    assert len(raw) < len(json.dumps(value))
+    assert decode(raw) == value
+
+def test_decode_reads_legacy_json():
+    value = {"job_id": "abc", "injury_combo_counts": {}}
+    assert decode(json.dumps(value)) == value
+    assert decode(json.dumps(value).encode()) == value
+
+def test_json_codec_writes_plain_json():
+    assert decode(encode([1, "a"], codec="json")) == [1, "a"]
+
+def test_encode_numpy_scalars():
+    assert decode(encode({"GameId": np.int64(2024090800)})) == {"GameId": 2024090800}
+
+def test_decode_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        decode(MAGIC + bytes([99]) + b"payload")
@@ -0,0 +1,337 @@
+import pytest
+import pandas as pd
+import os
+import threading
+import ingest
+from ingest import ingest_csv, append_csv, ensure_snapshot, retag_injuries, LoadInProgress, SELECTED_COLUMNS
+from datetime import date
+from storage import get_play, expand_play, dataset_changed_since, get_partitions, get_injury_tags, register_injury_keywords, category_values, iter_plays, count_plays, delete_plays, get_dataset_version, rollups_ready, sum_rollups, get_dataset_meta, lock_dataset, unlock_dataset, rd
+
+def write_mock_csv(path, n):
+    rows = []
+    for i in range(n):
+        row = {col: 0 for col in SELECTED_COLUMNS if col != "play_id"}
+        row.update({
+            "GameId": 2024090800 + i % 3,
+            "GameDate": "2024-09-08",
+            "Description": "Player was injured on the play." if i % 4 == 0 else None,
+            "Formation": "SHOTGUN",
+            "PlayType": "RUSH" if i % 2 else "PASS",
+            "RushDirection": "CENTER" if i % 2 else None,
+            "PassType": None if i % 2 else "SHORT RIGHT"
+        })
+        rows.append(row)
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+def setup_function(function):
+    delete_plays()
+
+def test_ingest_csv_in_chunks_assigns_sequential_play_ids(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 25)
+
+    stats = ingest_csv(csv_path, chunk_size=10)
+
+    assert stats["rows"] == 25
+    assert stats["chunks"] == 3
+    assert count_plays() == 25
+    assert [p["play_id"] for p in iter_plays()] == list(range(1, 26))
+
+def test_ingest_csv_fills_missing_values(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 4)
+
+    ingest_csv(csv_path, chunk_size=3)
+
+    assert get_play(2)["Description"] == "No description"
+    assert expand_play(get_play(1))["RushDirection"] == "Unknown"
+    assert expand_play(get_play(2))["PassType"] == "Unknown"
+
+def test_ingest_csv_stores_normalized_plays(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 4)
+    df = pd.read_csv(csv_path)
+    df.loc[3, "GameDate"] = "09/09/24"
+    df.loc[3, "PlayType"] = "rush"
+    df.to_csv(csv_path, index=False)
+
+    ingest_csv(csv_path, chunk_size=3)
+
+    play = get_play(4)
+    assert play["GameDate"] == date(2024, 9, 9).toordinal()
+    assert isinstance(play["Formation"], int) and isinstance(play["IsRush"], int)
+    assert category_values("play_type")[play["PlayType"]] == "RUSH"
+    assert get_play(1)["RushDirection"] == get_play(2)["PassType"]  # shared "Unknown" code
+    assert expand_play(play)["GameDate"] == "2024-09-09"
+    assert expand_play(play)["PlayType"] == "RUSH"
+
+def test_ingest_csv_tags_injury_keywords(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 4)
+
+    ingest_csv(csv_path)
+
+    keywords = register_injury_keywords([])
+    assert get_play(1)["InjuryFlags"] == 1 << keywords.index("injured")
+    assert get_play(2)["InjuryFlags"] == 0
+    assert get_injury_tags()["mask"] & get_play(1)["InjuryFlags"]
+
+def test_retag_injuries_after_keywords_change(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 8)
+    df = pd.read_csv(csv_path)
+    df.loc[1, "Description"] = "Runner was hurt badly on the play."
+    df.to_csv(csv_path, index=False)
+    ingest_csv(csv_path)
+    version = get_dataset_version()
+    key = "Formation: SHOTGUN; PlayType: RUSH; Direction: CENTER"
+    assert sum_rollups(date(2024, 9, 8), date(2024, 9, 8))[key] == [4, 0]
+
+    assert retag_injuries(["injured", "hurt badly"]) is True
+    assert sum_rollups(date(2024, 9, 8), date(2024, 9, 8))[key] == [4, 1]
+    assert get_dataset_version() == version + 1
+    assert get_dataset_meta()["version"] == version + 1
+    assert retag_injuries(["injured", "hurt badly"]) is False
+
+    # Dropping a keyword only changes the mask
+    assert retag_injuries(["hurt badly"]) is True
+    assert sum_rollups(date(2024, 9, 8), date(2024, 9, 8))[key] == [4, 1]
+    totals = sum_rollups(date(2024, 9, 8), date(2024, 9, 8))
+    assert totals["Formation: SHOTGUN; PlayType: PASS; Direction: SHORT RIGHT"] == [4, 0]
+
+def test_ingest_csv_rejects_missing_columns(tmp_path):
+    csv_path = tmp_path / "bad.csv"
+    pd.DataFrame([{"GameDate": "2024-09-08"}]).to_csv(csv_path, index=False)
+
+    with pytest.raises(ValueError):
+        ingest_csv(csv_path)
+
+def test_ingest_csv_builds_rollups(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 10)
+
+    ingest_csv(csv_path, chunk_size=4)
+
+    assert rollups_ready()
+    totals = sum_rollups(date(2024, 9, 8), date(2024, 9, 8))
+    assert totals["Formation: SHOTGUN; PlayType: RUSH; Direction: CENTER"] == [5, 0]
+    assert totals["Formation: SHOTGUN; PlayType: PASS; Direction: SHORT RIGHT"] == [5, 3]
+
+def test_ingest_csv_writes_dataset_meta(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 5)
+    df = pd.read_csv(csv_path)
+    df.loc[0, "GameDate"] = "2024-09-05"
+    df.loc[4, "GameDate"] = "2024-12-29"
+    df["SeasonYear"] = [2024, 2024, 2024, 2024, 2025]
+    df.to_csv(csv_path, index=False)
+
+    stats = ingest_csv(csv_path, chunk_size=2)
+
+    meta = get_dataset_meta()
+    assert meta["min_date"] == "2024-09-05"
+    assert meta["max_date"] == "2024-12-29"
+    assert meta["rows"] == 5
+    assert meta["seasons"] == {"2024": 4, "2025": 1}
+    assert meta["version"] == stats["version"]
+    assert meta["loaded_at"]
+
+def test_ingest_csv_loads_season_files_in_parallel(tmp_path):
+    paths = []
+    for season, n in [(2023, 7), (2024, 5)]:
+        path = tmp_path / f"pbp-{season}.csv"
+        write_mock_csv(path, n)
+        df = pd.read_csv(path, dtype=str).assign(SeasonYear=str(season), GameDate=f"{season}-09-10")
+        df.to_csv(path, index=False)
+        paths.append(path)
+
+    stats = ingest_csv(paths, chunk_size=2, workers=2)
+
+    assert (stats["files"], stats["rows"]) == (2, 12)
+    assert [p["play_id"] for p in iter_plays()] == list(range(1, 13))
+    assert [p["SeasonYear"] for p in iter_plays()] == [2023] * 7 + [2024] * 5  # play_ids follow file order
+    assert get_partitions() == {"2023": {"min_date": "2023-09-10", "max_date": "2023-09-10", "rows": 7},
+                                "2024": {"min_date": "2024-09-10", "max_date": "2024-09-10", "rows": 5}}
+    assert get_dataset_meta()["seasons"] == {"2023": 7, "2024": 5}
+    assert not ensure_snapshot(paths)
+
+def test_concurrent_loads_do_not_add_rollups_twice(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 30)
+    outcomes = []
+
+    def load():
+        try:
+            outcomes.append(ingest_csv(csv_path, chunk_size=5)["rows"])
+        except LoadInProgress:
+            outcomes.append("busy")
+
+    threads = [threading.Thread(target=load) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert 30 in outcomes
+    totals = sum_rollups(date(2024, 9, 8), date(2024, 9, 8)).values()
+    assert sum(total for total, _ in totals) == count_plays() == 30
+
+    assert lock_dataset()
+    try:
+        with pytest.raises(LoadInProgress):
+            ingest_csv(csv_path)
+        with pytest.raises(LoadInProgress):
+            append_csv(csv_path)
+    finally:
+        unlock_dataset()
+
+def test_reload_keeps_old_plays_readable_until_published(tmp_path, monkeypatch):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 6)
+    ingest_csv(csv_path)
+    write_mock_csv(csv_path, 9)
+    pd.read_csv(csv_path, dtype=str).assign(Formation="UNDER CENTER").to_csv(csv_path, index=False)
+    seen = {}
+    publish = ingest.publish_staged
+
+    def check_then_publish():
+        seen["rows"] = count_plays()
+        seen["play"] = get_play(1)
+        return publish()
+
+    monkeypatch.setattr(ingest, "publish_staged", check_then_publish)
+    assert ensure_snapshot(csv_path) is True
+
+    assert seen["rows"] == 6 and expand_play(seen["play"])["Formation"] == "SHOTGUN"
+    assert count_plays() == 9
+    assert expand_play(get_play(1))["Formation"] == "UNDER CENTER"
+    assert sorted(p["play_id"] for p in iter_plays()) == list(range(1, 10))
+    assert not rd.keys("staging:*") and not rd.exists("plays:retired")
+    totals = sum_rollups(date(2024, 9, 8), date(2024, 9, 8)).values()
+    assert sum(total for total, _ in totals) == 9
+
+def test_reload_keeps_play_ids_stable(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 9)
+    ingest_csv(csv_path)
+    first = get_play(1)
+    ingest_csv(csv_path)
+    assert get_play(1) == first
+
+    write_mock_csv(csv_path, 6)
+    ingest_csv(csv_path)
+    assert [p["play_id"] for p in iter_plays()] == list(range(1, 7))
+    assert get_play(7) is None
+    assert not rd.keys("staging:*") and not rd.exists("plays:retired")
+
+def test_ensure_snapshot_checks_the_files_that_were_loaded(tmp_path):
+    seasons = [tmp_path / "season-2023.csv", tmp_path / "season-2024.csv"]
+    for path in seasons:
+        write_mock_csv(path, 4)
+    default = tmp_path / "pbp.csv"
+    write_mock_csv(default, 3)
+    ingest_csv(seasons)
+    version = get_dataset_version()
+
+    assert ensure_snapshot(default) is False
+    assert count_plays() == 8
+    assert get_dataset_version() == version
+
+    write_mock_csv(seasons[1], 5)
+    assert ensure_snapshot(default) is True
+    assert count_plays() == 9
+
+def test_ensure_snapshot_keeps_appended_plays_without_a_source(tmp_path):
+    default = tmp_path / "pbp.csv"
+    write_mock_csv(default, 9)
+    week = tmp_path / "week.csv"
+    write_mock_csv(week, 4)
+    append_csv(week)  # after DELETE /data, so no source is recorded
+
+    assert ensure_snapshot(default) is False
+    assert count_plays() == 4
+    assert get_dataset_meta()["rows"] == 4
+
+def test_ensure_snapshot_keeps_current_plays_while_another_load_runs(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 4)
+    ingest_csv(csv_path)
+    write_mock_csv(csv_path, 6)
+
+    assert lock_dataset()
+    try:
+        assert ensure_snapshot(csv_path) is False
+        assert count_plays() == 4
+    finally:
+        unlock_dataset()
+    assert ensure_snapshot(csv_path) is True
+
+def test_append_csv_adds_new_and_replaces_changed_games(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 9)  # three games of three plays on 2024-09-08
+    ingest_csv(csv_path, chunk_size=4)
+    version = get_dataset_version()
+
+    week = pd.read_csv(csv_path, dtype=str)
+    week = week[week["GameId"] != "2024090802"]  # games missing from the file are kept
+    week.loc[week["GameId"] == "2024090801", "Description"] = "Player was injured on the play."
+    new_game = week[week["GameId"] == "2024090800"].assign(GameId="2024091500", GameDate="2024-09-15")
+    pd.concat([week, new_game]).to_csv(tmp_path / "week.csv", index=False)
+
+    stats = append_csv(tmp_path / "week.csv", chunk_size=4)
+
+    assert (stats["games_added"], stats["games_replaced"]) == (1, 1)
+    assert (stats["rows"], stats["rows_removed"]) == (6, 3)
+    assert count_plays() == 12
+    assert get_dataset_meta()["max_date"] == "2024-09-15"
+    assert get_dataset_meta()["rows"] == 12
+    assert stats["version"] == version + 1
+    key = "Formation: SHOTGUN; PlayType: RUSH; Direction: CENTER"
+    assert sum_rollups(date(2024, 9, 8), date(2024, 9, 8))[key] == [4, 2]
+    assert sum_rollups(date(2024, 9, 15), date(2024, 9, 15))[key] == [1, 0]
+
+    # Only results covering the changed days are invalidated
+    assert dataset_changed_since(version, "2024-09-01", "2024-09-10")
+    assert not dataset_changed_since(version, "2024-09-09", "2024-09-14")
+    assert not dataset_changed_since(version, "2024-09-16", "2024-09-30")
+
+    # Appending the same file again changes nothing
+    assert append_csv(tmp_path / "week.csv")["version"] == version + 1
+    assert count_plays() == 12
+
+def test_season_counts_match_partitions_when_season_year_is_missing(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 10)
+    df = pd.read_csv(csv_path, dtype=str).assign(SeasonYear="2024")
+    df.loc[1, "SeasonYear"] = None  # counted in the season of its GameDate
+    df.to_csv(csv_path, index=False)
+    ingest_csv(csv_path, chunk_size=4)
+    assert get_dataset_meta()["seasons"] == {"2024": 10}
+    assert get_partitions()["2024"]["rows"] == 10
+
+    df.loc[df["GameId"] == "2024090801", "Description"] = "Player was shaken up."
+    df.to_csv(tmp_path / "week.csv", index=False)
+    assert append_csv(tmp_path / "week.csv", chunk_size=4)["games_replaced"] == 1
+    assert get_dataset_meta()["seasons"] == {"2024": 10}
+    assert get_partitions()["2024"]["rows"] == 10
+
+def test_ensure_snapshot_only_rebuilds_when_contents_change(tmp_path):
+    csv_path = tmp_path / "pbp.csv"
+    write_mock_csv(csv_path, 6)
+
+    assert ensure_snapshot(csv_path) is True
+    version = get_dataset_version()
+    assert ensure_snapshot(csv_path) is False
+
+    # Touching the file without changing it keeps the snapshot
+    os.utime(csv_path, ns=(0, 0))
+    assert ensure_snapshot(csv_path) is False
+    assert get_dataset_version() == version
+
+    write_mock_csv(csv_path, 8)
+    assert ensure_snapshot(csv_path) is True
+    assert get_dataset_version() == version + 1
+    assert count_plays() == 8
+
+def teardown_module(module):
+    delete_plays()
@@ -1,6 +1,10 @@
 import pytest
+import time
 import uuid
 import json
+import jobs
+from datetime import date
+from storage import bump_dataset_version, CHANGES_KEY
 from jobs import (
     _generate_jid,
     _instantiate_job,
@@ -8,10 +12,35 @@ from jobs import (
     get_job_by_id,
     update_job_status,
     add_job,
+    add_batch,
+    get_job_stats,
+    list_job_ids,
+    job_expired,
+    store_result,
+    get_result,
+    get_result_stats,
+    report_worker,
+    get_worker_stats,
+    publish_event,
+    read_events,
+    add_job_profile,
+    save_job_profile,
+    get_next_task,
+    get_queue_depths,
+    job_priority,
     jdb,
-    q
+    qdb,
+    results_db,
+    count_jobs_by_status,
+    JOB_EXPIRY_KEY,
+    q,
+    hq,
+    sq
 )
 
+def queued_ids(queue):
+    return [queue.serializer.loads(m) for m in qdb.lrange(queue.key, 0, -1)]
+
 def test_generate_jid_format():
     jid = _generate_jid()
     assert isinstance(jid, str)
@@ -59,8 +88,212 @@ def test_add_job_creates_valid_job():
     assert job["end"] == "2014-01-01"
     # Confirm job was saved to DB
     assert isinstance(get_job_by_id(job["id"]), dict)
-    # Confirm job was added to queue
-    assert job["id"] in q.queue
+    # Confirm job was added to the low priority queue (a year is not cheap)
+    assert job["priority"] == "low"
+    assert job["id"] in queued_ids(q)
+
+def test_get_missing_job_returns_none():
+    assert get_job_by_id("test-missing-job") is None
+
+def test_add_job_coalesces_identical_in_flight_job():
+    before = get_job_stats()
+    first = add_job("2011-03-01", "2011-03-31")
+    second = add_job("2011-03-01", "2011-03-31")
+    assert second["id"] == first["id"]
+    assert get_job_stats()["coalesce_hits"] == before["coalesce_hits"] + 1
+
+def test_add_job_reuses_finished_result():
+    first = add_job("2011-04-01", "2011-04-30")
+    update_job_status(first["id"], "complete")
+    results_db.set(first["id"], json.dumps({"job_id": first["id"]}))
+    before = get_job_stats()
+
+    second = add_job("2011-04-01", "2011-04-30")
+    assert second["id"] == first["id"]
+    assert second["status"] == "complete"
+    assert get_job_stats()["reuse_hits"] == before["reuse_hits"] + 1
+    results_db.delete(first["id"])
+
+def test_add_job_does_not_reuse_failed_job():
+    first = add_job("2011-05-01", "2011-05-31")
+    update_job_status(first["id"], "failed")
+    second = add_job("2011-05-01", "2011-05-31")
+    assert second["id"] != first["id"]
+    assert second["status"] == "submitted"
+
+def test_add_job_keys_reuse_on_analysis():
+    analysis = {"group_by": [["Quarter"]], "metrics": ["plays"]}
+    plain = add_job("2011-06-01", "2011-06-30")
+    grouped = add_job("2011-06-01", "2011-06-30", analysis=analysis)
+    assert grouped["id"] != plain["id"]
+    assert grouped["analysis"] == analysis
+    assert add_job("2011-06-01", "2011-06-30", analysis=analysis)["id"] == grouped["id"]
+
+def test_add_job_reuse_only_invalidated_by_overlapping_changes():
+    early = add_job("2011-07-01", "2011-07-31")
+    late = add_job("2011-08-01", "2011-08-31")
+    for job in (early, late):
+        update_job_status(job["id"], "complete")
+        results_db.set(job["id"], json.dumps({"job_id": job["id"]}))
+
+    bump_dataset_version([date(2011, 6, 20).toordinal(), date(2011, 8, 14).toordinal()])
+    assert add_job("2011-07-01", "2011-07-31")["id"] == early["id"]
+    assert add_job("2011-08-01", "2011-08-31")["id"] != late["id"]
+    for job in (early, late):
+        results_db.delete(job["id"])
+
+def test_registering_a_job_prunes_changes_no_live_job_can_see():
+    bump_dataset_version([date(2011, 9, 1).toordinal()])
+    job = add_job("2011-10-01", "2011-10-31")
+    assert jobs.jdb.zscore(jobs.JOB_VERSIONS_KEY, job["id"]) == job["version"]
+    oldest = jobs.jdb.zrange(jobs.JOB_VERSIONS_KEY, 0, 0, withscores=True)[0][1]
+    assert jobs.rd.zrangebyscore(CHANGES_KEY, "-inf", oldest) == []
+
+def test_add_batch_creates_children_and_queues_only_the_batch():
+    existing = add_job("2011-06-01", "2011-06-30")
+    batch, children = add_batch([("2011-06-01", "2011-06-30"), ("2011-06-15", "2011-07-15")])
+
+    assert batch["type"] == "batch"
+    assert batch["start"] == "2011-06-01" and batch["end"] == "2011-07-15"
+    assert children[0]["id"] == existing["id"]
+    assert children[1]["batch"] == batch["id"]
+    assert batch["jobs"] == [existing["id"], children[1]["id"]]
+    assert batch["pending"] == [children[1]["id"]]
+    assert get_job_by_id(batch["id"])["status"] == "submitted"
+
+def test_status_changes_and_progress_are_published_as_events():
+    jid = "test-events-job"
+    _save_job(jid, _instantiate_job(jid, "submitted", "2010-01-01", "2012-01-01"))
+    update_job_status(jid, "in progress")
+    publish_event(jid, "progress", {"percent": 50.0})
+
+    events = read_events(jid)
+    assert [(event, data) for _, event, data in events] == [
+        ("status", {"status": "in progress"}),
+        ("progress", {"percent": 50.0})
+    ]
+    assert read_events(jid, after=events[-1][0]) == []
+
+def test_job_profile_adds_up_and_moves_onto_record():
+    jid = "test-profile-job"
+    _save_job(jid, _instantiate_job(jid, "in progress", "2010-01-01", "2012-01-01"))
+    add_job_profile(jid, {}, started=time.time() - 2)
+    add_job_profile(jid, {"redis": {"seconds": 0.5, "rows": 100}})
+    add_job_profile(jid, {"redis": {"seconds": 0.25, "rows": 50}, "parse": {"seconds": 1.0, "rows": 150}})
+
+    profile = save_job_profile(jid)
+    assert profile["stages"] == {"redis": {"seconds": 0.75, "rows": 150}, "parse": {"seconds": 1.0, "rows": 150}}
+    assert profile["stage_seconds"] == 1.75
+    assert profile["wall_seconds"] >= 2
+    assert get_job_by_id(jid)["profile"] == profile
+
+def test_job_priority_from_span_or_caller():
+    assert job_priority("2024-09-01", "2024-09-07") == "high"
+    assert job_priority("2024-09-01", "2025-01-31") == "low"
+    assert job_priority("2024-09-01", "2025-01-31", "high") == "high"
+    assert job_priority("2024-09-01", "2024-09-07", "low") == "low"
+
+def test_next_task_prefers_high_lane_without_starving_low(monkeypatch):
+    monkeypatch.setattr(jobs, "LANE_STARVATION_LIMIT", 2)
+    for queue in (q, hq, sq):
+        queue.clear()
+    qdb.delete(jobs.HIGH_STREAK_KEY)
+    q.put("test-low-1")
+    hq.put("test-high-1", "test-high-2", "test-high-3")
+    assert get_queue_depths() == {"high": 3, "low": 1, "shards": 0}
+
+    order = [get_next_task(timeout=1)[1] for _ in range(4)]
+    assert order == ["test-high-1", "test-high-2", "test-low-1", "test-high-3"]
+    assert get_next_task(timeout=1) is None
+
+def test_list_job_ids_pages_in_submission_order():
+    since = time.time()
+    created = [add_job(f"2009-0{m}-01", f"2009-0{m}-28")["id"] for m in range(1, 6)]
+
+    first, cursor = list_job_ids(since=since, limit=3)
+    assert first == created[:3]
+    second, cursor = list_job_ids(since=since, limit=3, cursor=cursor)
+    assert second == created[3:]
+    assert cursor is None
+
+def test_list_job_ids_pages_through_jobs_submitted_at_the_same_time(monkeypatch):
+    now = time.time() + 1000
+    monkeypatch.setattr(jobs.time, "time", lambda: now)
+    batch, children = add_batch([(f"2006-0{m}-01", f"2006-0{m}-28") for m in range(1, 6)], priority="high")
+    created = sorted([batch["id"]] + [child["id"] for child in children])
+
+    listed, cursor = list_job_ids(since=now, limit=4)
+    while cursor is not None:
+        page, cursor = list_job_ids(since=now, limit=4, cursor=cursor)
+        listed += page
+    assert listed == created
+
+def test_list_job_ids_filters_by_status():
+    since = time.time()
+    job = add_job("2008-01-01", "2008-01-31")
+    update_job_status(job["id"], "complete")
+    assert job["id"] in list_job_ids(status="complete", since=since)[0]
+    assert job["id"] not in list_job_ids(status="submitted", since=since)[0]
+
+def test_finished_jobs_get_a_ttl():
+    jid = "test-ttl-job"
+    _save_job(jid, _instantiate_job(jid, "submitted", "2010-01-01", "2010-02-01"))
+    assert jdb.ttl(jid) == -1
+    update_job_status(jid, "complete")
+    assert 0 < jdb.ttl(jid) <= jobs.JOB_TTLS["complete"]
+
+def test_expired_job_is_recognised():
+    job = add_job("2007-01-01", "2007-01-31")
+    assert not job_expired(job["id"])
+    jdb.delete(job["id"])
+    assert job_expired(job["id"])
+    assert not job_expired("test-never-submitted")
+
+def test_expired_jobs_are_not_listed_or_counted():
+    job = add_job("2007-02-01", "2007-02-28")
+    update_job_status(job["id"], "complete")
+    since = jdb.zscore("jobs:by_time", job["id"]) - 1
+    before = count_jobs_by_status()["complete"]
+    jdb.delete(job["id"])  # as if its TTL had run out
+    jdb.zadd(JOB_EXPIRY_KEY, {job["id"]: 0})
+
+    assert job["id"] not in list_job_ids(status="complete", since=since)[0]
+    assert job["id"] not in list_job_ids(since=since)[0]
+    assert count_jobs_by_status()["complete"] == before - 1
+    assert job_expired(job["id"])
+
+def test_result_stats_leave_stored_results_alone(monkeypatch):
+    store_result("test-result-stats", b"s" * 10)
+    monkeypatch.setattr(jobs, "RESULTS_MAX_BYTES", 0)
+    before = get_result_stats()
+    assert get_result_stats() == before
+    assert results_db.exists("test-result-stats")
+    jobs._forget_result("test-result-stats")
+
+def test_results_are_evicted_least_recently_read_first(monkeypatch):
+    monkeypatch.setattr(jobs, "RESULTS_MAX_BYTES", get_result_stats()["bytes_held"] + 250)
+    before = get_result_stats()["evictions"]
+
+    store_result("test-result-a", b"a" * 100)
+    store_result("test-result-b", b"b" * 100)
+    time.sleep(0.01)
+    assert get_result("test-result-a") == b"a" * 100  # a is now more recent than b
+    store_result("test-result-c", b"c" * 100)
+
+    assert get_result("test-result-b") is None
+    assert get_result("test-result-a") is not None
+    assert get_result_stats()["evictions"] == before + 1
+
+def test_worker_reports_are_listed_until_stale(monkeypatch):
+    report_worker("test-worker-a", {"state": "running", "concurrency": 4, "utilization": 0.5})
+    report = [w for w in get_worker_stats() if w["worker_id"] == "test-worker-a"][0]
+    assert report["concurrency"] == 4
+    assert report["utilization"] == 0.5
+    assert report["state"] == "running"
+
+    monkeypatch.setattr(jobs, "WORKER_STALE_AFTER", 0)
+    time.sleep(0.01)
+    assert all(w["worker_id"] != "test-worker-a" for w in get_worker_stats())
 
 def teardown_module(module):
     """Cleanup test jobs from Redis DBs and queue"""
@@ -68,8 +301,8 @@ def teardown_module(module):
     for k in keys:
         jdb.delete(k)
 
-    # Remove any test job IDs from the queue
-    test_ids = [b.decode() if isinstance(b, bytes) else b for b in q.queue]
-    for jid in test_ids:
-        if jid.startswith("test-"):
-            q.queue.remove(jid)
+    # Remove any test job IDs from the queues
+    for queue in (q, hq):
+        for raw in qdb.lrange(queue.key, 0, -1):
+            if queue.serializer.loads(raw).startswith("test-"):
+                qdb.lrem(queue.key, 0, raw)
@@ -0,0 +1,85 @@
+import pytest
+import metrics
+from metrics import (
+    observe_request,
+    observe_shared,
+    request_metrics,
+    shared_metrics,
+    family,
+    render,
+    mdb,
+    SHARED_HISTOGRAMS_KEY
+)
+
+def setup_function(function):
+    for key in mdb.smembers(SHARED_HISTOGRAMS_KEY):
+        mdb.delete(key)
+    mdb.delete(SHARED_HISTOGRAMS_KEY)
+    metrics._request_counts.clear()
+    metrics._request_latency.clear()
+
+def test_request_histogram_buckets_are_cumulative():
+    observe_request("GET", "/jobs/<jobid>", 200, 0.003)
+    observe_request("GET", "/jobs/<jobid>", 200, 0.2)
+    observe_request("GET", "/jobs/<jobid>", 404, 20.0)
+    lines = request_metrics()
+
+    assert 'nfl_http_requests_total{method="GET",route="/jobs/<jobid>",status="200"} 2' in lines
+    assert 'nfl_http_requests_total{method="GET",route="/jobs/<jobid>",status="404"} 1' in lines
+    assert 'nfl_http_request_duration_seconds_bucket{method="GET",route="/jobs/<jobid>",le="0.005"} 1' in lines
+    assert 'nfl_http_request_duration_seconds_bucket{method="GET",route="/jobs/<jobid>",le="0.25"} 2' in lines
+    assert 'nfl_http_request_duration_seconds_bucket{method="GET",route="/jobs/<jobid>",le="10.0"} 2' in lines
+    assert 'nfl_http_request_duration_seconds_bucket{method="GET",route="/jobs/<jobid>",le="+Inf"} 3' in lines
+    assert 'nfl_http_request_duration_seconds_count{method="GET",route="/jobs/<jobid>"} 3' in lines
+
+def test_shared_histograms_aggregate_across_observers():
+    observe_shared("task_run_seconds", 0.3, kind="job")
+    observe_shared("task_run_seconds", 2.0, kind="job")
+    observe_shared("task_run_seconds", 0.01, kind="shard")
+    lines = shared_metrics()
+
+    assert "# TYPE nfl_task_run_seconds histogram" in lines
+    assert 'nfl_task_run_seconds_bucket{kind="job",le="0.25"} 0' in lines
+    assert 'nfl_task_run_seconds_bucket{kind="job",le="2.5"} 2' in lines
+    assert 'nfl_task_run_seconds_sum{kind="job"} 2.3' in lines
+    assert 'nfl_task_run_seconds_count{kind="shard"} 1' in lines
+
+def test_family_escapes_label_values():
+    text = render(family("jobs", "gauge", "Jobs by status.", [({"status": 'in "progress"'}, 2)]))
+    assert text == '# HELP nfl_jobs Jobs by status.\n# TYPE nfl_jobs gauge\nnfl_jobs{status="in \\"progress\\""} 2\n'
+
+class CountingRedis:
+    """A Redis double that counts the sampling calls made by redis_metrics."""
+
+    def __init__(self):
+        self.sampled = 0
+
+    def ping(self):
+        return True
+
+    def dbsize(self):
+        return 50
+
+    def randomkey(self):
+        self.sampled += 1
+        return b"play:1"
+
+    def memory_usage(self, key):
+        return 100
+
+    def info(self, section):
+        if section == "commandstats":
+            return {"cmdstat_get": {"calls": 4, "usec": 20, "usec_per_call": 5.0}}
+        return {"used_memory": 1024}
+
+def test_redis_metrics_report_command_stats_and_sample_memory_once(monkeypatch):
+    monkeypatch.setattr(metrics, "_memory_samples", {})
+    client = CountingRedis()
+    lines = metrics.redis_metrics({0: client})
+    assert 'nfl_redis_commands_total{command="get"} 4' in lines
+    assert 'nfl_redis_command_seconds_total{command="get"} 2e-05' in lines
+    assert 'nfl_redis_db_bytes{db="0"} 5000' in lines
+
+    sampled = client.sampled
+    assert 'nfl_redis_db_bytes{db="0"} 5000' in metrics.redis_metrics({0: client})
+    assert client.sampled == sampled  # the next scrape reuses the sample
@@ -0,0 +1,177 @@
+import pytest
+import json
+from datetime import date
+from storage import (
+    rd,
+    PLAY_INDEX_KEY,
+    date_ordinal,
+    save_rollups,
+    sum_rollups,
+    rollups_ready,
+    mark_rollups_ready,
+    iter_plays_in_range,
+    iter_play_id_pages,
+    has_plays_after,
+    save_plays,
+    get_play,
+    get_plays,
+    iter_plays,
+    count_plays,
+    count_plays_in_range,
+    get_partitions,
+    partitions_in_range,
+    get_dataset_version,
+    bump_dataset_version,
+    dataset_changed_since,
+    prune_dataset_changes,
+    CHANGES_KEY,
+    delete_plays
+)
+
+def make_plays(n):
+    return [
+        {
+            "play_id": i,
+            "GameDate": "2024-09-08",
+            "Formation": "SHOTGUN",
+            "PlayType": "PASS",
+            "Description": f"Play number {i}."
+        }
+        for i in range(1, n + 1)
+    ]
+
+def setup_function(function):
+    delete_plays()
+
+def test_save_and_get_play():
+    save_plays(make_plays(3))
+    play = get_play(2)
+    assert play["play_id"] == 2
+    assert play["Description"] == "Play number 2."
+    assert get_play("2") == play
+
+def test_get_missing_play_returns_none():
+    save_plays(make_plays(1))
+    assert get_play(99) is None
+
+def test_get_plays_keeps_requested_order():
+    save_plays(make_plays(5))
+    plays = get_plays([4, 1, 3])
+    assert [p["play_id"] for p in plays] == [4, 1, 3]
+
+def test_iter_plays_is_ordered_across_batches():
+    save_plays(make_plays(25), batch_size=7)
+    plays = list(iter_plays(batch_size=10))
+    assert [p["play_id"] for p in plays] == list(range(1, 26))
+    assert count_plays() == 25
+
+def test_delete_plays_removes_records_and_index():
+    save_plays(make_plays(4))
+    assert delete_plays() == 4
+    assert count_plays() == 0
+    assert get_play(1) is None
+
+def test_date_ordinal_parses_iso_and_other_formats():
+    assert date_ordinal("2024-09-08") == date(2024, 9, 8).toordinal()
+    assert date_ordinal("01/01/12") == date(2012, 1, 1).toordinal()
+    assert date_ordinal("not a date") is None
+    assert date_ordinal(None) is None
+
+def test_iter_plays_in_range_uses_date_index():
+    plays = make_plays(6)
+    for play in plays:
+        play["GameDate"] = f"2024-09-0{play['play_id']}"
+    save_plays(plays)
+
+    in_range = list(iter_plays_in_range(date(2024, 9, 2), date(2024, 9, 4), batch_size=2))
+    assert [p["play_id"] for p in in_range] == [2, 3, 4]
+    assert list(iter_plays_in_range(date(2023, 1, 1), date(2023, 12, 31))) == []
+
+def test_plays_are_partitioned_by_season_with_manifest():
+    plays = make_plays(6)
+    for play, (season, game_date) in zip(plays, [(2023, "2023-09-10"), (2023, "2024-01-07"), (2024, "2024-09-05"),
+                                                (2024, "2024-09-08"), (2024, "2025-01-05"), (None, "2024-12-01")]):
+        play.update({"SeasonYear": season, "GameDate": game_date})
+    save_plays(plays)
+
+    assert get_partitions() == {
+        "2023": {"min_date": "2023-09-10", "max_date": "2024-01-07", "rows": 2},
+        "2024": {"min_date": "2024-09-05", "max_date": "2025-01-05", "rows": 4}
+    }
+    low, high = date(2024, 9, 1).toordinal(), date(2024, 12, 31).toordinal()
+    assert partitions_in_range(low, high) == ["2024"]
+    assert partitions_in_range(date(2023, 12, 1).toordinal(), high) == ["2023", "2024"]
+    assert [p["play_id"] for p in iter_plays_in_range(date(2024, 1, 1), date(2024, 12, 31))] == [2, 3, 4, 6]
+    assert count_plays_in_range(date(2024, 1, 1), date(2024, 12, 31)) == 4
+
+def test_iter_play_id_pages_by_season_and_play_type():
+    plays = make_plays(6)
+    for play in plays:
+        play["SeasonYear"] = 2023 if play["play_id"] <= 3 else 2024
+    plays[4]["PlayType"] = "RUSH"
+    save_plays(plays)
+    assert [pid for page in iter_play_id_pages(season="2024") for pid in page] == [4, 5, 6]
+    assert list(iter_play_id_pages(play_type="PASS", season="2024", limit=2, batch_size=1)) == [[4], [6]]
+    assert not has_plays_after(4, "RUSH", "2023")
+    assert has_plays_after(4, "PASS", "2024")
+
+def test_sum_rollups_adds_days_in_range():
+    day = date(2024, 9, 8).toordinal()
+    save_rollups({day: {"combo-a": [3, 1]}, day + 1: {"combo-a": [2, 0], "combo-b": [1, 1]}})
+    save_rollups({day: {"combo-a": [1, 1]}})
+
+    assert sum_rollups(date(2024, 9, 8), date(2024, 9, 9)) == {"combo-a": [6, 2], "combo-b": [1, 1]}
+    assert sum_rollups(date(2024, 9, 9), date(2024, 9, 30)) == {"combo-a": [2, 0], "combo-b": [1, 1]}
+    assert sum_rollups(date(2024, 10, 1), date(2024, 10, 2)) == {}
+
+def test_delete_plays_clears_rollups():
+    mark_rollups_ready()
+    save_rollups({date(2024, 9, 8).toordinal(): {"combo-a": [1, 0]}})
+    delete_plays()
+    assert not rollups_ready()
+    assert sum_rollups(date(2024, 1, 1), date(2024, 12, 31)) == {}
+
+def test_dataset_changes_are_recorded_per_run_of_days():
+    version = get_dataset_version()
+    days = [date(2011, 9, 8).toordinal(), date(2011, 9, 9).toordinal(), date(2012, 2, 5).toordinal()]
+    bumped = bump_dataset_version(days)
+    assert rd.zcard(CHANGES_KEY) == 3  # the reset from delete_plays and two runs
+    assert dataset_changed_since(version, "2011-09-09", "2011-09-30")
+    assert dataset_changed_since(version, "2012-02-01", "2012-02-10")
+    assert not dataset_changed_since(version, "2011-12-01", "2011-12-31")
+
+    prune_dataset_changes(bumped)
+    assert rd.zcard(CHANGES_KEY) == 0
+    assert not dataset_changed_since(version, "2011-09-09", "2011-09-30")
+
+def test_delete_plays_resets_the_change_log():
+    version = get_dataset_version()
+    bump_dataset_version([date(2024, 9, 8).toordinal()])
+    delete_plays()
+    assert rd.zcard(CHANGES_KEY) == 1
+    assert dataset_changed_since(version, "2030-01-01", "2030-01-31")
+
+def test_iter_play_id_pages_resumes_after_cursor():
+    save_plays(make_plays(10))
+    pages = list(iter_play_id_pages(after=3, limit=5, batch_size=2))
+    assert pages == [[4, 5], [6, 7], [8]]
+    assert has_plays_after(8)
+    assert not has_plays_after(10)
+
+def test_iter_play_id_pages_by_play_type():
+    plays = make_plays(6)
+    for play in plays[::2]:
+        play["PlayType"] = "RUSH"
+    save_plays(plays)
+    assert [pid for page in iter_play_id_pages(play_type="RUSH") for pid in page] == [1, 3, 5]
+    assert [pid for page in iter_play_id_pages(after=2, play_type="PASS") for pid in page] == [4, 6]
+
+def test_get_play_reads_legacy_json_record():
+    legacy = {"play_id": 7, "Formation": "SHOTGUN"}
+    rd.set("play:7", json.dumps(legacy))
+    rd.zadd(PLAY_INDEX_KEY, {"7": 7})
+    assert get_play(7) == legacy
+    assert list(iter_plays()) == [legacy]
+
+def teardown_module(module):
+    delete_plays()
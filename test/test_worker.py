@@ -1,8 +1,13 @@
 import pytest
 import json
+import time
+import threading
 from datetime import datetime
-from worker import run_worker_job_logic, rd, jdb, results_db
-from jobs import _instantiate_job, _save_job
+import worker
+from worker import run_worker_job_logic, run_shard, _shard_ranges, _merge_ranges
+from jobs import _instantiate_job, _save_job, _queue_job, get_worker_stats, read_events, hq, sq, jdb, results_db
+from storage import save_plays, delete_plays
+from codec import decode
 
 def setup_mock_nfl_data(job_id: str, start: str, end: str):
     # Setup job in Redis
@@ -12,6 +17,7 @@ def setup_mock_nfl_data(job_id: str, start: str, end: str):
     # Sample mock NFL data covering various formations/play types and some with "injured"
     mock_nfl_data = [
         {
+            "play_id": 1,
             "GameDate": "01/01/12",
             "Description": "Player was injured on the play.",
             "Formation": "Shotgun",
@@ -19,6 +25,7 @@ def setup_mock_nfl_data(job_id: str, start: str, end: str):
             "RushDirection": "CENTER"
         },
         {
+            "play_id": 2,
             "GameDate": "01/01/12",
             "Description": "Standard pass.",
             "Formation": "I-Form",
@@ -26,6 +33,7 @@ def setup_mock_nfl_data(job_id: str, start: str, end: str):
             "PassType": "SHORT RIGHT"
         },
         {
+            "play_id": 3,
             "GameDate": "01/01/12",
             "Description": "Another rush, no injury.",
             "Formation": "Shotgun",
@@ -33,6 +41,7 @@ def setup_mock_nfl_data(job_id: str, start: str, end: str):
             "RushDirection": "CENTER"
         },
         {
+            "play_id": 4,
             "GameDate": "01/01/15",  # outside date range
             "Description": "Injured player.",
             "Formation": "Singleback",
@@ -40,7 +49,8 @@ def setup_mock_nfl_data(job_id: str, start: str, end: str):
             "PassType": "DEEP LEFT"
         }
     ]
-    rd.set("nfl_data", json.dumps(mock_nfl_data))
+    delete_plays()
+    save_plays(mock_nfl_data)
 
 @pytest.mark.integration
 def test_run_worker_job_logic_creates_results_and_updates_status():
@@ -57,7 +67,7 @@ def test_run_worker_job_logic_creates_results_and_updates_status():
     result = results_db.get(job_id)
     assert result is not None
 
-    result_dict = json.loads(result)
+    result_dict = decode(result)
     assert result_dict["job_id"] == job_id
     assert result_dict["start_date"] == "2010-01-01"
     assert result_dict["end_date"] == "2014-01-01"
@@ -67,8 +77,168 @@ def test_run_worker_job_logic_creates_results_and_updates_status():
     assert isinstance(counts, dict)
 
     # Check one of the known keys
-    key = "Formation: Shotgun; PlayType: RUSH; Direction: LEFT"
+    key = "Formation: Shotgun; PlayType: RUSH; Direction: CENTER"
     assert key in counts
     assert counts[key]["total_plays"] == 2
     assert counts[key]["injury_plays"] == 1
     assert counts[key]["injury_percentage"] == 50.0
+
+@pytest.mark.integration
+def test_scan_publishes_progress_events(monkeypatch):
+    job_id = "test-nfl-job-006"
+    setup_mock_nfl_data(job_id, "2010-01-01", "2016-01-01")
+    monkeypatch.setattr(worker, "PROGRESS_ROWS", 2)
+
+    run_worker_job_logic(job_id)
+
+    events = [(event, data) for _, event, data in read_events(job_id)]
+    progress = [data for event, data in events if event == "progress"]
+    assert [p["rows_processed"] for p in progress] == [2, 4]
+    assert progress[-1]["percent"] == 100.0
+    assert progress[0]["partial_counts"]
+    assert events[-1] == ("status", {"status": "complete"})
+
+@pytest.mark.integration
+def test_job_records_stage_profile():
+    job_id = "test-nfl-job-007"
+    setup_mock_nfl_data(job_id, "2010-01-01", "2016-01-01")
+
+    run_worker_job_logic(job_id)
+
+    profile = json.loads(jdb.get(job_id))["profile"]
+    assert {"plan", "redis", "decode", "parse", "aggregate", "finalize", "store"} <= set(profile["stages"])
+    assert profile["stages"]["redis"]["rows"] == 4
+    assert profile["stages"]["aggregate"]["rows"] == 4
+    assert profile["wall_seconds"] >= profile["stage_seconds"] > 0
+
+def test_shard_ranges_cover_range_without_overlap():
+    ranges = _shard_ranges(datetime(2024, 9, 1), datetime(2024, 9, 10), 3)
+    assert ranges == [("2024-09-01", "2024-09-03"), ("2024-09-04", "2024-09-06"), ("2024-09-07", "2024-09-10")]
+    assert _shard_ranges(datetime(2024, 9, 1), datetime(2024, 9, 1), 4) == [("2024-09-01", "2024-09-01")]
+
+@pytest.mark.integration
+def test_large_job_fans_out_and_merges_shards(monkeypatch):
+    job_id = "test-nfl-job-002"
+    setup_mock_nfl_data(job_id, "2010-01-01", "2016-01-01")
+    monkeypatch.setattr(worker, "SHARD_SIZE", 2)
+
+    run_worker_job_logic(job_id)
+    assert json.loads(jdb.get(job_id))["status"] == "in progress"
+
+    while True:
+        task = sq.get()
+        if task is None:
+            break
+        run_shard(task)
+
+    assert json.loads(jdb.get(job_id))["status"] == "complete"
+    counts = decode(results_db.get(job_id))["injury_combo_counts"]
+    assert counts["Formation: Shotgun; PlayType: RUSH; Direction: CENTER"]["total_plays"] == 2
+    assert counts["Formation: Singleback; PlayType: PASS; Direction: DEEP LEFT"]["injury_plays"] == 1
+
+@pytest.mark.integration
+def test_failed_shard_fails_the_job_and_leaves_no_shard_keys(monkeypatch):
+    job_id = "test-nfl-job-006"
+    setup_mock_nfl_data(job_id, "2010-01-01", "2016-01-01")
+    monkeypatch.setattr(worker, "SHARD_SIZE", 2)
+    run_worker_job_logic(job_id)
+    assert jdb.ttl(f"shards:{job_id}") > 0
+
+    scan = worker._scan_partials
+    scanned = []
+
+    def fail_first_shard(start, end, **kwargs):
+        scanned.append(start)
+        if len(scanned) == 1:
+            raise RuntimeError("shard failed")
+        return scan(start, end, **kwargs)
+
+    monkeypatch.setattr(worker, "_scan_partials", fail_first_shard)
+    while True:
+        task = sq.get()
+        if task is None:
+            break
+        run_shard(task)
+
+    assert json.loads(jdb.get(job_id))["status"] == "failed"
+    assert len(scanned) == 1  # the other shards were skipped
+    assert not jdb.keys(f"shards:{job_id}*")
+
+@pytest.mark.integration
+def test_group_by_job_computes_every_grouping_across_shards(monkeypatch):
+    job_id = "test-nfl-job-005"
+    setup_mock_nfl_data(job_id, "2010-01-01", "2016-01-01")
+    job = json.loads(jdb.get(job_id))
+    job["analysis"] = {"group_by": [["Formation"], ["PlayType", "Direction"]], "metrics": ["plays", "injury_rate"]}
+    _save_job(job_id, job)
+    monkeypatch.setattr(worker, "SHARD_SIZE", 2)
+
+    run_worker_job_logic(job_id)
+    while True:
+        task = sq.get()
+        if task is None:
+            break
+        run_shard(task)
+
+    result = decode(results_db.get(job_id))
+    by_formation, by_direction = result["aggregations"]
+    assert by_formation["group_by"] == ["Formation"]
+    assert by_formation["groups"][0] == {"Formation": "Shotgun", "plays": 2, "injury_rate": 50.0}
+    assert {"PlayType": "PASS", "Direction": "DEEP LEFT", "plays": 1, "injury_rate": 100.0} in by_direction["groups"]
+
+def test_merge_ranges_joins_overlapping_and_adjacent_ranges():
+    ranges = [(datetime(2024, 9, 10), datetime(2024, 9, 12)), (datetime(2024, 9, 1), datetime(2024, 9, 5)),
+              (datetime(2024, 9, 6), datetime(2024, 9, 7)), (datetime(2024, 9, 11), datetime(2024, 9, 20))]
+    assert _merge_ranges(ranges) == [(datetime(2024, 9, 1), datetime(2024, 9, 7)),
+                                     (datetime(2024, 9, 10), datetime(2024, 9, 20))]
+
+@pytest.mark.integration
+def test_batch_computes_every_range_in_one_pass():
+    setup_mock_nfl_data("test-nfl-job-003", "2010-01-01", "2016-01-01")
+    for jid, start, end in [("test-nfl-batch-a", "2010-01-01", "2014-01-01"),
+                            ("test-nfl-batch-b", "2012-06-01", "2016-01-01")]:
+        child = _instantiate_job(jid, "submitted", start, end)
+        child["batch"] = "test-nfl-batch"
+        _save_job(jid, child)
+    batch = _instantiate_job("test-nfl-batch", "submitted", "2010-01-01", "2016-01-01")
+    batch.update({"type": "batch", "jobs": ["test-nfl-batch-a", "test-nfl-batch-b"],
+                  "pending": ["test-nfl-batch-a", "test-nfl-batch-b"]})
+    _save_job("test-nfl-batch", batch)
+
+    run_worker_job_logic("test-nfl-batch")
+
+    assert json.loads(jdb.get("test-nfl-batch"))["status"] == "complete"
+    first = decode(results_db.get("test-nfl-batch-a"))["injury_combo_counts"]
+    second = decode(results_db.get("test-nfl-batch-b"))["injury_combo_counts"]
+    assert first["Formation: Shotgun; PlayType: RUSH; Direction: CENTER"]["total_plays"] == 2
+    assert "Formation: Singleback; PlayType: PASS; Direction: DEEP LEFT" not in first
+    assert list(second) == ["Formation: Singleback; PlayType: PASS; Direction: DEEP LEFT"]
+
+@pytest.mark.integration
+def test_worker_pool_runs_queued_jobs_and_drains():
+    setup_mock_nfl_data("test-nfl-job-004", "2010-01-01", "2014-01-01")
+    _save_job("test-nfl-job-005", _instantiate_job("test-nfl-job-005", "submitted", "2014-01-02", "2016-01-01"))
+    hq.clear()
+    sq.clear()
+    _queue_job("test-nfl-job-004")
+    _queue_job("test-nfl-job-005")
+
+    pool = threading.Thread(target=worker.do_work, kwargs={"concurrency": 2, "prefetch": 1})
+    pool.start()
+    try:
+        deadline = time.time() + 10
+        while time.time() < deadline and any(json.loads(jdb.get(j))["status"] != "complete"
+                                             for j in ("test-nfl-job-004", "test-nfl-job-005")):
+            time.sleep(0.05)
+    finally:
+        worker._draining.set()
+        pool.join(timeout=10)
+        worker._draining.clear()
+
+    assert not pool.is_alive()
+    assert json.loads(jdb.get("test-nfl-job-005"))["status"] == "complete"
+    report = [w for w in get_worker_stats() if w["worker_id"] == worker.WORKER_ID][0]
+    assert report["state"] == "stopped"
+    assert report["concurrency"] == 2
+    assert report["tasks_done"] == 2
+    assert 0 <= report["utilization"] <= 1